@@ -1,32 +1,72 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file
-import sqlite3
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file, Response, g
 from datetime import datetime, timedelta, time, timezone
 import os
 import json
 import paho.mqtt.client as mqtt
-import matplotlib
-matplotlib.use('Agg')  # Backend sin GUI
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-import io
-import base64
-import numpy as np
-from statistics import mean, stdev
-import serial
 import time
+import atexit
+import importlib
+import threading
 from config import (
     DATABASE,
     MQTT_BROKER,
     MQTT_PORT,
     MQTT_TOPIC_SENDER,
     MQTT_TOPIC_CATCHER,
-    CAMERA_DEFAULT_URL
+    CAMERA_DEFAULT_URL,
+    INGEST_QUEUE_MAX,
+    INGEST_BATCH_SIZE,
+    INGEST_FLUSH_INTERVAL,
+    INGEST_WRITE_RETRIES,
+    INGEST_RETRY_BACKOFF,
+    MAX_SENSOR_RECORDS,
+    SENSOR_TTL_HOURS,
+    RETENTION_INTERVAL,
+    RETENTION_HIGH_WATER,
+    SSE_CLIENT_BUFFER,
+    SSE_HEARTBEAT,
+    REPORT_WORKERS,
+    REPORT_CACHE_DIR,
+    REPORT_CACHE_MAX_MB,
+    REPORT_CACHE_TTL,
+    REPORT_SYNC_TIMEOUT,
+    WARMUP_DELAY,
+    MQTT_COMMAND_TIMEOUT,
+    MQTT_COMMAND_HISTORY,
+    HTTP_CACHE_TTL,
+    HTTP_COMPRESS_MIN_BYTES,
+    BULK_INGEST_MAX_ROWS,
+    BULK_INGEST_MAX_MB,
+    INGEST_MODE,
+    INGEST_IPC_HOST,
+    INGEST_IPC_PORT,
+    INGEST_IPC_AUTHKEY,
+    SERIAL_PORT,
+    SERIAL_BAUD_RATE,
+    SERIAL_ACK_TIMEOUT,
+    SERIAL_ACK_WAIT,
+    SERIAL_ASPERSOR_ID,
+    SCHEDULE_EVENT,
+    SCHEDULE_MISFIRE_GRACE
 )
+from db import get_db_connection, get_pool
+from migrations import run_migrations
+from ingest_queue import SensorWriteQueue, SENSOR_TABLE_COLUMNS, db_timestamp
+from retention import RetentionEngine
+from pubsub import SensorBroadcaster, format_sse
+from rollups import RollupAggregator, delete_rollups_for_table
+from report_jobs import ReportJobManager, report_filename
+from serial_link import SerialTransport, ESTADO_RECHAZADO
+from schedule_executor import ScheduleExecutor, ACCION_INICIO
+from command_dispatcher import CommandDispatcher
+from device_routing import DeviceRegistry, device_topic, parse_sender_topic, sender_topic_filter
+from latest_store import LatestValueStore, SENSOR_FIELDS
+from sensor_frames import BINARY_SUFFIX, FrameError, decode_frame, split_binary_topic
+from live_ipc import LiveUpdateClient, LiveUpdateServer
+from http_cache import ResponseCache, TableWatermarks
+import sensor_export
+import metrics
+from logs import SAMPLED, get_logger, setup_logging
 
 app = Flask(__name__)
 app.secret_key = 'secret_key'
@@ -42,6 +82,32 @@ app.config['DEBUG'] = DEBUG_MODE
 # Evita colisiones de client_id cuando existe otro servicio escuchando en el broker
 MQTT_CLIENT_ID = f"irrigation_webapp_{os.getpid()}"
 
+# Logs estructurados con escritura en segundo plano (nivel y formato en config.py)
+setup_logging()
+log = get_logger('web')
+mqtt_log = get_logger('mqtt')
+
+# Métricas de los caminos calientes (exposición en /metrics)
+MQTT_MESSAGES = metrics.counter(
+    'aquazen_mqtt_messages_total', 'Lecturas MQTT recibidas por sensor y formato', ('sensor', 'format')
+)
+MQTT_DECODE_ERRORS = metrics.counter(
+    'aquazen_mqtt_decode_errors_total', 'Mensajes MQTT descartados por formato o dispositivo', ('format', 'reason')
+)
+HTTP_SECONDS = metrics.histogram(
+    'aquazen_http_request_seconds', 'Duración de las peticiones HTTP por ruta', ('route', 'method', 'status')
+)
+
+# Fan-out de actualizaciones MQTT hacia los clientes de /stream/sensors
+sensor_broadcaster = SensorBroadcaster(buffer_size=SSE_CLIENT_BUFFER)
+
+# Comandos hacia AquaZen/catcher: se publican sin esperar y el PUBACK se sigue aparte
+catcher_dispatcher = CommandDispatcher(
+    MQTT_TOPIC_CATCHER,
+    ack_timeout=MQTT_COMMAND_TIMEOUT,
+    max_commands=MQTT_COMMAND_HISTORY
+)
+
 # Context processor global: variables de usuario + configuración cámara
 @app.context_processor
 def inject_user_context():
@@ -53,45 +119,8 @@ def inject_user_context():
 
 # Configuración centralizada en config.py (DATABASE, MQTT, CAMERA_DEFAULT_URL)
 
-# Cache en memoria del último mensaje recibido del broker
-latest_sensor_data = {
-    "ultrasonico": {
-        "distancia_cm": None,
-        "timestamp": None
-    },
-    "liquido": {
-        "nivel_pct": None,
-        "raw": None,
-        "timestamp": None
-    },
-    "tds": {
-        "ppm": None,
-        "raw": None,
-        "calidad": None,
-        "timestamp": None
-    },
-    "sistema": {
-        "estado": None,
-        "bomba6": None,
-        "bomba7": None,
-        "servo_pos": None,
-        "eventos_activos": None,
-        "timestamp": None
-    },
-    "timestamp": None
-}
-
-MAX_SENSOR_RECORDS = 100
-
-# Función para conectar a la base de datos
-def get_db_connection():
-    try:
-        connection = sqlite3.connect(DATABASE)
-        connection.row_factory = sqlite3.Row  # Para acceder a columnas por nombre
-        return connection
-    except Exception as e:
-        print(f"Error al conectar a la base de datos: {e}")
-        return None
+# Último valor de cada sensor por pecera (snapshots inmutables con versión)
+latest_store = LatestValueStore()
 
 # Función para inicializar la base de datos
 def init_db():
@@ -125,12 +154,6 @@ def init_db():
             )
         ''')
         
-        # Agregar columna camera_url si la tabla ya existe
-        try:
-            cursor.execute("ALTER TABLE aspersores ADD COLUMN camera_url VARCHAR(255)")
-        except sqlite3.OperationalError:
-            pass  # La columna ya existe
-        
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS programaciones_riego (
                 id_programacion INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -193,6 +216,9 @@ def init_db():
         
         connection.commit()
         cursor.close()
+
+        # Cambios de esquema posteriores (columnas, índices) como migraciones versionadas
+        run_migrations(connection, verbose=not crear_nueva)
         connection.close()
         if crear_nueva:
             print("Base de datos inicializada correctamente")
@@ -203,6 +229,9 @@ init_db()
 # Generar o reutilizar un aspersor por defecto para las lecturas MQTT
 default_aspersor_id = None
 
+# Dispositivo de AquaZen/<dispositivo>/sender -> id_aspersor (sin consultar la BD por mensaje)
+device_registry = DeviceRegistry(get_db_connection)
+
 def ensure_default_aspersor():
     """Garantiza que exista un aspersor para asociar las lecturas MQTT y devuelve su id."""
     global default_aspersor_id
@@ -248,62 +277,72 @@ def ensure_default_aspersor():
     return default_aspersor_id
 
 
-def store_sensor_reading(humedad_value=None, raw_value=None, nivel_value=None, calidad_value=None):
-    """Guarda lecturas del broker en tablas separadas por sensor."""
-    aspersor_id = ensure_default_aspersor()
+def store_sensor_reading(aspersor_id, humedad_value=None, raw_value=None, nivel_value=None, calidad_value=None,
+                         fecha_hora=None):
+    """Encola lecturas del broker; el escritor de sensor_write_queue las guarda por lotes."""
     if aspersor_id is None:
         return
 
     if all(v is None for v in [humedad_value, raw_value, nivel_value, calidad_value]):
         return
 
-    connection = get_db_connection()
-    if not connection:
-        print("No se pudo guardar lectura: sin conexión a BD")
-        return
-
-    try:
-        cursor = connection.cursor()
-        if humedad_value is not None or raw_value is not None:
-            cursor.execute("""
-                INSERT INTO lecturas_humedad (id_aspersor, humedad, raw)
-                VALUES (?, ?, ?)
-            """, (aspersor_id, humedad_value, raw_value))
-            prune_sensor_table(cursor, 'lecturas_humedad')
-        if nivel_value is not None:
-            cursor.execute("""
-                INSERT INTO lecturas_ultrasonico (id_aspersor, nivel)
-                VALUES (?, ?)
-            """, (aspersor_id, nivel_value))
-            prune_sensor_table(cursor, 'lecturas_ultrasonico')
-        if calidad_value is not None:
-            cursor.execute("""
-                INSERT INTO lecturas_calidad (id_aspersor, calidad)
-                VALUES (?, ?)
-            """, (aspersor_id, calidad_value))
-            prune_sensor_table(cursor, 'lecturas_calidad')
-        connection.commit()
-    except Exception as e:
-        print(f"Error guardando lectura de sensor: {e}")
-    finally:
-        cursor.close()
-        connection.close()
-
-
-def prune_sensor_table(cursor, table_name):
-    """Mantiene solo las últimas MAX_SENSOR_RECORDS filas en la tabla indicada."""
-    try:
-        cursor.execute(f"""
-            DELETE FROM {table_name}
-            WHERE id_lectura NOT IN (
-                SELECT id_lectura
-                FROM {table_name}
-                ORDER BY fecha_hora DESC
-                LIMIT ?
-            )
-        """, (MAX_SENSOR_RECORDS,))
-    except Exception as e:
-        print(f"No se pudo podar {table_name}: {e}")
+    if humedad_value is not None or raw_value is not None:
+        sensor_write_queue.put('lecturas_humedad', aspersor_id, (humedad_value, raw_value), fecha_hora)
+    if nivel_value is not None:
+        sensor_write_queue.put('lecturas_ultrasonico', aspersor_id, (nivel_value,), fecha_hora)
+    if calidad_value is not None:
+        sensor_write_queue.put('lecturas_calidad', aspersor_id, (calidad_value,), fecha_hora)
+
+
+# Cola write-behind: el hilo de paho solo encola, un hilo escritor agrupa los INSERT
+sensor_write_queue = SensorWriteQueue(
+    get_db_connection,
+    max_size=INGEST_QUEUE_MAX,
+    batch_size=INGEST_BATCH_SIZE,
+    flush_interval=INGEST_FLUSH_INTERVAL,
+    write_retries=INGEST_WRITE_RETRIES,
+    retry_backoff=INGEST_RETRY_BACKOFF
+)
+atexit.register(sensor_write_queue.stop)
+
+# Rollups 1 min / 1 h / 1 día actualizados en la misma transacción de cada lote
+rollup_aggregator = RollupAggregator()
+sensor_write_queue.add_flush_hook(rollup_aggregator.on_flush)
+
+# Retención amortizada: poda por rangos de id_lectura en segundo plano
+retention_engine = RetentionEngine(
+    get_db_connection,
+    SENSOR_TABLE_COLUMNS,
+    max_rows=MAX_SENSOR_RECORDS or None,
+    ttl_seconds=SENSOR_TTL_HOURS * 3600 or None,
+    interval=RETENTION_INTERVAL,
+    high_water=RETENTION_HIGH_WATER
+)
+sensor_write_queue.add_flush_hook(retention_engine.on_flush)
+retention_engine.add_task('lecturas_rollup', rollup_aggregator.prune)
+atexit.register(retention_engine.stop)
+
+# ETags por marca de agua de cada tabla: se incrementan después de cada commit
+table_watermarks = TableWatermarks()
+response_cache = ResponseCache(
+    table_watermarks,
+    ttl=HTTP_CACHE_TTL,
+    min_compress_size=HTTP_COMPRESS_MIN_BYTES
+)
+sensor_write_queue.add_commit_hook(table_watermarks.on_commit)
+retention_engine.add_prune_hook(table_watermarks.on_prune)
+# Con INGEST_MODE=service los demás procesos también deben invalidar sus ETags
+table_watermarks.add_listener(lambda tables: send_live_update('tables', tables))
+
+# Reportes PDF en un pool de procesos con caché LRU en disco
+report_jobs = ReportJobManager(
+    get_db_connection,
+    REPORT_CACHE_DIR,
+    max_cache_bytes=int(REPORT_CACHE_MAX_MB * 1024 * 1024),
+    max_workers=REPORT_WORKERS,
+    cache_ttl=REPORT_CACHE_TTL
+)
+atexit.register(report_jobs.shutdown)
 
 
 # --- MQTT Listener ---
@@ -311,16 +350,135 @@ mqtt_client = None
 _startup_done = False
 
 
-def _now_iso():
-    return datetime.now(timezone.utc).isoformat()
+def handle_sensor_values(aspersor_id, sensor_type, values, moment):
+    """Guarda una lectura ya decodificada (JSON o binaria), actualiza su snapshot y la difunde por SSE."""
+    fecha_hora = db_timestamp(moment)
+    if sensor_type == 'ultrasonico':
+        store_sensor_reading(aspersor_id, nivel_value=values['distancia_cm'], fecha_hora=fecha_hora)
+    elif sensor_type == 'liquido':
+        store_sensor_reading(aspersor_id, humedad_value=values['nivel_pct'], raw_value=values['raw'],
+                             fecha_hora=fecha_hora)
+    elif sensor_type == 'tds':
+        store_sensor_reading(aspersor_id, calidad_value=values['ppm'], fecha_hora=fecha_hora)
+
+    timestamp = moment.isoformat()
+    version = latest_store.update(aspersor_id, sensor_type, values, timestamp)
+    broadcast_reading(aspersor_id, sensor_type, values, timestamp, version)
+    send_live_update('reading', aspersor_id, sensor_type, values, timestamp, latest_store.epoch, version)
+
+
+def broadcast_reading(aspersor_id, sensor_type, values, timestamp, version):
+    """Envía la lectura a los clientes SSE de este proceso."""
+    sensor_broadcaster.publish(sensor_type, {
+        'sensor': sensor_type,
+        'id_aspersor': aspersor_id,
+        'version': version,
+        'timestamp': timestamp,
+        'data': dict(values, timestamp=timestamp)
+    }, channel=aspersor_id)
+
+
+# --- Canal en vivo con el servicio de ingesta (INGEST_MODE=service) ---
+# En ingest_service.py es un LiveUpdateServer; en cada proceso web, un LiveUpdateClient
+live_link = None
+_web_links_lock = threading.Lock()
+
+
+def require_ipc_authkey():
+    """El canal cambia el estado del ejecutor y de las cachés: sin clave propia no arranca."""
+    if not INGEST_IPC_AUTHKEY:
+        raise RuntimeError("INGEST_IPC_AUTHKEY es obligatoria con el servicio de ingesta (genera una con: python -c 'import secrets; print(secrets.token_hex(32))')")
+
+
+if INGEST_MODE == 'service':
+    require_ipc_authkey()
+
+
+def send_live_update(kind, *args):
+    """Avisa a los demás procesos (no hace nada en modo embedded)."""
+    link = live_link
+    if link is not None:
+        link.send([kind, *args])
+
+
+def apply_live_update(message):
+    """Aplica un mensaje de otro proceso sin reenviarlo."""
+    kind = message[0]
+    if kind in ('reading', 'snapshot'):
+        # version es la de este proceso; (epoch, versión remota) solo descarta duplicados
+        _, aspersor_id, sensor_type, values, timestamp, epoch, remote_version = message
+        version = latest_store.update(aspersor_id, sensor_type, values, timestamp, origin=(epoch, remote_version))
+        if version is None:
+            return
+        if kind == 'reading':
+            broadcast_reading(aspersor_id, sensor_type, values, timestamp, version)
+    elif kind == 'tables':
+        table_watermarks.bump(*message[1], propagate=False)
+    elif kind == 'schedules':
+        if schedule_executor.running:
+            schedule_executor.reload(message[1])
+    elif kind == 'aspersores':
+        device_registry.invalidate()
+        if message[1] is not None:
+            forget_aspersor(message[1], propagate=False)
+
+
+def live_snapshot_messages():
+    """Estado actual de cada pecera para un proceso web que se acaba de conectar."""
+    messages = []
+    for aspersor_id, snapshot in latest_store.tanks().items():
+        for sensor_type, value in snapshot.sensors.items():
+            values = {k: v for k, v in value.data.items() if k != 'timestamp'}
+            epoch, version = latest_store.origin(aspersor_id, sensor_type) or (latest_store.epoch, value.version)
+            messages.append(['snapshot', aspersor_id, sensor_type, values, value.timestamp, epoch, version])
+    return messages
+
+
+def run_ingest_service():
+    """Proceso de ingesta dedicado (ingest_service.py): suscripción MQTT, escrituras y canal en vivo."""
+    global live_link
+    require_ipc_authkey()
+
+    def on_web_message(message, peer):
+        apply_live_update(message)
+        live_link.send(message, exclude=peer)  # reenviar a los demás procesos web
+
+    live_link = LiveUpdateServer(
+        (INGEST_IPC_HOST, INGEST_IPC_PORT),
+        INGEST_IPC_AUTHKEY,
+        on_message=on_web_message,
+        on_connect=live_snapshot_messages
+    )
+    live_link.start()
+    ensure_default_aspersor()
+    client = start_mqtt_listener()
+    schedule_executor.start()
+    return client
+
+
+def start_web_links():
+    """Proceso web en modo service: MQTT solo para comandos y lecturas en vivo desde el servicio."""
+    global live_link
+    with _web_links_lock:
+        if live_link is not None:
+            return
+        live_link = LiveUpdateClient((INGEST_IPC_HOST, INGEST_IPC_PORT), INGEST_IPC_AUTHKEY, apply_live_update)
+        live_link.start()
+        start_mqtt_listener(ingest=False)
 
 
-def start_mqtt_listener():
-    """Se suscribe al tópico MQTT y guarda las lecturas en la BD."""
+def start_mqtt_listener(ingest=True):
+    """Se suscribe al tópico MQTT y guarda las lecturas en la BD.
+
+    Con ingest=False (procesos web en modo service) el cliente solo publica comandos.
+    """
     global mqtt_client
     if mqtt_client is not None:
         return mqtt_client
 
+    if ingest:
+        sensor_write_queue.start()
+        retention_engine.start()
     client = mqtt.Client(
         client_id=MQTT_CLIENT_ID,
         callback_api_version=mqtt.CallbackAPIVersion.VERSION2
@@ -328,76 +486,86 @@ def start_mqtt_listener():
     client.reconnect_delay_set(min_delay=1, max_delay=30)
 
     def on_connect(cl, userdata, flags, reason_code, properties=None):
-        print(f"MQTT conectado (reason_code={reason_code})")
-        cl.subscribe(MQTT_TOPIC_SENDER)
+        mqtt_log.info("MQTT conectado", extra={'reason_code': str(reason_code)})
+        if not ingest:
+            return
+        # Tópico base (pecera por defecto) + AquaZen/<dispositivo>/sender, en JSON y binario (/bin)
+        topics = [MQTT_TOPIC_SENDER, sender_topic_filter(MQTT_TOPIC_SENDER)]
+        cl.subscribe([(t, 0) for t in topics] + [(f"{t}/{BINARY_SUFFIX}", 0) for t in topics])
 
     def on_disconnect(cl, userdata, disconnect_flags, reason_code, properties=None):
-        print(
-            "MQTT desconectado "
-            f"(reason_code={reason_code}, flags={disconnect_flags})"
-        )
+        mqtt_log.warning("MQTT desconectado", extra={'reason_code': str(reason_code), 'flags': str(disconnect_flags)})
 
     def on_message(cl, userdata, msg):
         try:
-            payload = msg.payload.decode('utf-8')
-            data = json.loads(payload)
-            sensor_type = (data.get('sensor') or '').lower()
-            now_iso = _now_iso()
-            latest_sensor_data['timestamp'] = now_iso
-
-            if sensor_type == 'ultrasonico':
-                distancia = data.get('distancia_cm')
-                latest_sensor_data['ultrasonico'] = {
-                    'distancia_cm': distancia,
-                    'timestamp': now_iso
-                }
-                store_sensor_reading(nivel_value=distancia)
-            elif sensor_type == 'liquido':
-                nivel_pct = data.get('nivel_pct')
-                raw_value = data.get('raw')
-                latest_sensor_data['liquido'] = {
-                    'nivel_pct': nivel_pct,
-                    'raw': raw_value,
-                    'timestamp': now_iso
-                }
-                store_sensor_reading(humedad_value=nivel_pct, raw_value=raw_value)
-            elif sensor_type == 'tds':
-                ppm = data.get('ppm')
-                latest_sensor_data['tds'] = {
-                    'ppm': ppm,
-                    'raw': data.get('raw'),
-                    'calidad': data.get('calidad'),
-                    'timestamp': now_iso
-                }
-                store_sensor_reading(calidad_value=ppm)
-            elif sensor_type == 'sistema':
-                latest_sensor_data['sistema'] = {
-                    'estado': data.get('estado'),
-                    'bomba6': data.get('bomba6'),
-                    'bomba7': data.get('bomba7'),
-                    'servo_pos': data.get('servo_pos'),
-                    'eventos_activos': data.get('eventos_activos'),
-                    'timestamp': now_iso
-                }
+            # AquaZen/.../sender/bin: tramas binarias compactas; sin sufijo: JSON
+            topic, binary = split_binary_topic(msg.topic)
+            payload_format = 'bin' if binary else 'json'
+            device_id = parse_sender_topic(topic, MQTT_TOPIC_SENDER)
+            if device_id is None:
+                aspersor_id = ensure_default_aspersor()
             else:
-                print(f"MQTT sensor desconocido: {data}")
+                aspersor_id = device_registry.resolve(device_id)
+                if aspersor_id is None:
+                    MQTT_DECODE_ERRORS.inc(payload_format, 'unknown_device')
+                    mqtt_log.warning("MQTT dispositivo sin pecera asignada", extra={'device_id': device_id})
+                    return
+
+            now = datetime.now(timezone.utc)
+            if binary:
+                try:
+                    readings = decode_frame(msg.payload)
+                except FrameError as e:
+                    MQTT_DECODE_ERRORS.inc('bin', 'frame')
+                    mqtt_log.warning("MQTT trama binaria inválida: %s", e, extra={'topic': msg.topic})
+                    return
+                for sensor_type, values, age in readings:
+                    MQTT_MESSAGES.inc(sensor_type, 'bin')
+                    handle_sensor_values(aspersor_id, sensor_type, values, now - timedelta(seconds=age))
+                mqtt_log.debug("MQTT trama binaria recibida", extra={
+                    'lecturas': len(readings), 'id_aspersor': aspersor_id, **SAMPLED
+                })
+                return
 
-            if sensor_type:
-                print(f"MQTT mensaje recibido ({sensor_type}) -> {data}")
-        except Exception as e:
-            print(f"Error procesando mensaje MQTT: {e}")
+            try:
+                data = json.loads(msg.payload.decode('utf-8'))
+            except ValueError as e:
+                MQTT_DECODE_ERRORS.inc('json', 'json')
+                mqtt_log.warning("MQTT JSON inválido: %s", e, extra={'topic': msg.topic})
+                return
+            sensor_type = (data.get('sensor') or '').lower() if isinstance(data, dict) else ''
+            if sensor_type not in SENSOR_FIELDS:
+                MQTT_DECODE_ERRORS.inc('json', 'sensor')
+                mqtt_log.warning("MQTT sensor desconocido", extra={'payload': data})
+                return
+            MQTT_MESSAGES.inc(sensor_type, 'json')
+            values = {field: data.get(field) for field in SENSOR_FIELDS[sensor_type]}
+            handle_sensor_values(aspersor_id, sensor_type, values, now)
+
+            mqtt_log.debug("MQTT mensaje recibido", extra={
+                'sensor': sensor_type, 'id_aspersor': aspersor_id, 'payload': data, **SAMPLED
+            })
+        except Exception:
+            mqtt_log.exception("Error procesando mensaje MQTT", extra={'topic': msg.topic})
 
     client.on_connect = on_connect
     client.on_disconnect = on_disconnect
-    client.on_message = on_message
+    if ingest:
+        client.on_message = on_message
+    catcher_dispatcher.attach(client)
 
     try:
-        client.connect(MQTT_BROKER, MQTT_PORT, 60)
+        # connect_async: la conexión (y cada reconexión) la hace el hilo de paho,
+        # así ninguna petición HTTP queda esperando al broker
+        client.connect_async(MQTT_BROKER, MQTT_PORT, 60)
         client.loop_start()
         mqtt_client = client
-        print(f"Escuchando MQTT en {MQTT_BROKER}:{MQTT_PORT} tópico {MQTT_TOPIC_SENDER}")
+        if ingest:
+            mqtt_log.info(f"Escuchando MQTT en {MQTT_BROKER}:{MQTT_PORT} tópico {MQTT_TOPIC_SENDER}")
+        else:
+            mqtt_log.info(f"MQTT conectando a {MQTT_BROKER}:{MQTT_PORT} solo para comandos")
     except Exception as e:
-        print(f"No se pudo conectar al broker MQTT: {e}")
+        mqtt_log.error("No se pudo conectar al broker MQTT: %s", e)
 
     return mqtt_client
 
@@ -410,11 +578,54 @@ def startup_tasks():
     # Evitar arranque doble con el reloader en modo debug
     if app.debug and os.environ.get("WERKZEUG_RUN_MAIN") != "true":
         return
-    ensure_default_aspersor()
-    start_mqtt_listener()
+    if INGEST_MODE == 'service':
+        # La suscripción y las escrituras son de ingest_service.py
+        start_web_links()
+    else:
+        ensure_default_aspersor()
+        start_mqtt_listener()
+        schedule_executor.start()
+    warm_up_lazy_modules()
     _startup_done = True
 
 
+@app.before_request
+def ensure_web_links():
+    # Bajo un servidor WSGI con varios workers no se ejecuta __main__: cada worker
+    # se conecta al servicio de ingesta en su primera petición
+    if INGEST_MODE == 'service' and live_link is None:
+        start_web_links()
+
+
+# Módulos pesados que no se importan al arrancar (NumPy, pyserial)
+LAZY_MODULES = ('series', 'bulk_ingest', 'serial')
+
+
+def warm_up_lazy_modules(delay=WARMUP_DELAY):
+    """Importa en segundo plano los módulos diferidos y arranca el pool de reportes."""
+    if delay < 0:
+        return None
+
+    def _warm_up():
+        time.sleep(delay)  # dejar que el servidor empiece a escuchar primero
+        started = time.perf_counter()
+        for name in LAZY_MODULES:
+            try:
+                importlib.import_module(name)
+            except ImportError as e:
+                print(f"Precarga: no se pudo importar {name}: {e}")
+        try:
+            for future in report_jobs.warm_up():
+                future.result()
+        except Exception as e:
+            print(f"Precarga: no se pudo iniciar el pool de reportes: {e}")
+        print(f"Precarga de módulos completada en {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    thread = threading.Thread(target=_warm_up, name='lazy-warmup', daemon=True)
+    thread.start()
+    return thread
+
+
 @app.route('/myprofile')
 def myprofile():
     nombre_usuario = session['nombre_usuario']
@@ -604,77 +815,224 @@ def login():
             cursor.close()
             connection.close()
 
-            print(f"DEBUG - Correo ingresado: {correo}")
-            print(f"DEBUG - Usuario encontrado: {row}")
-            
+
             if row and row['contrasena'] == contrasena:  # Sin hash
                 session['id_usuario'] = row['id_usuario']
                 session['nombre_usuario'] = row['nombre']
                 session['tipo_usuario'] = row['tipo_usuario']
-                print(f"DEBUG - Login exitoso para: {row['nombre']}")
+                log.info("Login exitoso", extra={'id_usuario': row['id_usuario']})
                 return redirect(url_for('dashboard'))
             else:
-                print(f"DEBUG - Login fallido")
+                log.info("Login fallido", extra={'correo': correo})
                 flash('Correo o contraseña incorrectos')
         else:
-            print("DEBUG - No se pudo conectar a la base de datos")
+            log.error("Login: no se pudo conectar a la base de datos")
             flash('Error de conexión a la base de datos')
     return render_template('login.html')
 
-# Ruta para obtener todas las lecturas almacenadas
+def parse_export_args():
+    """Filtros comunes de /get_sensor_data y su exportación (ValueError si son inválidos)."""
+    cursor_key = request.args.get('cursor')
+    return {
+        'cursor_key': sensor_export.decode_cursor(cursor_key) if cursor_key else None,
+        'id_aspersor': request.args.get('id_aspersor', type=int),
+        'tipos': sensor_export.parse_tipos(request.args.get('tipo')),
+    }
+
+
+# Lecturas de todas las tablas, paginadas por cursor (?limit=, ?cursor=, ?id_aspersor=, ?tipo=)
 @app.route('/get_sensor_data', methods=['GET'])
+@response_cache.cached_json('lecturas_humedad', 'lecturas_ultrasonico', 'lecturas_calidad')
 def get_sensor_data():
+    try:
+        filtros = parse_export_args()
+        limit = int(request.args.get('limit', sensor_export.DEFAULT_PAGE_SIZE))
+    except ValueError as e:
+        return jsonify({"error": f"Parámetros inválidos: {e}"}), 400
+    limit = max(1, min(limit, sensor_export.MAX_PAGE_SIZE))
+
     connection = get_db_connection()
     if connection:
-        cursor = connection.cursor()
-        cursor.execute("""
-            SELECT 'humedad' AS tipo_sensor, id_aspersor, humedad AS valor, fecha_hora
-            FROM lecturas_humedad
-            WHERE humedad IS NOT NULL
-            UNION ALL
-            SELECT 'raw' AS tipo_sensor, id_aspersor, raw AS valor, fecha_hora
-            FROM lecturas_humedad
-            WHERE raw IS NOT NULL
-            UNION ALL
-            SELECT 'nivel' AS tipo_sensor, id_aspersor, nivel AS valor, fecha_hora
-            FROM lecturas_ultrasonico
-            WHERE nivel IS NOT NULL
-            UNION ALL
-            SELECT 'calidad' AS tipo_sensor, id_aspersor, calidad AS valor, fecha_hora
-            FROM lecturas_calidad
-            WHERE calidad IS NOT NULL
-            ORDER BY fecha_hora DESC
-        """)
-        data = cursor.fetchall()
-        cursor.close()
-        connection.close()
-        # Convertir a tipos serializables
-        return jsonify([dict(row) for row in data])
+        try:
+            datos, siguiente = sensor_export.fetch_page(connection, limit, **filtros)
+        finally:
+            connection.close()
+        return jsonify({
+            "datos": datos,
+            "limite": limit,
+            "siguiente_cursor": siguiente,
+        })
     return jsonify({"error": "Error al obtener datos"}), 500
 
 
+@app.route('/get_sensor_data/export', methods=['GET'])
+def export_sensor_data():
+    """Todas las lecturas (desde ?cursor=) como NDJSON o CSV, escritas a medida que se leen."""
+    formato = request.args.get('format', 'ndjson')
+    if formato not in ('ndjson', 'csv'):
+        return jsonify({"error": "Formato no soportado (ndjson o csv)"}), 400
+    try:
+        filtros = parse_export_args()
+        limit = request.args.get('limit', type=int)
+    except ValueError as e:
+        return jsonify({"error": f"Parámetros inválidos: {e}"}), 400
+
+    connection = get_db_connection()
+    if not connection:
+        return jsonify({"error": "Error al obtener datos"}), 500
+
+    def generate():
+        try:
+            blocks = sensor_export.iter_rows(connection, limit=limit, **filtros)
+            if formato == 'csv':
+                yield from sensor_export.csv_chunks(blocks)
+            else:
+                yield from sensor_export.ndjson_chunks(blocks)
+        finally:
+            connection.close()
+
+    nombre = f"lecturas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{formato}"
+    return Response(
+        generate(),
+        mimetype='text/csv' if formato == 'csv' else 'application/x-ndjson',
+        headers={
+            'Content-Disposition': f'attachment; filename="{nombre}"',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
+def build_latest_payload(id_aspersor=None, since=None):
+    """Arma la respuesta con el último valor recibido de cada sensor de una pecera.
+
+    Sin id_aspersor se usa la pecera que reportó más recientemente. Con since
+    solo se incluyen los sensores actualizados después de esa versión.
+    """
+    if id_aspersor is None:
+        id_aspersor = latest_store.latest_tank()
+    return latest_store.to_payload(id_aspersor, since)
+
+
 @app.route('/get_latest_sensor_data', methods=['GET'])
 def get_latest_sensor_data():
-    """Devuelve el último valor recibido del broker MQTT."""
-    has_data = any(
-        latest_sensor_data.get(section, {}).get(key) is not None
-        for section in ('ultrasonico', 'liquido', 'tds')
-        for key in latest_sensor_data.get(section, {})
-        if key != 'timestamp'
+    """Último valor recibido del broker MQTT (?id_aspersor=, ?since=<versión>).
+
+    El ETag es la versión del snapshot: con If-None-Match igual se responde 304.
+    """
+    id_aspersor = request.args.get('id_aspersor', type=int)
+    since = request.args.get('since', type=int)
+    if id_aspersor is None:
+        id_aspersor = latest_store.latest_tank()
+    snapshot = latest_store.snapshot(id_aspersor)
+    etag = f"{id_aspersor}-{snapshot.version if snapshot else 0}"
+    if since is not None:
+        etag += f"-since{since}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build_latest_payload(id_aspersor, since))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/stream/sensors')
+def stream_sensors():
+    """Stream SSE: un snapshot inicial y luego cada actualización MQTT en cuanto llega."""
+    id_aspersor = request.args.get('id_aspersor', type=int)
+    subscription = sensor_broadcaster.subscribe(channel=id_aspersor)
+    initial = format_sse('snapshot', json.dumps(build_latest_payload(id_aspersor)))
+    return Response(
+        sensor_broadcaster.stream(subscription, initial=initial, heartbeat=SSE_HEARTBEAT),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
     )
 
-    response = {
-        "has_data": has_data,
-        "timestamp": latest_sensor_data['timestamp'],
-        "ultrasonico": latest_sensor_data['ultrasonico'],
-        "liquido": latest_sensor_data['liquido'],
-        "tds": latest_sensor_data['tds'],
-        "sistema": latest_sensor_data['sistema']
-    }
-    return jsonify(response)
+
+@app.route('/api/stream/stats', methods=['GET'])
+def stream_stats():
+    """Clientes SSE conectados, mensajes publicados y clientes desconectados por lentos."""
+    return jsonify(sensor_broadcaster.stats())
+
+
+@app.route('/api/ingest/stats', methods=['GET'])
+def ingest_stats():
+    """Estado de la cola de ingesta: profundidad, backpressure y descartes (y el canal en vivo en modo service)."""
+    data = sensor_write_queue.stats()
+    data['mode'] = INGEST_MODE
+    data['live_link'] = live_link.stats() if live_link is not None else None
+    return jsonify(data)
+
+
+# Valores que otros módulos ya cuentan: se leen de sus stats() en cada scrape
+def _queue_counters():
+    data = sensor_write_queue.stats()
+    return {key: data[key] for key in ('enqueued', 'written', 'dropped', 'backpressure', 'write_errors')}
+
+
+metrics.callback('aquazen_ingest_queue_depth', 'Lecturas en la cola write-behind',
+                 lambda: sensor_write_queue.stats()['queue_depth'])
+metrics.callback('aquazen_ingest_rows_total', 'Lecturas de la cola de ingesta por resultado',
+                 _queue_counters, labels=('result',), metric_type='counter')
+metrics.callback('aquazen_db_pool_connections', 'Conexiones del pool SQLite por estado',
+                 lambda: {key: value for key, value in get_pool().stats().items() if key in ('open', 'idle', 'in_use')},
+                 labels=('state',))
+metrics.callback('aquazen_db_pool_waits_total', 'Préstamos del pool que tuvieron que esperar',
+                 lambda: get_pool().stats()['waits'], metric_type='counter')
+metrics.callback('aquazen_sse_clients', 'Clientes conectados a /stream/sensors',
+                 lambda: sensor_broadcaster.stats()['clients'])
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def observe_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # Plantilla de la ruta (no la URL) para no crear una serie por id
+        route = request.url_rule.rule if request.url_rule is not None else 'sin_ruta'
+        HTTP_SECONDS.observe(time.perf_counter() - started, route, request.method, str(response.status_code))
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Métricas de este proceso en formato de texto de Prometheus."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route('/api/db/stats', methods=['GET'])
+def db_stats():
+    """Estadísticas del pool de conexiones SQLite (aciertos, aperturas y esperas)."""
+    return jsonify(get_pool().stats())
+
+
+@app.route('/api/devices/stats', methods=['GET'])
+def devices_stats():
+    """Mapa dispositivo -> pecera en memoria y sus aciertos."""
+    return jsonify(device_registry.stats())
+
+
+@app.route('/api/http_cache/stats', methods=['GET'])
+def http_cache_stats():
+    """ETags servidos como 304, aciertos de la micro-caché y bytes ahorrados por compresión."""
+    return jsonify(response_cache.stats())
+
+
+@app.route('/api/retention/stats', methods=['GET'])
+def retention_stats():
+    """Estado del motor de retención: políticas, pendientes y filas borradas."""
+    return jsonify(retention_engine.stats())
 
 
 @app.route('/sensor_data/humedad', methods=['GET'])
+@response_cache.cached_json('lecturas_humedad')
 def sensor_data_humedad():
     """Devuelve las últimas lecturas de humedad almacenadas."""
     limit = request.args.get('limit', 50)
@@ -700,6 +1058,7 @@ def sensor_data_humedad():
     return jsonify({"error": "Error al obtener lecturas de humedad"}), 500
 
 @app.route('/sensor_data/ultrasonico', methods=['GET'])
+@response_cache.cached_json('lecturas_ultrasonico')
 def sensor_data_ultrasonico():
     """Devuelve las últimas lecturas del sensor ultrasónico."""
     limit = request.args.get('limit', 50)
@@ -725,6 +1084,7 @@ def sensor_data_ultrasonico():
     return jsonify({"error": "Error al obtener lecturas del sensor ultrasónico"}), 500
 
 @app.route('/sensor_data/temperatura', methods=['GET'])
+@response_cache.cached_json('lecturas_temperatura')
 def sensor_data_temperatura():
     """Devuelve las últimas lecturas de temperatura."""
     limit = request.args.get('limit', 50)
@@ -750,6 +1110,7 @@ def sensor_data_temperatura():
     return jsonify({"error": "Error al obtener lecturas de temperatura"}), 500
 
 @app.route('/sensor_data/calidad', methods=['GET'])
+@response_cache.cached_json('lecturas_calidad')
 def sensor_data_calidad():
     """Devuelve las últimas lecturas de calidad del agua."""
     limit = request.args.get('limit', 50)
@@ -774,6 +1135,59 @@ def sensor_data_calidad():
         return jsonify([{"valor": r["valor"], "timestamp": r["timestamp"]} for r in rows])
     return jsonify({"error": "Error al obtener lecturas de calidad del agua"}), 500
 
+def parse_time_arg(value, default):
+    """Acepta epoch en segundos o ISO 8601 (sin zona = UTC). Devuelve epoch entero."""
+    if value in (None, ''):
+        return default
+    try:
+        epoch = float(value)
+    except ValueError:
+        epoch = None
+    if epoch is not None:
+        # inf/nan o fuera del rango de datetime: mismo 400 que un valor ilegible
+        try:
+            datetime.fromtimestamp(epoch, timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            raise ValueError(f"Epoch fuera de rango: {value}")
+        return int(epoch)
+    moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+
+@app.route('/api/v2/series/<sensor>', methods=['GET'])
+def api_series(sensor):
+    """Histórico de un sensor por rango (from, to, id_aspersor) reducido a max_points con LTTB."""
+    # series usa NumPy: se importa en la primera petición (o en el precalentamiento)
+    from series import SERIES_SENSORS, load_series
+    if sensor not in SERIES_SENSORS:
+        return jsonify({"error": f"Sensor no soportado: {sensor}"}), 404
+
+    ahora = int(time.time())
+    try:
+        hasta = parse_time_arg(request.args.get('to'), ahora)
+        desde = parse_time_arg(request.args.get('from'), hasta - 86400)
+        max_points = int(request.args.get('max_points', 500))
+        id_aspersor = request.args.get('id_aspersor', type=int)
+    except ValueError:
+        return jsonify({"error": "Parámetros inválidos (from/to: epoch o ISO 8601, max_points: entero)"}), 400
+    if desde >= hasta:
+        return jsonify({"error": "'from' debe ser anterior a 'to'"}), 400
+    max_points = max(3, min(max_points, 5000))
+
+    connection = get_db_connection()
+    if not connection:
+        return jsonify({"error": "Error al conectar con la base de datos"}), 500
+    try:
+        return jsonify(load_series(connection, sensor, desde, hasta, id_aspersor, max_points))
+    except Exception as e:
+        print(f"Error al obtener serie {sensor}: {e}")
+        return jsonify({"error": "Error al obtener la serie"}), 500
+    finally:
+        connection.close()
+
+
 @app.route('/get_valve_states', methods=['GET'])
 def get_valve_states():
     # Asegúrate de que el usuario esté autenticado
@@ -811,35 +1225,53 @@ def get_valve_states():
         return jsonify({"error": "No se pudo conectar a la base de datos."}), 500
 
 
+@app.route('/api/lecturas', methods=['POST'])
 @app.route('/save_sensor_data', methods=['POST'])
 def save_sensor_data():
-    if request.method == 'POST':
-        data = request.get_json()  # Recibir datos en formato JSON
-        id_aspersor = data.get('id_aspersor')  # Identificador del aspersor
-        tipo_sensor = data.get('tipo_sensor')  # Tipo de sensor (humedad, temperatura, etc.)
-        valor_sensor = data.get('valor_sensor')  # Valor leído por el sensor
+    """Ingesta por lotes: arreglo JSON o NDJSON de {id_aspersor, tipo_sensor, valor_sensor[, fecha_hora]}.
 
-        # Verificar que todos los campos están presentes
-        if not id_aspersor or not tipo_sensor or valor_sensor is None:
-            return jsonify({"error": "Datos incompletos"}), 400
+    Las lecturas válidas se escriben en una sola transacción en su tabla lecturas_*;
+    las inválidas se informan por índice para que la pasarela pueda descartarlas.
+    """
+    max_bytes = int(BULK_INGEST_MAX_MB * 1024 * 1024)
+    if request.content_length and request.content_length > max_bytes:
+        return jsonify({"error": f"El cuerpo supera {BULK_INGEST_MAX_MB:g} MB"}), 413
 
-        connection = get_db_connection()
-        if connection:
-            try:
-                cursor = connection.cursor()
-                cursor.execute("""
-                    INSERT INTO datos_sensores (id_aspersor, tipo_sensor, valor_sensor)
-                    VALUES (?, ?, ?)
-                """, (id_aspersor, tipo_sensor, valor_sensor))
-                connection.commit()
-                cursor.close()
-                connection.close()
-                return jsonify({"message": "Datos guardados exitosamente"}), 201
-            except Exception as e:
-                print(f"Error al guardar los datos del sensor: {e}")
-                return jsonify({"error": "Error al guardar los datos"}), 500
-        else:
-            return jsonify({"error": "Error al conectar con la base de datos"}), 500
+    # bulk_ingest usa NumPy: se importa en la primera petición (o en el precalentamiento)
+    from bulk_ingest import parse_readings, validate_readings
+    try:
+        lecturas = parse_readings(request.get_data(cache=False), request.mimetype)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not lecturas:
+        return jsonify({"error": "Datos incompletos"}), 400
+    if len(lecturas) > BULK_INGEST_MAX_ROWS:
+        return jsonify({"error": f"Máximo {BULK_INGEST_MAX_ROWS} lecturas por petición"}), 413
+
+    connection = get_db_connection()
+    if not connection:
+        return jsonify({"error": "Error al conectar con la base de datos"}), 500
+    try:
+        resultado = validate_readings(lecturas, connection)
+    finally:
+        connection.close()
+
+    respuesta = {
+        "aceptadas": resultado['aceptadas'],
+        "total_rechazadas": resultado['total_rechazadas'],
+        "rechazadas": resultado['rechazadas'],
+    }
+    if not resultado['aceptadas']:
+        respuesta["error"] = "Ninguna lectura válida"
+        return jsonify(respuesta), 400
+
+    try:
+        sensor_write_queue.write_rows(resultado['rows_by_table'])
+    except Exception as e:
+        print(f"Error al guardar los datos del sensor: {e}")
+        return jsonify({"error": "Error al guardar los datos"}), 500
+    respuesta["message"] = "Datos guardados exitosamente"
+    return jsonify(respuesta), 201
 
 # Ruta para el dashboard (compartido)
 @app.route('/dashboard')
@@ -989,7 +1421,9 @@ def reset_lecturas(sensor_table):
         try:
             cursor = connection.cursor()
             cursor.execute(f"DELETE FROM {sensor_table}")
+            delete_rollups_for_table(cursor, sensor_table)
             connection.commit()
+            table_watermarks.bump(sensor_table, 'lecturas_rollup')
             cursor.close()
         except Exception as e:
             print(f"Error al limpiar {sensor_table}: {e}")
@@ -1024,6 +1458,8 @@ def save_schedule():
                 VALUES (?, ?, ?, ?)
             """, (id_aspersor, hora_inicio, duracion_minutos, frecuencia))
             connection.commit()
+            table_watermarks.bump('programaciones_riego')
+            schedules_changed(cursor.lastrowid)
             cursor.close()
             connection.close()
             flash("Programación guardada exitosamente.", "success")
@@ -1168,6 +1604,7 @@ def calendar(id_aspersor):
     )
 
 @app.route('/get_programaciones/<int:id_aspersor>')
+@response_cache.cached_json('programaciones_riego')
 def get_programaciones(id_aspersor):
     connection = get_db_connection()
     if not connection:
@@ -1223,6 +1660,8 @@ def save_irrigation_schedule():
             VALUES (?, ?, ?)
         """, (id_aspersor, hora_inicio, duracion_minutos))
         connection.commit()
+        table_watermarks.bump('programaciones_riego')
+        schedules_changed(cursor.lastrowid)
         cursor.close()
         connection.close()
 
@@ -1259,6 +1698,8 @@ def delete_programacion(id_programacion):
         cursor = connection.cursor()
         cursor.execute("DELETE FROM programaciones_riego WHERE id_programacion = ?", (id_programacion,))
         connection.commit()
+        table_watermarks.bump('programaciones_riego')
+        schedules_changed(id_programacion)
         cursor.close()
         connection.close()
         return jsonify({"success": True})
@@ -1268,22 +1709,18 @@ def delete_programacion(id_programacion):
 
 @app.route('/crear_aspersor/<int:id_usuario>', methods=['POST'])
 def crear_aspersor(id_usuario):
-    print(f"DEBUG - Inicio crear_aspersor, id_usuario de URL: {id_usuario}")
-    print(f"DEBUG - Session data: {dict(session)}")
-    
     if 'id_usuario' not in session:
-        print("DEBUG - No hay sesión activa, redirigiendo a login")
+        log.debug("crear_aspersor sin sesión activa, redirigiendo a login")
         return redirect(url_for('login'))
 
     tipo_usuario = session['tipo_usuario']
     usuario_actual = session['id_usuario']
 
-    print(f"DEBUG - Creando aspersor para id_usuario: {id_usuario}")
-    print(f"DEBUG - Usuario que crea: {usuario_actual} (tipo: {tipo_usuario})")
+    log.debug("Creando aspersor", extra={'id_usuario': id_usuario, 'usuario_actual': usuario_actual, 'tipo_usuario': tipo_usuario})
 
     # Validar permisos
     if tipo_usuario != 'admin' and id_usuario != usuario_actual:
-        print(f"DEBUG - Permiso denegado: {tipo_usuario} != 'admin' y {id_usuario} != {usuario_actual}")
+        log.warning("crear_aspersor: permiso denegado", extra={'id_usuario': id_usuario, 'usuario_actual': usuario_actual})
         flash('No tienes permiso para crear aspersores para este usuario.', 'error')
         return redirect(url_for('aspersores'))
 
@@ -1291,33 +1728,32 @@ def crear_aspersor(id_usuario):
     nombre = request.form.get('nombre')
     ubicacion = request.form.get('ubicacion')
     camera_url = request.form.get('camera_url', '').strip()  # Opcional
+    device_id = request.form.get('device_id', '').strip() or None  # Opcional: AquaZen/<device_id>/sender
     
     # Si no se proporciona URL de cámara, usar la URL por defecto centralizada
     if not camera_url:
         camera_url = CAMERA_DEFAULT_URL
 
-    print(f"DEBUG - Datos del formulario - Nombre: {nombre}, Ubicacion: {ubicacion}, Camera URL: {camera_url}")
-
     if not nombre or not ubicacion:
         flash('Todos los campos son obligatorios.', 'error')
         return redirect(url_for('aspersores', id_usuario=id_usuario))
 
     connection = get_db_connection()
     if not connection:
-        print("DEBUG - Error al conectar con la base de datos")
+        log.error("crear_aspersor: no se pudo conectar a la base de datos")
         flash('Error al conectar con la base de datos.', 'error')
         return redirect(url_for('aspersores'))
 
     try:
         cursor = connection.cursor()
-        print(f"DEBUG - Ejecutando INSERT con valores: id_usuario={id_usuario}, nombre={nombre}, ubicacion={ubicacion}, camera_url={camera_url}")
         cursor.execute("""
-            INSERT INTO aspersores (id_usuario, nombre, ubicacion, camera_url)
-            VALUES (?, ?, ?, ?)
-        """, (id_usuario, nombre, ubicacion, camera_url))
+            INSERT INTO aspersores (id_usuario, nombre, ubicacion, camera_url, device_id)
+            VALUES (?, ?, ?, ?, ?)
+        """, (id_usuario, nombre, ubicacion, camera_url, device_id))
         connection.commit()
+        aspersores_changed()
         
-        print(f"DEBUG - Aspersor creado exitosamente para usuario {id_usuario}")
+        log.info("Aspersor creado", extra={'id_usuario': id_usuario, 'nombre': nombre, 'device_id': device_id})
         
         cursor.close()
         connection.close()
@@ -1327,15 +1763,11 @@ def crear_aspersor(id_usuario):
         # Si es admin y está creando para otro usuario, redirige a users
         # Si es usuario normal o admin creando para sí mismo, redirige a aspersores
         if tipo_usuario == 'admin' and id_usuario != usuario_actual:
-            print(f"DEBUG - Admin creando para otro usuario, redirigiendo a /users")
             return redirect(url_for('users'))
         else:
-            print(f"DEBUG - Redirigiendo a aspersores del usuario {id_usuario}")
             return redirect(url_for('aspersores', id_usuario=id_usuario))
     except Exception as e:
-        print(f"ERROR - al crear aspersor: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error al crear aspersor: %s", e)
         flash('Error al crear el aspersor.', 'error')
         if tipo_usuario == 'admin':
             return redirect(url_for('users'))
@@ -1352,7 +1784,9 @@ def aspersores(id_usuario):
     tipo_usuario = session['tipo_usuario']
     usuario_actual = session['id_usuario']
 
-    print(f"DEBUG - Accediendo a aspersores. Usuario: {usuario_actual}, Tipo: {tipo_usuario}, ID solicitado: {id_usuario}")
+    log.debug("Accediendo a aspersores", extra={
+        'usuario_actual': usuario_actual, 'tipo_usuario': tipo_usuario, 'id_solicitado': id_usuario
+    })
 
     # Verificar permisos
     if id_usuario is None:
@@ -1375,7 +1809,6 @@ def aspersores(id_usuario):
         
         # Si es admin sin ID específico, mostrar todos los aspersores con info del usuario
         if id_usuario == 'all':
-            print("DEBUG - Admin viendo TODOS los aspersores")
             cursor.execute("""
                 SELECT a.id_aspersor, a.nombre, a.ubicacion, a.estado, a.id_usuario, a.camera_url, u.nombre as nombre_usuario
                 FROM aspersores a
@@ -1385,7 +1818,6 @@ def aspersores(id_usuario):
             aspersores = cursor.fetchall()
             mostrar_todos = True
         else:
-            print(f"DEBUG - Mostrando aspersores del usuario {id_usuario}")
             cursor.execute("""
                 SELECT a.id_aspersor, a.nombre, a.ubicacion, a.estado, a.id_usuario, a.camera_url, u.nombre as nombre_usuario
                 FROM aspersores a
@@ -1399,7 +1831,7 @@ def aspersores(id_usuario):
         cursor.close()
         connection.close()
 
-        print(f"DEBUG - Se encontraron {len(aspersores)} aspersores")
+        log.debug("Aspersores encontrados: %d", len(aspersores))
 
         id_usuario_visto = None if mostrar_todos else id_usuario
         return render_template('sprinklers.html',
@@ -1418,6 +1850,29 @@ def aspersores(id_usuario):
         flash('Error al obtener los aspersores.', 'error')
         return redirect(url_for('aspersores'))
 
+def aspersores_changed(id_aspersor=None):
+    """Se creó, editó o eliminó (id_aspersor) una pecera: invalida el mapa de dispositivos aquí y en los demás procesos."""
+    device_registry.invalidate()
+    if id_aspersor is not None:
+        forget_aspersor(id_aspersor)
+    send_live_update('aspersores', id_aspersor)
+
+
+def forget_aspersor(id_aspersor, propagate=True):
+    """Quita de memoria el estado de una pecera eliminada."""
+    global default_aspersor_id
+    try:
+        id_aspersor = int(id_aspersor)
+    except (TypeError, ValueError):
+        return
+    latest_store.forget(id_aspersor)
+    schedule_executor.forget_aspersor(id_aspersor)
+    # ON DELETE CASCADE borró sus lecturas y programaciones; sus rollups se borran junto con la pecera
+    table_watermarks.bump(*SENSOR_TABLE_COLUMNS, 'lecturas_rollup', 'programaciones_riego', propagate=propagate)
+    if default_aspersor_id == id_aspersor:
+        default_aspersor_id = None
+
+
 @app.route('/eliminar_aspersor', methods=['POST'])
 def eliminar_aspersor():
     if 'id_usuario' in session:  # Verificar si el usuario está autenticado
@@ -1433,11 +1888,14 @@ def eliminar_aspersor():
             try:
                 # Eliminar el aspersor
                 cursor = connection.cursor()
+                # lecturas_rollup no tiene FOREIGN KEY: se borra en la misma transacción
+                cursor.execute("DELETE FROM lecturas_rollup WHERE id_aspersor = ?", (id_aspersor,))
                 cursor.execute("""
                     DELETE FROM aspersores
                     WHERE id_aspersor = ? 
                 """, (id_aspersor,))
                 connection.commit()
+                aspersores_changed(id_aspersor)
                 cursor.close()
                 connection.close()
 
@@ -1480,7 +1938,14 @@ def actualizar_aspersor():
             """,
             (nombre, ubicacion, camera_url, id_aspersor)
         )
+        if 'device_id' in payload:
+            # Solo si el formulario lo envía; vacío = quitar el dispositivo
+            cursor.execute(
+                "UPDATE aspersores SET device_id = ? WHERE id_aspersor = ?",
+                ((payload.get('device_id') or '').strip() or None, id_aspersor)
+            )
         connection.commit()
+        aspersores_changed()
         cursor.close()
         connection.close()
         return jsonify({"success": True, "message": "Aspersor actualizado exitosamente."})
@@ -1498,7 +1963,7 @@ def actualizar_estado_aspersor():
         connection = get_db_connection()
         if connection:
             cursor = connection.cursor()
-            print((nuevo_estado,aspersor_id))
+            log.debug("Cambio de estado de aspersor", extra={'id_aspersor': aspersor_id, 'estado': nuevo_estado})
             cursor.execute("UPDATE aspersores SET estado = ? WHERE id_aspersor = ?", (nuevo_estado, aspersor_id))
             connection.commit()
             cursor.close()
@@ -1524,11 +1989,19 @@ def eliminar_usuario():
             try:
                 # Eliminar el usuario
                 cursor = connection.cursor()
+                cursor.execute(
+                    "SELECT id_aspersor FROM aspersores WHERE id_usuario = ?", (id_usuario_a_eliminar,)
+                )
+                peceras = [row['id_aspersor'] for row in cursor.fetchall()]
+                cursor.executemany("DELETE FROM lecturas_rollup WHERE id_aspersor = ?", [(p,) for p in peceras])
                 cursor.execute("""
                     DELETE FROM usuarios
                     WHERE id_usuario = ?
                 """, (id_usuario_a_eliminar,))
                 connection.commit()
+                # ON DELETE CASCADE (foreign_keys=ON en db._configure) alcanza sus peceras, lecturas y programaciones
+                for id_aspersor in peceras:
+                    aspersores_changed(id_aspersor)
                 cursor.close()
                 connection.close()
 
@@ -1543,10 +2016,33 @@ def eliminar_usuario():
 
 
 # API para control de motores (sin MQTT, usando Serial o HTTP directo)
-# Configuración del puerto Serial (Ajustar COM según corresponda)
-SERIAL_PORT = 'COM6'
-BAUD_RATE = 9600
-arduino_serial = None
+# El enlace Serial vive en serial_link.py: un hilo propio abre el puerto, escribe
+# la cola de comandos y lee las respuestas (pyserial se importa en el primer uso)
+
+def handle_serial_reading(sensor_type, values):
+    """Respuesta o lectura del Arduino por Serial -> mismo snapshot que las lecturas MQTT."""
+    if sensor_type not in SENSOR_FIELDS:
+        log.warning("Serial sensor desconocido: %s", sensor_type)
+        return
+    aspersor_id = SERIAL_ASPERSOR_ID or ensure_default_aspersor()
+    if aspersor_id is None:
+        return
+    # Las respuestas traen un solo campo (p. ej. el servo): se completa con el último valor conocido
+    snapshot = latest_store.snapshot(aspersor_id)
+    current = snapshot.sensors.get(sensor_type) if snapshot else None
+    merged = {field: current.data.get(field) if current else None for field in SENSOR_FIELDS[sensor_type]}
+    merged.update((field, value) for field, value in values.items() if field in merged)
+    if sensor_type != 'sistema':
+        sensor_write_queue.start()
+    handle_sensor_values(aspersor_id, sensor_type, merged, datetime.now(timezone.utc))
+
+
+serial_transport = SerialTransport(
+    SERIAL_PORT,
+    SERIAL_BAUD_RATE,
+    on_reading=handle_serial_reading,
+    ack_timeout=SERIAL_ACK_TIMEOUT
+)
 
 CATCHER_COMMAND_TYPES = {
     'AUTOMATICO',
@@ -1574,90 +2070,40 @@ CATCHER_SAFETY_COMMANDS = [
     'CANCELAR'
 ]
 
-def init_serial_connection():
-    global arduino_serial
-    try:
-        if arduino_serial is None or not arduino_serial.is_open:
-            arduino_serial = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
-            time.sleep(2) # Esperar a que el Arduino se reinicie
-            print(f"Conexión Serial establecida en {SERIAL_PORT}")
-    except Exception as e:
-        print(f"No se pudo conectar al puerto Serial {SERIAL_PORT}: {e}")
+def publish_catcher_command(payload, topic=None):
+    """Encola el comando hacia AquaZen/catcher (o el tópico dado). Devuelve su estado (pendiente, error...)."""
+    start_mqtt_listener()
+    command = catcher_dispatcher.submit(payload, topic=topic)
+    if command['estado'] != 'error':
+        mqtt_log.info("MQTT comando enviado", extra={'topic': command['topic'], 'payload': payload, 'command_id': command['id']})
+    return command
 
-# Intentar conectar al inicio (opcional, o hacerlo en la primera petición)
-# init_serial_connection()
 
-def send_serial_command(command):
-    global arduino_serial
-    try:
-        # Asegurar conexión
-        if arduino_serial is None or not arduino_serial.is_open:
-            init_serial_connection()
-            
-        if arduino_serial and arduino_serial.is_open:
-            arduino_serial.write(f"{command}\n".encode())
-            print(f"Comando Serial enviado: {command}")
-            return True
-        else:
-            print("Puerto Serial no disponible")
-            return False
-    except serial.SerialException as e:
-        print(f"Error Serial: {e}")
-        # Intentar cerrar para reiniciar en la próxima
-        if arduino_serial:
-            try:
-                arduino_serial.close()
-            except:
-                pass
-        arduino_serial = None
-        return False
-    except Exception as e:
-        print(f"Error inesperado en Serial: {e}")
-        return False
+def catcher_topic_for(aspersor_id):
+    """Tópico de comandos de una pecera, o None si ya no existe.
 
-def get_active_mqtt_client():
-    """Garantiza que el cliente MQTT esté conectado antes de publicar."""
-    client = start_mqtt_listener()
-    if client is None:
-        print("MQTT: cliente no inicializado")
+    La pecera por defecto sin device_id es el firmware que publica en el tópico
+    base, así que escucha en AquaZen/catcher. El resto recibe por
+    AquaZen/<device_id>/catcher, o AquaZen/<id_aspersor>/catcher si no tiene
+    device_id (la misma regla con la que se enrutan sus lecturas).
+    """
+    connection = get_db_connection()
+    if not connection:
         return None
-
     try:
-        is_connected = client.is_connected()
-    except AttributeError:
-        is_connected = True
-
-    if not is_connected:
-        try:
-            client.reconnect()
-            print("MQTT reconectado para comando de actuadores")
-        except Exception as e:
-            print(f"MQTT no pudo reconectar: {e}")
-            return None
-
-    return client
-
-def publish_catcher_command(payload):
-    """Publica comandos hacia AquaZen/catcher."""
-    client = get_active_mqtt_client()
-    if client is None:
-        return False
-
-    try:
-        info = client.publish(MQTT_TOPIC_CATCHER, json.dumps(payload), qos=1)
-        if hasattr(info, 'wait_for_publish'):
-            info.wait_for_publish()
-
-        rc = info[0] if isinstance(info, tuple) else getattr(info, 'rc', mqtt.MQTT_ERR_SUCCESS)
-        success = (rc == mqtt.MQTT_ERR_SUCCESS)
-        if success:
-            print(f"MQTT comando enviado a {MQTT_TOPIC_CATCHER}: {payload}")
-        else:
-            print(f"MQTT fallo al publicar en {MQTT_TOPIC_CATCHER}: rc={rc}")
-        return success
-    except Exception as e:
-        print(f"MQTT error publicando en {MQTT_TOPIC_CATCHER}: {e}")
-        return False
+        cursor = connection.cursor()
+        cursor.execute("SELECT device_id FROM aspersores WHERE id_aspersor = ?", (aspersor_id,))
+        row = cursor.fetchone()
+        cursor.close()
+    finally:
+        connection.close()
+    if row is None:
+        return None
+    if row['device_id']:
+        return device_topic(MQTT_TOPIC_CATCHER, row['device_id'])
+    if aspersor_id == ensure_default_aspersor():
+        return MQTT_TOPIC_CATCHER
+    return device_topic(MQTT_TOPIC_CATCHER, aspersor_id)
 
 
 def build_catcher_payload(data):
@@ -1713,10 +2159,76 @@ def catcher_command():
     except ValueError as exc:
         return jsonify({"success": False, "error": str(exc)}), 400
 
-    success = publish_catcher_command(payload)
-    if success:
-        return jsonify({"success": True, "message": f"Comando {payload['tipo']} enviado"})
-    return jsonify({"success": False, "error": "No se pudo enviar comando MQTT"}), 500
+    command = publish_catcher_command(payload)
+    if command['estado'] == 'error':
+        return jsonify({"success": False, "error": "No se pudo enviar comando MQTT", "command": command}), 500
+    return jsonify({
+        "success": True,
+        "message": f"Comando {payload['tipo']} enviado",
+        "command_id": command['id'],
+        "estado": command['estado'],
+        "url_estado": url_for('catcher_command_status', command_id=command['id'])
+    }), 202
+
+
+@app.route('/api/catcher_command/<command_id>', methods=['GET'])
+def catcher_command_status(command_id):
+    """Estado del comando: pendiente, confirmado (PUBACK recibido), expirado o error."""
+    command = catcher_dispatcher.get(command_id)
+    if not command:
+        return jsonify({"error": "Comando no encontrado"}), 404
+    return jsonify(command)
+
+
+@app.route('/api/catcher_command/stats', methods=['GET'])
+def catcher_command_stats():
+    return jsonify(catcher_dispatcher.stats())
+
+
+def fire_schedule(accion, programacion):
+    """Comando del catcher al inicio y al fin de una programación de riego.
+
+    El inicio activa SCHEDULE_EVENT sin duración (-1) y el fin lo cancela: la
+    duración del firmware es un int en milisegundos y no alcanza para minutos.
+    Ambos van solo al tópico de la pecera de la programación; si la pecera ya
+    no existe el disparo se omite. El fin usa el tópico con que salió el inicio,
+    así llega aunque la pecera se haya borrado con la bomba encendida.
+    """
+    topic = programacion.get('topic') if accion != ACCION_INICIO else None
+    topic = topic or catcher_topic_for(programacion['id_aspersor'])
+    if topic is None:
+        log.warning("Programación sin pecera a la que enviar el comando", extra={
+            'id_programacion': programacion['id_programacion'], 'id_aspersor': programacion['id_aspersor']
+        })
+        return {'id': None, 'estado': 'omitido'}
+    if accion == ACCION_INICIO:
+        payload = {"tipo": "EXCEPCIONAL", "evento": SCHEDULE_EVENT, "duracion": -1, "hora": 0}
+    else:
+        payload = {"tipo": "CANCELAR", "evento": SCHEDULE_EVENT}
+    payload['id_programacion'] = programacion['id_programacion']
+    command = publish_catcher_command(payload, topic=topic)
+    if accion == ACCION_INICIO:
+        programacion['topic'] = topic
+    return command
+
+
+# Programaciones de riego: heap en memoria, recargado por id al crear o borrar
+schedule_executor = ScheduleExecutor(get_db_connection, fire_schedule, misfire_grace=SCHEDULE_MISFIRE_GRACE)
+
+
+def schedules_changed(id_programacion):
+    """Se creó o borró una programación: la recarga el proceso que ejecuta las programaciones."""
+    if schedule_executor.running:
+        schedule_executor.reload(id_programacion)
+    else:
+        # Modo service: el ejecutor vive en ingest_service.py
+        send_live_update('schedules', id_programacion)
+
+
+@app.route('/api/schedules/stats', methods=['GET'])
+def schedules_stats():
+    """Programaciones pendientes, próximo disparo y retraso de los disparos recientes."""
+    return jsonify(schedule_executor.stats())
 
 @app.route('/api/cambiar_modo_motor', methods=['POST'])
 def cambiar_modo_motor():
@@ -1725,21 +2237,50 @@ def cambiar_modo_motor():
         id_aspersor = data.get('id_aspersor')
         modo = data.get('modo') # 'manual', 'auto'
         
-        print(f"Cambio de modo: Aspersor {id_aspersor} -> {modo}")
+        log.info("Cambio de modo", extra={'id_aspersor': id_aspersor, 'modo': modo})
         
         # Protocolo: AUTO o MANUAL
         command = "AUTO" if modo == 'auto' else "MANUAL"
         
-        success = send_serial_command(command)
-        
-        if success:
-            return jsonify({"success": True, "message": f"Modo cambiado a {modo}"})
+        # Se espera la respuesta unos milisegundos; si no llega, se consulta después por url_estado
+        result = serial_transport.submit(command, wait=SERIAL_ACK_WAIT)
+        estado = result['estado']
+        body = {
+            "command_id": result['id'],
+            "estado": estado,
+            "acknowledged": estado == 'confirmado',
+            "url_estado": url_for('serial_command_status', command_id=result['id'])
+        }
+
+        if estado == 'confirmado':
+            return jsonify(dict(body, success=True, message=f"Modo cambiado a {modo}", respuesta=result['respuesta']))
+        elif estado == 'pendiente':
+            return jsonify(dict(body, success=True, message=f"Comando {command} enviado, sin confirmar")), 202
+        elif estado == ESTADO_RECHAZADO:
+            return jsonify(dict(body, success=False, error=result['error'])), 409
+        elif estado == 'expirado':
+            return jsonify(dict(body, success=False, error=result['error'])), 504
         else:
-            return jsonify({"success": False, "error": "No se pudo conectar con el Arduino (Serial Error)"}), 500
+            return jsonify(dict(body, success=False, error=f"No se pudo conectar con el Arduino (Serial Error): {result['error']}")), 503
         
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+
+@app.route('/api/serial_command/<command_id>', methods=['GET'])
+def serial_command_status(command_id):
+    """Estado del comando Serial: pendiente, confirmado, rechazado, expirado o error."""
+    command = serial_transport.get(command_id)
+    if not command:
+        return jsonify({"error": "Comando no encontrado"}), 404
+    return jsonify(command)
+
+
+@app.route('/api/serial/stats', methods=['GET'])
+def serial_stats():
+    """Estado del enlace Serial, cola de comandos y latencia de las respuestas."""
+    return jsonify(serial_transport.stats())
+
 @app.route('/camara/<int:id_aspersor>')
 def camara(id_aspersor):
     if 'id_usuario' not in session:
@@ -1763,803 +2304,110 @@ def camara(id_aspersor):
     return render_template('camera.html', aspersor=aspersor)
 
 
+def _report_job_for_session(job_id):
+    job = report_jobs.get(job_id)
+    if not job or job['id_usuario'] != session['id_usuario']:
+        return None
+    return job
+
+
+@app.route('/api/reportes', methods=['POST'])
+def crear_reporte():
+    """Encola la generación del reporte PDF y devuelve el id del trabajo."""
+    if 'id_usuario' not in session:
+        return jsonify({"error": "No autorizado"}), 401
+
+    data = request.get_json(silent=True) or {}
+    dias = data.get('dias', request.args.get('dias', 30))
+    try:
+        dias = int(dias)
+    except (TypeError, ValueError):
+        return jsonify({"error": "dias debe ser un entero"}), 400
+    if dias < 1 or dias > 3650:
+        return jsonify({"error": "dias fuera de rango"}), 400
+
+    try:
+        job = report_jobs.submit(
+            session['id_usuario'],
+            session.get('tipo_usuario', 'usuario'),
+            session.get('nombre_usuario', 'Usuario'),
+            dias
+        )
+    except Exception as e:
+        print(f"Error al encolar reporte: {e}")
+        return jsonify({"error": "No se pudo encolar el reporte"}), 503
+
+    job['url_estado'] = url_for('estado_reporte', job_id=job['job_id'])
+    job['url_descarga'] = url_for('descargar_reporte', job_id=job['job_id'])
+    return jsonify(job), 200 if job['estado'] == 'listo' else 202
+
+
+@app.route('/api/reportes/<job_id>')
+def estado_reporte(job_id):
+    if 'id_usuario' not in session:
+        return jsonify({"error": "No autorizado"}), 401
+    job = _report_job_for_session(job_id)
+    if not job:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    job['url_descarga'] = url_for('descargar_reporte', job_id=job_id)
+    return jsonify(job)
+
+
+@app.route('/api/reportes/<job_id>/descargar')
+def descargar_reporte(job_id):
+    if 'id_usuario' not in session:
+        return redirect(url_for('login'))
+    job = _report_job_for_session(job_id)
+    if not job:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    if job['estado'] != 'listo':
+        return jsonify({"error": "El reporte aún no está listo", "estado": job['estado']}), 409
+    path = report_jobs.pdf_path(job_id)
+    if not path:
+        # Expulsado de la caché: el cliente debe volver a pedirlo
+        return jsonify({"error": "El reporte expiró, genera uno nuevo"}), 410
+    return send_file(
+        os.path.abspath(path),
+        as_attachment=True,
+        download_name=report_filename(job['tipo_usuario']),
+        mimetype='application/pdf'
+    )
+
+
+@app.route('/api/reportes/stats')
+def report_jobs_stats():
+    if 'id_usuario' not in session:
+        return jsonify({"error": "No autorizado"}), 401
+    return jsonify(report_jobs.stats())
+
+
 @app.route('/generar_reporte')
 def generar_reporte():
+    """Compatibilidad: genera (o toma de la caché) el reporte y lo descarga en la misma petición."""
     if 'id_usuario' not in session:
         return redirect(url_for('login'))
-    
+
     dias = request.args.get('dias', 30, type=int)
-    
-    # Obtener información del usuario actual
-    id_usuario = session['id_usuario']
-    tipo_usuario = session.get('tipo_usuario', 'usuario')
-    nombre_usuario = session.get('nombre_usuario', 'Usuario')
-    es_admin = (tipo_usuario == 'admin')
-    
-    # Crear buffer para el PDF
-    buffer = io.BytesIO()
-    
-    # Crear documento PDF
-    doc = SimpleDocTemplate(buffer, pagesize=A4, 
-                           rightMargin=50, leftMargin=50, 
-                           topMargin=40, bottomMargin=40)
-    
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Estilos personalizados
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=22,
-        spaceAfter=20,
-        textColor=colors.HexColor('#0891b2'),
-        alignment=1
-    )
-    
-    subtitle_style = ParagraphStyle(
-        'Subtitle',
-        parent=styles['Normal'],
-        fontSize=11,
-        textColor=colors.gray,
-        alignment=1
-    )
-    
-    section_style = ParagraphStyle(
-        'SectionTitle',
-        parent=styles['Heading2'],
-        fontSize=14,
-        spaceBefore=15,
-        spaceAfter=10,
-        textColor=colors.HexColor('#0e7490'),
-    )
-    
-    normal_style = ParagraphStyle(
-        'NormalText',
-        parent=styles['Normal'],
-        fontSize=10,
-        spaceAfter=6,
-    )
-    
-    alert_style = ParagraphStyle(
-        'AlertText',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.HexColor('#dc2626'),
-        spaceAfter=4,
-    )
-    
-    success_style = ParagraphStyle(
-        'SuccessText',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.HexColor('#059669'),
-        spaceAfter=4,
-    )
-    
-    warning_style = ParagraphStyle(
-        'WarningText',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.HexColor('#d97706'),
-        spaceAfter=4,
-    )
-    
-    # ═══════════════════════════════════════════════════════════════
-    # PORTADA
-    # ═══════════════════════════════════════════════════════════════
-    elements.append(Spacer(1, 50))
-    elements.append(Paragraph("🐟 REPORTE TÉCNICO AQUAZEN", title_style))
-    elements.append(Paragraph("Sistema Inteligente de Monitoreo de Peceras", subtitle_style))
-    elements.append(Spacer(1, 20))
-    elements.append(Paragraph(f"Período de Análisis: Últimos {dias} días", subtitle_style))
-    elements.append(Paragraph(f"Fecha de Generación: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}", subtitle_style))
-    elements.append(Paragraph(f"Usuario: {nombre_usuario}", subtitle_style))
-    elements.append(Paragraph(f"Tipo de Reporte: {'Administrador (Completo)' if es_admin else 'Personal'}", subtitle_style))
-    elements.append(Spacer(1, 30))
-    
-    # Contenido del reporte
-    elements.append(Paragraph("📋 Contenido del Reporte:", normal_style))
-    
-    if es_admin:
-        contenido_items = [
-            "• Resumen de todas las peceras del sistema",
-            "• Gráficas de tendencias de todos los sensores",
-            "• Análisis estadístico completo",
-            "• Monitoreo de temperatura y nivel",
-            "• Análisis de calidad del agua",
-            "• Alertas y recomendaciones técnicas",
-            "• Diagnóstico completo del sistema",
-            "• Histórico por período seleccionado",
-            "• Vista de todos los usuarios (solo admin)"
-        ]
-    else:
-        contenido_items = [
-            "• Resumen de mis peceras",
-            "• Gráficas de tendencias de mis sensores",
-            "• Análisis estadístico de mis peceras",
-            "• Monitoreo de temperatura y nivel",
-            "• Análisis de calidad del agua",
-            "• Alertas y recomendaciones técnicas",
-            "• Diagnóstico de mis peceras",
-            "• Histórico por período seleccionado"
-        ]
-    for item in contenido_items:
-        elements.append(Paragraph(item, normal_style))
-    
-    elements.append(Spacer(1, 30))
-    elements.append(Paragraph("─" * 70, subtitle_style))
-    
-    # Conexión a BD para obtener datos
-    connection = get_db_connection()
-    alertas = []
-    recomendaciones = []
-    
-    # Variables para almacenar datos de gráficas
-    humedad_data = []
-    temp_data = []
-    nivel_data = []
-    calidad_data = []
-    fechas_humedad = []
-    fechas_nivel = []
-    fechas_calidad = []
-    
-    if connection:
-        cursor = connection.cursor()
-        fecha_inicio = datetime.now() - timedelta(days=dias)
-        fecha_inicio_str = fecha_inicio.strftime('%Y-%m-%d %H:%M:%S')
-        
-        # Obtener IDs de peceras del usuario (solo sus peceras si no es admin)
-        if es_admin:
-            cursor.execute("SELECT id_aspersor FROM aspersores")
-        else:
-            cursor.execute("SELECT id_aspersor FROM aspersores WHERE id_usuario = ?", (id_usuario,))
-        mis_peceras = [row['id_aspersor'] for row in cursor.fetchall()]
-        
-        # Si el usuario no tiene peceras, mostrar mensaje
-        if not mis_peceras:
-            elements.append(Paragraph("⚠️ No tienes peceras registradas en el sistema.", warning_style))
-            elements.append(Spacer(1, 20))
-        
-        # Crear placeholder para consultas (para filtrar por peceras del usuario)
-        placeholders = ','.join('?' * len(mis_peceras)) if mis_peceras else '0'
-        
-        # ═══════════════════════════════════════════════════════════════
-        # OBTENER DATOS PARA GRÁFICAS (filtrados por peceras del usuario)
-        # ═══════════════════════════════════════════════════════════════
-        
-        # Datos de humedad/temperatura para gráficas
-        if mis_peceras:
-            cursor.execute(f"""
-                SELECT fecha_hora, humedad, raw as temperatura
-                FROM lecturas_humedad
-                WHERE fecha_hora >= ? AND id_aspersor IN ({placeholders})
-                ORDER BY fecha_hora ASC
-                LIMIT 50
-            """, (fecha_inicio_str, *mis_peceras))
-        else:
-            cursor.execute("""
-                SELECT fecha_hora, humedad, raw as temperatura
-                FROM lecturas_humedad
-                WHERE 1=0
-            """)
-        lecturas_hum = cursor.fetchall()
-        for lectura in lecturas_hum:
-            if lectura['fecha_hora']:
-                fechas_humedad.append(lectura['fecha_hora'])
-                humedad_data.append(lectura['humedad'] if lectura['humedad'] else 0)
-                temp_data.append(lectura['temperatura'] if lectura['temperatura'] else 0)
-        
-        # Datos de nivel de agua para gráficas
-        if mis_peceras:
-            cursor.execute(f"""
-                SELECT fecha_hora, nivel
-                FROM lecturas_ultrasonico
-                WHERE fecha_hora >= ? AND id_aspersor IN ({placeholders})
-                ORDER BY fecha_hora ASC
-                LIMIT 50
-            """, (fecha_inicio_str, *mis_peceras))
-        else:
-            cursor.execute("""
-                SELECT fecha_hora, nivel
-                FROM lecturas_ultrasonico
-                WHERE 1=0
-            """)
-        lecturas_niv = cursor.fetchall()
-        for lectura in lecturas_niv:
-            if lectura['fecha_hora']:
-                fechas_nivel.append(lectura['fecha_hora'])
-                nivel_data.append(lectura['nivel'] if lectura['nivel'] else 0)
-        
-        # Datos de calidad para gráficas
-        if mis_peceras:
-            cursor.execute(f"""
-                SELECT fecha_hora, calidad
-                FROM lecturas_calidad
-                WHERE fecha_hora >= ? AND id_aspersor IN ({placeholders})
-                ORDER BY fecha_hora ASC
-                LIMIT 50
-            """, (fecha_inicio_str, *mis_peceras))
-        else:
-            cursor.execute("""
-                SELECT fecha_hora, calidad
-                FROM lecturas_calidad
-                WHERE 1=0
-            """)
-        lecturas_cal = cursor.fetchall()
-        for lectura in lecturas_cal:
-            if lectura['fecha_hora']:
-                fechas_calidad.append(lectura['fecha_hora'])
-                calidad_data.append(lectura['calidad'] if lectura['calidad'] else 0)
-        
-        # ═══════════════════════════════════════════════════════════════
-        # SECCIÓN 1: RESUMEN DE PECERAS
-        # ═══════════════════════════════════════════════════════════════
-        if es_admin:
-            elements.append(Paragraph("📊 1. RESUMEN DE TODAS LAS PECERAS (ADMIN)", section_style))
-            cursor.execute("""
-                SELECT a.nombre, a.ubicacion, a.estado, u.nombre as propietario
-                FROM aspersores a
-                LEFT JOIN usuarios u ON a.id_usuario = u.id_usuario
-            """)
-        else:
-            elements.append(Paragraph("📊 1. RESUMEN DE MIS PECERAS", section_style))
-            cursor.execute("""
-                SELECT a.nombre, a.ubicacion, a.estado, u.nombre as propietario
-                FROM aspersores a
-                LEFT JOIN usuarios u ON a.id_usuario = u.id_usuario
-                WHERE a.id_usuario = ?
-            """, (id_usuario,))
-        peceras = cursor.fetchall()
-        
-        activas = sum(1 for p in peceras if p['estado'] == 'activo')
-        inactivas = len(peceras) - activas
-        
-        if es_admin:
-            elements.append(Paragraph(f"Total de peceras en el sistema: {len(peceras)}", normal_style))
-        else:
-            elements.append(Paragraph(f"Total de tus peceras: {len(peceras)}", normal_style))
-        elements.append(Paragraph(f"Peceras activas: {activas} | Peceras inactivas: {inactivas}", normal_style))
-        elements.append(Spacer(1, 10))
-        
-        if peceras:
-            if es_admin:
-                # Admin ve todas las columnas incluyendo propietario
-                data = [['Nombre', 'Ubicación', 'Estado', 'Propietario']]
-                for p in peceras:
-                    estado = 'Activo' if p['estado'] == 'activo' else 'Inactivo'
-                    data.append([p['nombre'], p['ubicacion'], estado, p['propietario'] or 'N/A'])
-                col_widths = [110, 130, 70, 110]
-            else:
-                # Usuario normal no necesita ver propietario (es él mismo)
-                data = [['Nombre', 'Ubicación', 'Estado']]
-                for p in peceras:
-                    estado = 'Activo' if p['estado'] == 'activo' else 'Inactivo'
-                    data.append([p['nombre'], p['ubicacion'] or 'N/A', estado])
-                col_widths = [150, 180, 90]
-            
-            table = Table(data, colWidths=col_widths)
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0891b2')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#f0fdfa')),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#67e8f9')),
-                ('FONTSIZE', (0, 1), (-1, -1), 9),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ]))
-            elements.append(table)
-        
-        if inactivas > 0:
-            alertas.append(f"Hay {inactivas} pecera(s) inactiva(s) que requieren revisión")
-        
-        elements.append(Spacer(1, 20))
-        
-        # ═══════════════════════════════════════════════════════════════
-        # SECCIÓN 2: GRÁFICAS DE TENDENCIAS DE SENSORES
-        # ═══════════════════════════════════════════════════════════════
-        elements.append(Paragraph("📉 2. GRÁFICAS DE TENDENCIAS DE SENSORES", section_style))
-        elements.append(Paragraph("Visualización de datos de los sensores durante el período seleccionado.", normal_style))
-        elements.append(Spacer(1, 10))
-        
-        # Función auxiliar para crear gráficas
-        def crear_grafica(titulo, fechas, valores, color, ylabel, filename_prefix):
-            if not valores or len(valores) < 2:
-                return None
-            
-            fig, ax = plt.subplots(figsize=(7, 3))
-            
-            # Convertir fechas a índices si son strings
-            x_vals = range(len(valores))
-            
-            # Crear área bajo la curva
-            ax.fill_between(x_vals, valores, alpha=0.3, color=color)
-            ax.plot(x_vals, valores, color=color, linewidth=2, marker='o', markersize=3)
-            
-            ax.set_title(titulo, fontsize=12, fontweight='bold', color='#0891b2')
-            ax.set_ylabel(ylabel, fontsize=9)
-            ax.set_xlabel('Lecturas', fontsize=9)
-            ax.grid(True, alpha=0.3)
-            ax.set_facecolor('#f0fdfa')
-            fig.patch.set_facecolor('white')
-            
-            # Agregar línea de promedio
-            promedio = sum(valores) / len(valores)
-            ax.axhline(y=promedio, color='red', linestyle='--', alpha=0.5, label=f'Promedio: {promedio:.1f}')
-            ax.legend(fontsize=8)
-            
-            # Guardar en buffer
-            img_buffer = io.BytesIO()
-            plt.savefig(img_buffer, format='png', dpi=100, bbox_inches='tight')
-            img_buffer.seek(0)
-            plt.close(fig)
-            
-            return img_buffer
-        
-        # Gráfica 1: Temperatura
-        if temp_data and len(temp_data) >= 2:
-            elements.append(Paragraph("Gráfica de Temperatura:", styles['Heading3']))
-            img_temp = crear_grafica("Tendencia de Temperatura", fechas_humedad, temp_data, '#f59e0b', 'Temperatura (°C)', 'temp')
-            if img_temp:
-                elements.append(Image(img_temp, width=450, height=180))
-            elements.append(Spacer(1, 10))
-        
-        # Gráfica 2: Humedad
-        if humedad_data and len(humedad_data) >= 2:
-            elements.append(Paragraph("Gráfica de Humedad:", styles['Heading3']))
-            img_hum = crear_grafica("Tendencia de Humedad", fechas_humedad, humedad_data, '#3b82f6', 'Humedad (%)', 'hum')
-            if img_hum:
-                elements.append(Image(img_hum, width=450, height=180))
-            elements.append(Spacer(1, 10))
-        
-        # Gráfica 3: Nivel de Agua
-        if nivel_data and len(nivel_data) >= 2:
-            elements.append(Paragraph("Gráfica de Nivel de Agua:", styles['Heading3']))
-            img_nivel = crear_grafica("Tendencia de Nivel de Agua", fechas_nivel, nivel_data, '#22c55e', 'Nivel (cm)', 'nivel')
-            if img_nivel:
-                elements.append(Image(img_nivel, width=450, height=180))
-            elements.append(Spacer(1, 10))
-        
-        # Gráfica 4: Calidad del Agua
-        if calidad_data and len(calidad_data) >= 2:
-            elements.append(Paragraph("Gráfica de Calidad del Agua:", styles['Heading3']))
-            img_cal = crear_grafica("Tendencia de Calidad del Agua", fechas_calidad, calidad_data, '#ec4899', 'Calidad', 'calidad')
-            if img_cal:
-                elements.append(Image(img_cal, width=450, height=180))
-            elements.append(Spacer(1, 10))
-        
-        # Mensaje si no hay datos para gráficas
-        if not (temp_data or humedad_data or nivel_data or calidad_data):
-            elements.append(Paragraph("⚠️ No hay suficientes datos para generar gráficas en el período seleccionado.", warning_style))
-        
-        elements.append(Spacer(1, 20))
-        
-        # ═══════════════════════════════════════════════════════════════
-        # SECCIÓN 3: ANÁLISIS ESTADÍSTICO COMPLETO
-        # ═══════════════════════════════════════════════════════════════
-        if es_admin:
-            elements.append(Paragraph("📈 3. ANÁLISIS ESTADÍSTICO COMPLETO (ADMIN)", section_style))
-        else:
-            elements.append(Paragraph("📈 3. ANÁLISIS ESTADÍSTICO DE MIS PECERAS", section_style))
-        
-        # Obtener datos de sensores (humedad/temperatura) - filtrados por peceras
-        if mis_peceras:
-            cursor.execute(f"""
-                SELECT AVG(humedad) as promedio, MIN(humedad) as minimo, MAX(humedad) as maximo, 
-                       COUNT(*) as lecturas, 
-                       AVG(raw) as temp_promedio, MIN(raw) as temp_min, MAX(raw) as temp_max
-                FROM lecturas_humedad
-                WHERE fecha_hora >= ? AND id_aspersor IN ({placeholders})
-            """, (fecha_inicio_str, *mis_peceras))
-        else:
-            cursor.execute("""
-                SELECT NULL as promedio, NULL as minimo, NULL as maximo, 
-                       0 as lecturas, NULL as temp_promedio, NULL as temp_min, NULL as temp_max
-            """)
-        humedad_stats = cursor.fetchone()
-        
-        # Obtener datos de ultrasonido (nivel) - filtrados por peceras
-        if mis_peceras:
-            cursor.execute(f"""
-                SELECT AVG(nivel) as promedio, MIN(nivel) as minimo, MAX(nivel) as maximo, COUNT(*) as lecturas
-                FROM lecturas_ultrasonico
-                WHERE fecha_hora >= ? AND id_aspersor IN ({placeholders})
-            """, (fecha_inicio_str, *mis_peceras))
-        else:
-            cursor.execute("""
-                SELECT NULL as promedio, NULL as minimo, NULL as maximo, 0 as lecturas
-            """)
-        nivel_stats = cursor.fetchone()
-        
-        # Obtener datos de calidad - filtrados por peceras
-        if mis_peceras:
-            cursor.execute(f"""
-                SELECT AVG(calidad) as promedio, MIN(calidad) as minimo, MAX(calidad) as maximo, COUNT(*) as lecturas
-                FROM lecturas_calidad
-                WHERE fecha_hora >= ? AND id_aspersor IN ({placeholders})
-            """, (fecha_inicio_str, *mis_peceras))
-        else:
-            cursor.execute("""
-                SELECT NULL as promedio, NULL as minimo, NULL as maximo, 0 as lecturas
-            """)
-        calidad_stats = cursor.fetchone()
-        
-        # Tabla de estadísticas
-        sensor_data = [['Sensor', 'Promedio', 'Mínimo', 'Máximo', 'Variación', 'Lecturas']]
-        
-        if humedad_stats and humedad_stats['lecturas'] and humedad_stats['lecturas'] > 0:
-            variacion_h = (humedad_stats['maximo'] - humedad_stats['minimo']) if humedad_stats['maximo'] and humedad_stats['minimo'] else 0
-            sensor_data.append([
-                'Humedad',
-                f"{humedad_stats['promedio']:.1f}%" if humedad_stats['promedio'] else 'N/A',
-                f"{humedad_stats['minimo']:.1f}%" if humedad_stats['minimo'] else 'N/A',
-                f"{humedad_stats['maximo']:.1f}%" if humedad_stats['maximo'] else 'N/A',
-                f"±{variacion_h:.1f}%",
-                str(humedad_stats['lecturas'])
-            ])
-            # Agregar temperatura si existe
-            if humedad_stats['temp_promedio']:
-                variacion_t = (humedad_stats['temp_max'] - humedad_stats['temp_min']) if humedad_stats['temp_max'] and humedad_stats['temp_min'] else 0
-                sensor_data.append([
-                    'Temperatura',
-                    f"{humedad_stats['temp_promedio']:.1f}°C" if humedad_stats['temp_promedio'] else 'N/A',
-                    f"{humedad_stats['temp_min']:.1f}°C" if humedad_stats['temp_min'] else 'N/A',
-                    f"{humedad_stats['temp_max']:.1f}°C" if humedad_stats['temp_max'] else 'N/A',
-                    f"±{variacion_t:.1f}°C",
-                    str(humedad_stats['lecturas'])
-                ])
-        
-        if nivel_stats and nivel_stats['lecturas'] and nivel_stats['lecturas'] > 0:
-            variacion_n = (nivel_stats['maximo'] - nivel_stats['minimo']) if nivel_stats['maximo'] and nivel_stats['minimo'] else 0
-            sensor_data.append([
-                'Nivel de Agua',
-                f"{nivel_stats['promedio']:.1f} cm" if nivel_stats['promedio'] else 'N/A',
-                f"{nivel_stats['minimo']:.1f} cm" if nivel_stats['minimo'] else 'N/A',
-                f"{nivel_stats['maximo']:.1f} cm" if nivel_stats['maximo'] else 'N/A',
-                f"±{variacion_n:.1f} cm",
-                str(nivel_stats['lecturas'])
-            ])
-            
-        if calidad_stats and calidad_stats['lecturas'] and calidad_stats['lecturas'] > 0:
-            variacion_c = (calidad_stats['maximo'] - calidad_stats['minimo']) if calidad_stats['maximo'] and calidad_stats['minimo'] else 0
-            sensor_data.append([
-                'Calidad Agua',
-                f"{calidad_stats['promedio']:.1f}" if calidad_stats['promedio'] else 'N/A',
-                f"{calidad_stats['minimo']:.1f}" if calidad_stats['minimo'] else 'N/A',
-                f"{calidad_stats['maximo']:.1f}" if calidad_stats['maximo'] else 'N/A',
-                f"±{variacion_c:.1f}",
-                str(calidad_stats['lecturas'])
-            ])
-        
-        if len(sensor_data) > 1:
-            table2 = Table(sensor_data, colWidths=[90, 70, 70, 70, 70, 60])
-            table2.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0e7490')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 9),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#ecfeff')),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#06b6d4')),
-                ('FONTSIZE', (0, 1), (-1, -1), 9),
-            ]))
-            elements.append(table2)
-        else:
-            elements.append(Paragraph("⚠️ No hay datos de sensores para el período seleccionado.", warning_style))
-            alertas.append("No se registraron lecturas de sensores en el período")
-        
-        elements.append(Spacer(1, 20))
-        
-        # ═══════════════════════════════════════════════════════════════
-        # SECCIÓN 4: MONITOREO DE TEMPERATURA Y NIVEL
-        # ═══════════════════════════════════════════════════════════════
-        elements.append(Paragraph("🌡️ 4. MONITOREO DE TEMPERATURA Y NIVEL", section_style))
-        
-        # Análisis de temperatura
-        elements.append(Paragraph("Análisis de Temperatura:", styles['Heading3']))
-        if humedad_stats and humedad_stats['temp_promedio']:
-            temp_prom = humedad_stats['temp_promedio']
-            if temp_prom < 22:
-                elements.append(Paragraph(f"⚠️ Temperatura promedio BAJA: {temp_prom:.1f}°C (Rango óptimo: 24-28°C)", warning_style))
-                alertas.append(f"Temperatura por debajo del rango óptimo: {temp_prom:.1f}°C")
-                recomendaciones.append("Considerar instalar un calentador de acuario")
-            elif temp_prom > 30:
-                elements.append(Paragraph(f"🔴 Temperatura promedio ALTA: {temp_prom:.1f}°C (Rango óptimo: 24-28°C)", alert_style))
-                alertas.append(f"Temperatura por encima del rango seguro: {temp_prom:.1f}°C")
-                recomendaciones.append("Mejorar ventilación o instalar enfriador")
-            else:
-                elements.append(Paragraph(f"✅ Temperatura promedio ÓPTIMA: {temp_prom:.1f}°C", success_style))
-        else:
-            elements.append(Paragraph("Sin datos de temperatura disponibles", normal_style))
-        
-        elements.append(Spacer(1, 10))
-        
-        # Análisis de nivel de agua
-        elements.append(Paragraph("Análisis de Nivel de Agua:", styles['Heading3']))
-        if nivel_stats and nivel_stats['promedio']:
-            nivel_prom = nivel_stats['promedio']
-            if nivel_prom < 10:
-                elements.append(Paragraph(f"🔴 Nivel de agua CRÍTICO: {nivel_prom:.1f} cm", alert_style))
-                alertas.append(f"Nivel de agua crítico: {nivel_prom:.1f} cm")
-                recomendaciones.append("Rellenar pecera urgentemente")
-            elif nivel_prom < 20:
-                elements.append(Paragraph(f"⚠️ Nivel de agua BAJO: {nivel_prom:.1f} cm", warning_style))
-                alertas.append(f"Nivel de agua bajo: {nivel_prom:.1f} cm")
-                recomendaciones.append("Programar relleno de agua")
-            else:
-                elements.append(Paragraph(f"✅ Nivel de agua ADECUADO: {nivel_prom:.1f} cm", success_style))
-        else:
-            elements.append(Paragraph("Sin datos de nivel de agua disponibles", normal_style))
-        
-        elements.append(Spacer(1, 20))
-        
-        # ═══════════════════════════════════════════════════════════════
-        # SECCIÓN 5: ANÁLISIS DE CALIDAD DEL AGUA
-        # ═══════════════════════════════════════════════════════════════
-        elements.append(Paragraph("💧 5. ANÁLISIS DE CALIDAD DEL AGUA", section_style))
-        
-        if calidad_stats and calidad_stats['promedio']:
-            calidad_prom = calidad_stats['promedio']
-            
-            # Escala de calidad (asumiendo 0-100 o similar)
-            if calidad_prom >= 80:
-                elements.append(Paragraph(f"✅ Calidad del agua EXCELENTE: {calidad_prom:.1f}/100", success_style))
-                elements.append(Paragraph("El agua presenta condiciones óptimas para los peces.", normal_style))
-            elif calidad_prom >= 60:
-                elements.append(Paragraph(f"✅ Calidad del agua BUENA: {calidad_prom:.1f}/100", success_style))
-                elements.append(Paragraph("El agua está en condiciones aceptables.", normal_style))
-            elif calidad_prom >= 40:
-                elements.append(Paragraph(f"⚠️ Calidad del agua REGULAR: {calidad_prom:.1f}/100", warning_style))
-                alertas.append(f"Calidad del agua en nivel regular: {calidad_prom:.1f}")
-                recomendaciones.append("Realizar cambio parcial de agua (25-30%)")
-                elements.append(Paragraph("Se recomienda realizar mantenimiento preventivo.", normal_style))
-            else:
-                elements.append(Paragraph(f"🔴 Calidad del agua DEFICIENTE: {calidad_prom:.1f}/100", alert_style))
-                alertas.append(f"Calidad del agua crítica: {calidad_prom:.1f}")
-                recomendaciones.append("Cambio de agua urgente (50%)")
-                recomendaciones.append("Verificar filtros y sistema de oxigenación")
-                elements.append(Paragraph("¡ATENCIÓN! Se requiere intervención inmediata.", normal_style))
-            
-            elements.append(Spacer(1, 10))
-            
-            # Parámetros detallados
-            elements.append(Paragraph("Parámetros registrados:", styles['Heading3']))
-            params_data = [
-                ['Parámetro', 'Valor', 'Estado'],
-                ['Calidad General', f"{calidad_prom:.1f}", 'Óptimo' if calidad_prom >= 60 else 'Revisar'],
-                ['Lecturas en período', str(calidad_stats['lecturas']), 'OK'],
-                ['Valor máximo', f"{calidad_stats['maximo']:.1f}" if calidad_stats['maximo'] else 'N/A', '-'],
-                ['Valor mínimo', f"{calidad_stats['minimo']:.1f}" if calidad_stats['minimo'] else 'N/A', '-'],
-            ]
-            
-            table3 = Table(params_data, colWidths=[150, 100, 100])
-            table3.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0891b2')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, -1), 9),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#f0fdfa')),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#67e8f9')),
-            ]))
-            elements.append(table3)
-        else:
-            elements.append(Paragraph("⚠️ No hay datos de calidad de agua para el período seleccionado.", warning_style))
-            alertas.append("Sin datos de calidad de agua registrados")
-            recomendaciones.append("Verificar sensor de calidad de agua")
-        
-        elements.append(Spacer(1, 20))
-        
-        # ═══════════════════════════════════════════════════════════════
-        # SECCIÓN 6: HISTÓRICO POR PERÍODO
-        # ═══════════════════════════════════════════════════════════════
-        elements.append(Paragraph("📅 6. HISTÓRICO POR PERÍODO", section_style))
-        
-        # Obtener últimas lecturas - filtradas por peceras del usuario
-        if mis_peceras:
-            cursor.execute(f"""
-                SELECT fecha_hora, humedad, raw as temperatura
-                FROM lecturas_humedad
-                WHERE fecha_hora >= ? AND id_aspersor IN ({placeholders})
-                ORDER BY fecha_hora DESC
-                LIMIT 10
-            """, (fecha_inicio_str, *mis_peceras))
-        else:
-            cursor.execute("""
-                SELECT fecha_hora, humedad, raw as temperatura
-                FROM lecturas_humedad
-                WHERE 1=0
-            """)
-        ultimas_humedad = cursor.fetchall()
-        
-        if ultimas_humedad:
-            elements.append(Paragraph("Últimas 10 lecturas de Humedad/Temperatura:", styles['Heading3']))
-            hist_data = [['Fecha/Hora', 'Humedad', 'Temperatura']]
-            for lectura in ultimas_humedad:
-                fecha = lectura['fecha_hora'] if lectura['fecha_hora'] else 'N/A'
-                hist_data.append([
-                    str(fecha)[:19],
-                    f"{lectura['humedad']:.1f}%" if lectura['humedad'] else 'N/A',
-                    f"{lectura['temperatura']:.1f}°C" if lectura['temperatura'] else 'N/A'
-                ])
-            
-            table4 = Table(hist_data, colWidths=[160, 100, 100])
-            table4.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0e7490')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, -1), 8),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#ecfeff')),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#06b6d4')),
-            ]))
-            elements.append(table4)
-        else:
-            elements.append(Paragraph("No hay registros históricos para el período.", normal_style))
-        
-        elements.append(Spacer(1, 20))
-        
-        # ═══════════════════════════════════════════════════════════════
-        # SECCIÓN 7: ALERTAS Y RECOMENDACIONES
-        # ═══════════════════════════════════════════════════════════════
-        elements.append(Paragraph("⚠️ 7. ALERTAS Y RECOMENDACIONES TÉCNICAS", section_style))
-        
-        if alertas:
-            elements.append(Paragraph("Alertas detectadas:", styles['Heading3']))
-            for i, alerta in enumerate(alertas, 1):
-                elements.append(Paragraph(f"  {i}. 🔔 {alerta}", alert_style))
-        else:
-            elements.append(Paragraph("✅ No se detectaron alertas críticas en el período.", success_style))
-        
-        elements.append(Spacer(1, 10))
-        
-        if recomendaciones:
-            elements.append(Paragraph("Recomendaciones:", styles['Heading3']))
-            for i, rec in enumerate(recomendaciones, 1):
-                elements.append(Paragraph(f"  {i}. 💡 {rec}", normal_style))
-        else:
-            elements.append(Paragraph("✅ Sistema funcionando correctamente. Mantener monitoreo regular.", success_style))
-        
-        elements.append(Spacer(1, 20))
-        
-        # ═══════════════════════════════════════════════════════════════
-        # SECCIÓN 8: DIAGNÓSTICO COMPLETO DEL SISTEMA
-        # ═══════════════════════════════════════════════════════════════
-        if es_admin:
-            elements.append(Paragraph("🔧 8. DIAGNÓSTICO COMPLETO DEL SISTEMA (ADMIN)", section_style))
-        else:
-            elements.append(Paragraph("🔧 8. DIAGNÓSTICO DE MIS PECERAS", section_style))
-        
-        # Calcular puntuación general
-        puntuacion = 100
-        if alertas:
-            puntuacion -= len(alertas) * 15
-        if puntuacion < 0:
-            puntuacion = 0
-        
-        if puntuacion >= 80:
-            estado_general = "EXCELENTE"
-            color_estado = success_style
-        elif puntuacion >= 60:
-            estado_general = "BUENO"
-            color_estado = success_style
-        elif puntuacion >= 40:
-            estado_general = "REGULAR"
-            color_estado = warning_style
-        else:
-            estado_general = "CRÍTICO"
-            color_estado = alert_style
-        
-        elements.append(Paragraph(f"Estado General del Sistema: {estado_general} ({puntuacion}/100 puntos)", color_estado))
-        elements.append(Spacer(1, 10))
-        
-        diag_data = [
-            ['Componente', 'Estado', 'Observaciones'],
-            ['Sensores de Humedad', '✅ Operativo' if humedad_stats and humedad_stats['lecturas'] else '❌ Sin datos', f"{humedad_stats['lecturas'] if humedad_stats else 0} lecturas"],
-            ['Sensor Ultrasónico', '✅ Operativo' if nivel_stats and nivel_stats['lecturas'] else '❌ Sin datos', f"{nivel_stats['lecturas'] if nivel_stats else 0} lecturas"],
-            ['Sensor de Calidad', '✅ Operativo' if calidad_stats and calidad_stats['lecturas'] else '❌ Sin datos', f"{calidad_stats['lecturas'] if calidad_stats else 0} lecturas"],
-            ['Peceras Registradas', '✅ Activas' if activas > 0 else '⚠️ Revisar', f"{activas} de {len(peceras)} activas"],
-            ['Conectividad', '✅ OK', 'Sistema en línea'],
-        ]
-        
-        table5 = Table(diag_data, colWidths=[130, 100, 150])
-        table5.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0891b2')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#f0fdfa')),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#67e8f9')),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ]))
-        elements.append(table5)
-        
-        # ═══════════════════════════════════════════════════════════════
-        # SECCIÓN 9: LISTADO DE USUARIOS (SOLO ADMIN)
-        # ═══════════════════════════════════════════════════════════════
-        if es_admin:
-            elements.append(Spacer(1, 20))
-            elements.append(Paragraph("👥 9. LISTADO DE USUARIOS DEL SISTEMA (ADMIN)", section_style))
-            
-            cursor.execute("""
-                SELECT u.id_usuario, u.nombre, u.correo, u.tipo_usuario, u.fecha_creacion,
-                       (SELECT COUNT(*) FROM aspersores a WHERE a.id_usuario = u.id_usuario) as num_peceras
-                FROM usuarios u
-                ORDER BY u.tipo_usuario DESC, u.nombre ASC
-            """)
-            usuarios = cursor.fetchall()
-            
-            elements.append(Paragraph(f"Total de usuarios registrados: {len(usuarios)}", normal_style))
-            admins = sum(1 for u in usuarios if u['tipo_usuario'] == 'admin')
-            elements.append(Paragraph(f"Administradores: {admins} | Usuarios: {len(usuarios) - admins}", normal_style))
-            elements.append(Spacer(1, 10))
-            
-            if usuarios:
-                users_data = [['Nombre', 'Correo', 'Tipo', 'Peceras', 'Registro']]
-                for u in usuarios:
-                    tipo = '👑 Admin' if u['tipo_usuario'] == 'admin' else '👤 Usuario'
-                    fecha = str(u['fecha_creacion'])[:10] if u['fecha_creacion'] else 'N/A'
-                    users_data.append([
-                        u['nombre'],
-                        u['correo'],
-                        tipo,
-                        str(u['num_peceras']),
-                        fecha
-                    ])
-                
-                table_users = Table(users_data, colWidths=[100, 130, 70, 50, 80])
-                table_users.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#7c3aed')),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, -1), 8),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#f5f3ff')),
-                    ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#a78bfa')),
-                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ]))
-                elements.append(table_users)
-        
-        cursor.close()
-        connection.close()
-    
-    elements.append(Spacer(1, 30))
-    
-    # ═══════════════════════════════════════════════════════════════
-    # PIE DE PÁGINA
-    # ═══════════════════════════════════════════════════════════════
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=8,
-        textColor=colors.gray,
-        alignment=1
-    )
-    elements.append(Paragraph("─" * 80, footer_style))
-    elements.append(Spacer(1, 5))
-    elements.append(Paragraph("AquaZen - Sistema Inteligente de Monitoreo de Peceras", footer_style))
-    elements.append(Paragraph(f"Reporte generado automáticamente | {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}", footer_style))
-    elements.append(Paragraph("© 2025 AquaZen - Todos los derechos reservados", footer_style))
-    
-    # Construir PDF
-    doc.build(elements)
-    
-    # Preparar respuesta
-    buffer.seek(0)
-    
-    fecha_archivo = datetime.now().strftime('%Y%m%d_%H%M')
-    tipo_reporte = "admin_completo" if es_admin else "personal"
-    filename = f"reporte_aquazen_{tipo_reporte}_{fecha_archivo}.pdf"
-    
+    try:
+        job = report_jobs.submit(
+            session['id_usuario'],
+            session.get('tipo_usuario', 'usuario'),
+            session.get('nombre_usuario', 'Usuario'),
+            dias
+        )
+        job = report_jobs.wait(job['job_id'], REPORT_SYNC_TIMEOUT)
+    except Exception as e:
+        print(f"Error al generar reporte: {e}")
+        job = None
+
+    path = report_jobs.pdf_path(job['job_id']) if job else None
+    if not path:
+        flash('No se pudo generar el reporte, intenta de nuevo', 'error')
+        return redirect(url_for('dashboard'))
     return send_file(
-        buffer,
+        os.path.abspath(path),
         as_attachment=True,
-        download_name=filename,
+        download_name=report_filename(job['tipo_usuario']),
         mimetype='application/pdf'
     )
 
@@ -0,0 +1,311 @@
+"""Latencia y peticiones por segundo de los endpoints que consulta el dashboard.
+
+Siembra una base temporal (o --db, que se reutiliza entre corridas) con usuarios,
+peceras, programaciones y lecturas repartidas entre humedad, ultrasonico y
+calidad; luego cada endpoint recibe --requests peticiones de N clientes
+concurrentes por cada valor de --clients. Con --mode test se usa el cliente de
+pruebas de Flask (mide la vista sin red); con --mode wsgi, un servidor
+werkzeug local con hilos y conexiones HTTP reales.
+
+La micro-caché de respuestas (HTTP_CACHE_TTL) se apaga por defecto para medir
+la consulta: --cache-ttl 1 reproduce la configuración de producción.
+
+Uso:
+    python benchmarks/bench_http.py --readings 1000000 --tanks 300 --users 100 --json http.json
+    python benchmarks/bench_http.py --db /tmp/bench_http.db --readings 10000000 --clients 1 8 32
+    python benchmarks/bench_http.py --mode wsgi --baseline http.json
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from urllib.parse import urlencode
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+READING_TABLES = {
+    'lecturas_humedad': ("INSERT INTO lecturas_humedad (id_aspersor, humedad, raw, fecha_hora) VALUES (?, ?, ?, ?)",
+                         lambda rng: (round(rng.uniform(40, 70), 1), rng.randint(300, 800))),
+    'lecturas_ultrasonico': ("INSERT INTO lecturas_ultrasonico (id_aspersor, nivel, fecha_hora) VALUES (?, ?, ?)",
+                             lambda rng: (round(rng.uniform(5, 30), 1),)),
+    'lecturas_calidad': ("INSERT INTO lecturas_calidad (id_aspersor, calidad, fecha_hora) VALUES (?, ?, ?)",
+                         lambda rng: (round(rng.uniform(100, 600), 1),)),
+}
+
+SEED_BATCH = 50000
+
+ADMIN_LOGIN = {'correo': 'admin@irrigo.com', 'contrasena': '123'}
+
+
+def endpoints(tank_ids):
+    """nombre -> función que arma la ruta de cada petición (peceras al azar donde aplica)."""
+    routes = {'latest': lambda rng: f"/get_latest_sensor_data?id_aspersor={rng.choice(tank_ids)}"}
+    for sensor in ('humedad', 'ultrasonico', 'calidad'):
+        for limit in (12, 20, 50):
+            routes[f"{sensor}_{limit}"] = lambda rng, s=sensor, n=limit: f"/sensor_data/{s}?{urlencode({'limit': n})}"
+    routes['programaciones'] = lambda rng: f"/get_programaciones/{rng.choice(tank_ids)}"
+    routes['aspersores_admin'] = lambda rng: "/aspersores/"
+    return routes
+
+
+def seed(connection, users, tanks, readings, schedules, days):
+    """Datos sintéticos reproducibles (semilla fija). Las lecturas quedan ordenadas por fecha."""
+    rng = random.Random(42)
+    cursor = connection.cursor()
+    cursor.execute("PRAGMA synchronous = OFF")
+    cursor.executemany(
+        "INSERT INTO usuarios (nombre, correo, contrasena, tipo_usuario) VALUES (?, ?, '123', 'usuario')",
+        [(f"Usuario {i}", f"bench{i}@irrigo.com") for i in range(users)]
+    )
+    cursor.execute("SELECT id_usuario FROM usuarios")
+    user_ids = [row[0] for row in cursor.fetchall()]
+    cursor.executemany(
+        "INSERT INTO aspersores (id_usuario, nombre, ubicacion, estado) VALUES (?, ?, ?, ?)",
+        [(rng.choice(user_ids), f"Pecera {i}", f"Sala {i % 20}", rng.choice(('activo', 'inactivo')))
+         for i in range(tanks)]
+    )
+    cursor.execute("SELECT id_aspersor FROM aspersores")
+    tank_ids = [row[0] for row in cursor.fetchall()]
+
+    end = datetime(2025, 1, 1)
+    start = end - timedelta(days=days)
+    cursor.executemany(
+        "INSERT INTO programaciones_riego (id_aspersor, hora_inicio, duracion_minutos) VALUES (?, ?, ?)",
+        [(tank, (start + timedelta(minutes=rng.randint(0, days * 1440))).strftime('%Y-%m-%d %H:%M:%S'),
+          rng.choice((5, 10, 15, 30)))
+         for tank in tank_ids for _ in range(schedules)]
+    )
+
+    per_table = readings // len(READING_TABLES)
+    step = (end - start) / max(per_table, 1)
+    for table, (sql, values) in READING_TABLES.items():
+        batch = []
+        for i in range(per_table):
+            batch.append((rng.choice(tank_ids), *values(rng), (start + step * i).strftime('%Y-%m-%d %H:%M:%S')))
+            if len(batch) == SEED_BATCH:
+                cursor.executemany(sql, batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+    connection.commit()
+    cursor.execute("ANALYZE")
+    cursor.execute("PRAGMA synchronous = NORMAL")
+    cursor.close()
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return round(sorted_values[index], 3)
+
+
+class TestClientRunner:
+    """Cada hilo con su propio cliente de pruebas de Flask y sesión de admin."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def session(self):
+        client = self.app.test_client()
+        with client.session_transaction() as session:
+            session.update(id_usuario=1, nombre_usuario='Admin Principal', tipo_usuario='admin')
+
+        def get(path):
+            response = client.get(path)
+            response.get_data()
+            return response.status_code
+        return get
+
+    def close(self):
+        pass
+
+
+class WsgiRunner:
+    """Servidor werkzeug con hilos en un puerto libre; cada hilo cliente abre conexiones HTTP reales."""
+
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)  # sin una línea de log por petición
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.port = self.server.server_port
+        threading.Thread(target=self.server.serve_forever, name='bench-http', daemon=True).start()
+        self.cookie = self._login()
+
+    def _request(self, method, path, body=None, headers=None):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+        try:
+            connection.request(method, path, body=body, headers=headers or {})
+            response = connection.getresponse()
+            response.read()
+            return response
+        finally:
+            connection.close()
+
+    def _login(self):
+        response = self._request('POST', '/login', urlencode(ADMIN_LOGIN),
+                                 {'Content-Type': 'application/x-www-form-urlencoded'})
+        cookie = response.getheader('Set-Cookie')
+        if not cookie:
+            raise RuntimeError("El login de admin no devolvió cookie de sesión")
+        return cookie.split(';', 1)[0]
+
+    def session(self):
+        def get(path):
+            # El servidor de desarrollo responde HTTP/1.0 y cierra: una conexión por petición
+            return self._request('GET', path, headers={'Cookie': self.cookie}).status
+        return get
+
+    def close(self):
+        self.server.shutdown()
+
+
+def measure(runner, build_path, clients, requests):
+    """Reparte requests entre clients hilos y devuelve percentiles de latencia y peticiones/s."""
+    timings = []
+    errors = [0]
+    lock = threading.Lock()
+    per_client = max(1, requests // clients)
+    barrier = threading.Barrier(clients + 1)
+
+    def worker(seed):
+        rng = random.Random(seed)
+        get = runner.session()
+        local, failed = [], 0
+        barrier.wait()
+        for _ in range(per_client):
+            path = build_path(rng)
+            started = time.perf_counter()
+            try:
+                status = get(path)
+            except (OSError, http.client.HTTPException):
+                status = None
+            local.append((time.perf_counter() - started) * 1000)
+            if status is None or status >= 400:
+                failed += 1
+        with lock:
+            timings.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    timings.sort()
+    return {
+        'requests': len(timings),
+        'errors': errors[0],
+        'rps': round(len(timings) / elapsed, 1),
+        'p50_ms': percentile(timings, 0.50),
+        'p95_ms': percentile(timings, 0.95),
+        'p99_ms': percentile(timings, 0.99),
+        'max_ms': round(timings[-1], 3) if timings else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readings', type=int, default=100_000, help='lecturas en total (repartidas en 3 tablas)')
+    parser.add_argument('--tanks', type=int, default=200)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--schedules', type=int, default=5, help='programaciones por pecera')
+    parser.add_argument('--days', type=int, default=90, help='días cubiertos por las lecturas')
+    parser.add_argument('--db', help='base a sembrar y reutilizar (si ya tiene lecturas no se vuelve a sembrar)')
+    parser.add_argument('--mode', choices=('test', 'wsgi'), default='test')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 4, 16], help='niveles de concurrencia')
+    parser.add_argument('--requests', type=int, default=500, help='peticiones por endpoint y nivel')
+    parser.add_argument('--only', nargs='+', help='medir solo estos endpoints')
+    parser.add_argument('--cache-ttl', type=float, default=0.0, help='HTTP_CACHE_TTL durante la medición')
+    parser.add_argument('--json', help='guardar resultados en este archivo')
+    parser.add_argument('--baseline', help='comparar contra un JSON guardado antes')
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory(prefix='bench_http_')
+    db_path = args.db or os.path.join(tmp.name, 'bench_http.db')
+    os.environ.update({
+        'DATABASE_FILE': db_path,
+        'HTTP_CACHE_TTL': str(args.cache_ttl),
+        'REPORT_CACHE_DIR': os.path.join(tmp.name, 'reportes'),
+        'WARMUP_DELAY': '-1',
+        'LOG_LEVEL': 'WARNING',
+    })
+    import app  # noqa: E402  (lee DATABASE_FILE al importarse y crea el esquema)
+    from db import open_connection  # noqa: E402
+
+    connection = open_connection(db_path, row_factory=None)
+    seeded = connection.execute("SELECT COUNT(*) FROM lecturas_humedad").fetchone()[0]
+    if seeded:
+        print(f"Reutilizando {db_path}")
+    else:
+        started = time.perf_counter()
+        seed(connection, args.users, args.tanks, args.readings, args.schedules, args.days)
+        print(f"Sembradas {args.readings} lecturas, {args.tanks} peceras y {args.users} usuarios "
+              f"en {time.perf_counter() - started:.1f}s")
+    tank_ids = [row[0] for row in connection.execute("SELECT id_aspersor FROM aspersores")]
+    sizes = {table: connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+             for table in ('usuarios', 'aspersores', 'programaciones_riego', *READING_TABLES)}
+    connection.close()
+
+    # Snapshot en memoria como si cada pecera ya hubiera reportado por MQTT
+    now = datetime.now().isoformat()
+    for tank in tank_ids:
+        app.latest_store.update(tank, 'ultrasonico', {'distancia_cm': 12}, now)
+        app.latest_store.update(tank, 'liquido', {'nivel_pct': 55.0, 'raw': 512}, now)
+        app.latest_store.update(tank, 'tds', {'ppm': 320.0, 'raw': 480, 'calidad': 'BUENA'}, now)
+
+    routes = endpoints(tank_ids)
+    if args.only:
+        routes = {name: routes[name] for name in args.only}
+    runner = WsgiRunner(app.app) if args.mode == 'wsgi' else TestClientRunner(app.app)
+    results = {}
+    try:
+        for name, build_path in routes.items():
+            measure(runner, build_path, 1, 20)  # calentar caché de páginas de SQLite y plantillas
+            results[name] = {str(c): measure(runner, build_path, c, args.requests) for c in args.clients}
+    finally:
+        runner.close()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    print(f"\n{'endpoint':<18}{'clientes':>9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errores':>9}")
+    for name, levels in results.items():
+        for clients, r in levels.items():
+            line = (f"{name:<18}{clients:>9}{r['rps']:>9.1f}{r['p50_ms']:>9.2f}"
+                    f"{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}{r['errors']:>9}")
+            b = (baseline or {}).get(name, {}).get(clients)
+            if b:
+                line += (f"   Δ {r['rps'] - b['rps']:+.1f} req/s"
+                         f" / p95 {r['p95_ms'] - b['p95_ms']:+.2f} ms")
+            print(line)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'python': sys.version.split()[0],
+                'mode': args.mode,
+                'cache_ttl': args.cache_ttl,
+                'table_rows': sizes,
+                'results': results,
+            }, f, indent=2)
+    tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
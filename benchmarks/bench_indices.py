@@ -0,0 +1,175 @@
+"""Latencia de consultas por rango en tablas de lecturas, antes y después de los índices.
+
+Uso:
+    python benchmarks/bench_indices.py --rows 1000000 --tanks 50 --json resultados.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from statistics import median
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from db import open_connection  # noqa: E402
+from migrations import MIGRATIONS, run_migrations  # noqa: E402
+
+SCHEMA = """
+    CREATE TABLE aspersores (
+        id_aspersor INTEGER PRIMARY KEY AUTOINCREMENT,
+        id_usuario INTEGER NOT NULL,
+        nombre VARCHAR(100) NOT NULL,
+        camera_url VARCHAR(255)
+    );
+    CREATE TABLE lecturas_humedad (
+        id_lectura INTEGER PRIMARY KEY AUTOINCREMENT,
+        id_aspersor INTEGER NOT NULL,
+        humedad REAL,
+        raw REAL,
+        fecha_hora DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE lecturas_ultrasonico (
+        id_lectura INTEGER PRIMARY KEY AUTOINCREMENT,
+        id_aspersor INTEGER NOT NULL,
+        nivel REAL,
+        fecha_hora DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE lecturas_calidad (
+        id_lectura INTEGER PRIMARY KEY AUTOINCREMENT,
+        id_aspersor INTEGER NOT NULL,
+        calidad REAL,
+        fecha_hora DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+"""
+
+# Consultas representativas de generar_reporte y /sensor_data/*
+QUERIES = {
+    'reporte_rango_peceras': (
+        "SELECT fecha_hora, humedad, raw FROM lecturas_humedad "
+        "WHERE fecha_hora >= ? AND id_aspersor IN ({placeholders}) "
+        "ORDER BY fecha_hora ASC LIMIT 50"
+    ),
+    'reporte_estadisticas': (
+        "SELECT AVG(humedad), MIN(humedad), MAX(humedad), COUNT(*) FROM lecturas_humedad "
+        "WHERE fecha_hora >= ? AND id_aspersor IN ({placeholders})"
+    ),
+    'ultimas_lecturas': (
+        "SELECT humedad, fecha_hora FROM lecturas_humedad "
+        "WHERE humedad IS NOT NULL ORDER BY fecha_hora DESC LIMIT 50"
+    ),
+}
+
+
+def seed(connection, rows, tanks, days):
+    end = datetime(2025, 1, 1)
+    start = end - timedelta(days=days)
+    step = (end - start) / rows
+    connection.executemany(
+        "INSERT INTO aspersores (id_usuario, nombre) VALUES (1, ?)",
+        [(f"Pecera {i}",) for i in range(1, tanks + 1)]
+    )
+    rng = random.Random(42)
+    batch = []
+    for i in range(rows):
+        moment = start + step * i
+        batch.append((
+            rng.randint(1, tanks),
+            round(rng.uniform(40, 70), 1),
+            round(rng.uniform(22, 28), 1),
+            moment.strftime('%Y-%m-%d %H:%M:%S')
+        ))
+        if len(batch) == 50000:
+            connection.executemany(
+                "INSERT INTO lecturas_humedad (id_aspersor, humedad, raw, fecha_hora) VALUES (?, ?, ?, ?)",
+                batch
+            )
+            batch = []
+    if batch:
+        connection.executemany(
+            "INSERT INTO lecturas_humedad (id_aspersor, humedad, raw, fecha_hora) VALUES (?, ?, ?, ?)",
+            batch
+        )
+    connection.commit()
+    return end
+
+
+def measure(connection, end, tanks, window_days, repeat):
+    since = (end - timedelta(days=window_days)).strftime('%Y-%m-%d %H:%M:%S')
+    peceras = list(range(1, min(tanks, 3) + 1))
+    results = {}
+    for name, sql in QUERIES.items():
+        sql = sql.format(placeholders=','.join('?' * len(peceras)))
+        params = (since, *peceras) if '?' in sql else ()
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            connection.execute(sql, params).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        plan = connection.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        results[name] = {
+            'p50_ms': round(median(timings), 3),
+            'max_ms': round(max(timings), 3),
+            'plan': ' | '.join(row[3] for row in plan),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de índices de series temporales')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--tanks', type=int, default=50)
+    parser.add_argument('--days', type=int, default=90, help='días cubiertos por los datos sembrados')
+    parser.add_argument('--window', type=int, default=7, help='días consultados por el reporte')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--json', help='ruta opcional para guardar los resultados')
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db', prefix='bench_indices_')
+    os.close(fd)
+    try:
+        connection = open_connection(path, row_factory=None)
+        connection.executescript(SCHEMA)
+        started = time.perf_counter()
+        end = seed(connection, args.rows, args.tanks, args.days)
+        print(f"Sembradas {args.rows} lecturas en {time.perf_counter() - started:.1f}s")
+
+        before = measure(connection, end, args.tanks, args.window, args.repeat)
+        started = time.perf_counter()
+        run_migrations(connection, verbose=False)
+        migrate_s = time.perf_counter() - started
+        connection.execute("ANALYZE")
+        after = measure(connection, end, args.tanks, args.window, args.repeat)
+        connection.close()
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    print(f"Migraciones ({len(MIGRATIONS)}) aplicadas en {migrate_s:.2f}s\n")
+    print(f"{'consulta':<24}{'antes p50 ms':>14}{'después p50 ms':>16}{'mejora':>10}")
+    for name in QUERIES:
+        b, a = before[name]['p50_ms'], after[name]['p50_ms']
+        speedup = f"{b / a:.1f}x" if a else '-'
+        print(f"{name:<24}{b:>14.3f}{a:>16.3f}{speedup:>10}")
+        print(f"    antes:   {before[name]['plan']}")
+        print(f"    después: {after[name]['plan']}")
+
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump({
+                'rows': args.rows,
+                'tanks': args.tanks,
+                'window_days': args.window,
+                'migration_seconds': round(migrate_s, 3),
+                'before': before,
+                'after': after,
+            }, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+"""Prueba de carga de la ingesta MQTT con un broker local (mqtt_stub_broker).
+
+Levanta el broker en proceso, importa app.py contra una base temporal y arranca
+el listener real (start_mqtt_listener: on_message, cola write-behind, rollups).
+N peceras publican las lecturas del firmware (ultrasonico, liquido, tds y
+sistema) en AquaZen/<id_aspersor>/sender a la tasa pedida. Se mide:
+    - lecturas por segundo recibidas por on_message y escritas en SQLite
+    - latencia publicación -> commit (p50/p95/p99/máx)
+    - crecimiento de la base (+ WAL) y bytes por lectura
+    - mensajes perdidos en el broker, descartados por la cola o nunca escritos
+El valor de cada lectura lleva un número de secuencia para emparejar la fila
+escrita con su publicación.
+
+Uso:
+    python benchmarks/bench_mqtt_ingest.py --tanks 20 --rate 5 --duration 15 --json ingest.json
+    python benchmarks/bench_mqtt_ingest.py --format bin --baseline ingest.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import paho.mqtt.client as mqtt  # noqa: E402
+
+from mqtt_stub_broker import StubBroker  # noqa: E402
+
+SENSORS = ('ultrasonico', 'liquido', 'tds', 'sistema')
+
+# Los valores de secuencia caben en el campo más chico de la trama binaria (int16)
+SEQ_MODULO = 30000
+
+# Columna que lleva la secuencia en cada tabla (posición dentro de la fila de la cola)
+SEQ_COLUMNS = {
+    'lecturas_ultrasonico': ('ultrasonico', 1),   # (id_aspersor, nivel, fecha_hora)
+    'lecturas_humedad': ('liquido', 2),           # (id_aspersor, humedad, raw, fecha_hora)
+    'lecturas_calidad': ('tds', 1),               # (id_aspersor, calidad, fecha_hora)
+}
+
+
+def reading_values(sensor, seq):
+    """Valores con la forma del firmware; seq va en el campo que se guarda en la base."""
+    if sensor == 'ultrasonico':
+        return {'distancia_cm': seq}
+    if sensor == 'liquido':
+        return {'nivel_pct': 50.0, 'raw': seq}
+    if sensor == 'tds':
+        return {'ppm': float(seq), 'raw': 512, 'calidad': 'BUENA'}
+    return {'estado': 'AUTO', 'bomba6': 0, 'bomba7': 0, 'servo_pos': 0, 'eventos_activos': 0}
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return round(sorted_values[index], 3)
+
+
+def db_size(path):
+    return sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix))
+
+
+class LoadGenerator:
+    """Publicadores paho que reparten las peceras y publican un ciclo de sensores por intervalo."""
+
+    def __init__(self, port, tank_ids, rate, payload_format, publishers):
+        self.port = port
+        self.tank_ids = tank_ids
+        self.interval = 1.0 / rate
+        self.payload_format = payload_format
+        self.publishers = publishers
+        self.sent = {}              # (id_aspersor, tabla, seq) -> perf_counter de publicación
+        self.published = 0
+        self.behind = 0             # ciclos que empezaron tarde (el generador no alcanzó la tasa)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._clients = []
+
+    def start(self, duration):
+        for index in range(self.publishers):
+            tanks = self.tank_ids[index::self.publishers]
+            if not tanks:
+                continue
+            client = mqtt.Client(client_id=f"bench-pub-{index}", callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
+            client.connect('127.0.0.1', self.port)
+            client.loop_start()
+            self._clients.append(client)
+            thread = threading.Thread(target=self._run, args=(client, tanks, duration), daemon=True)
+            self._threads.append(thread)
+        for thread in self._threads:
+            thread.start()
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+        for client in self._clients:
+            client.loop_stop()
+            client.disconnect()
+
+    def _run(self, client, tanks, duration):
+        from sensor_frames import encode_frame
+
+        deadline = time.perf_counter() + duration
+        next_cycle = time.perf_counter()
+        seq = 0
+        while not self._stop.is_set():
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            if now < next_cycle:
+                time.sleep(next_cycle - now)
+            elif now - next_cycle > self.interval:
+                self.behind += 1
+            next_cycle += self.interval
+            seq = (seq + 1) % SEQ_MODULO
+            for tank in tanks:
+                topic = f"AquaZen/{tank}/sender"
+                stamp = time.perf_counter()
+                with self._lock:
+                    for table, (sensor, _) in SEQ_COLUMNS.items():
+                        self.sent[(tank, table, seq)] = stamp
+                if self.payload_format == 'bin':
+                    frame = encode_frame([(sensor, reading_values(sensor, seq), 0) for sensor in SENSORS])
+                    client.publish(f"{topic}/bin", frame, qos=0)
+                    published = len(SENSORS)
+                else:
+                    for sensor in SENSORS:
+                        client.publish(topic, json.dumps({'sensor': sensor, **reading_values(sensor, seq)}), qos=0)
+                    published = len(SENSORS)
+                with self._lock:
+                    self.published += published
+
+
+def run(args):
+    tmp = tempfile.mkdtemp(prefix='bench_mqtt_')
+    db_path = os.path.join(tmp, 'bench.db')
+    broker = StubBroker().start()
+    os.environ.update({
+        'DATABASE_FILE': db_path,
+        'MQTT_BROKER': '127.0.0.1',
+        'MQTT_PORT': str(broker.port),
+        'WARMUP_DELAY': '-1',
+        'REPORT_CACHE_DIR': os.path.join(tmp, 'reportes'),
+        'LOG_LEVEL': 'WARNING',
+        'FLASK_DEBUG': '0',
+    })
+    import app
+
+    owner = app.ensure_default_aspersor()
+    connection = app.get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute("SELECT id_usuario FROM aspersores WHERE id_aspersor = ?", (owner,))
+    id_usuario = cursor.fetchone()[0]
+    cursor.executemany(
+        "INSERT INTO aspersores (id_usuario, nombre, ubicacion, estado) VALUES (?, ?, 'bench', 'activo')",
+        [(id_usuario, f"Pecera {i}") for i in range(args.tanks)]
+    )
+    connection.commit()
+    cursor.execute("SELECT id_aspersor FROM aspersores WHERE ubicacion = 'bench' ORDER BY id_aspersor")
+    tank_ids = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    connection.close()
+    app.device_registry.invalidate()
+
+    generator = LoadGenerator(broker.port, tank_ids, args.rate, args.format, args.publishers)
+    latencies = []
+    stored = {'rows': 0, 'matched': 0, 'last': None}
+    stored_lock = threading.Lock()
+
+    def on_commit(rows_by_table):
+        now = time.perf_counter()
+        found = []
+        with generator._lock:
+            for table, rows in rows_by_table.items():
+                if table not in SEQ_COLUMNS:
+                    continue
+                position = SEQ_COLUMNS[table][1]
+                for row in rows:
+                    stamp = generator.sent.pop((row[0], table, int(row[position]) % SEQ_MODULO), None)
+                    if stamp is not None:
+                        found.append((now - stamp) * 1000)
+        with stored_lock:
+            stored['rows'] += sum(len(rows) for rows in rows_by_table.values())
+            stored['matched'] += len(found)
+            stored['last'] = now
+            latencies.extend(found)
+
+    app.sensor_write_queue.add_commit_hook(on_commit)
+    client = app.start_mqtt_listener()
+    deadline = time.perf_counter() + 10
+    while not client.is_connected() and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    time.sleep(0.3)  # SUBACK
+
+    size_before = db_size(db_path)
+    generator.start(args.duration)
+    started = time.perf_counter()
+    generator.join()
+
+    # Vaciar: esperar a que dejen de llegar filas (o --drain segundos)
+    expected = generator.published - generator.published // len(SENSORS)  # 'sistema' no se guarda
+    drain_deadline = time.perf_counter() + args.drain
+    last = -1
+    while time.perf_counter() < drain_deadline:
+        time.sleep(0.25)
+        with stored_lock:
+            current = stored['rows']
+        if current >= expected or current == last:
+            break
+        last = current
+    # Ritmo sostenido: desde que empieza a publicar hasta el último commit
+    elapsed = (stored['last'] or time.perf_counter()) - started
+
+    queue_stats = app.sensor_write_queue.stats()
+    received = sum(app.MQTT_MESSAGES.value(sensor, args.format) for sensor in SENSORS)
+    latencies.sort()
+    size_after = db_size(db_path)
+    result = {
+        'tanks': args.tanks,
+        'rate_hz': args.rate,
+        'format': args.format,
+        'duration_s': args.duration,
+        'target_msgs_per_s': args.tanks * args.rate * len(SENSORS),
+        'published': generator.published,
+        'publish_msgs_per_s': round(generator.published / args.duration, 1),
+        'generator_behind_cycles': generator.behind,
+        'received': received,
+        'received_msgs_per_s': round(received / elapsed, 1),
+        'stored_rows': stored['rows'],
+        'stored_rows_per_s': round(stored['rows'] / elapsed, 1),
+        'expected_rows': expected,
+        'lost_in_broker': generator.published - received,
+        'dropped_by_queue': queue_stats['dropped'],
+        'not_stored': max(0, expected - stored['rows']),
+        'latency_ms': {
+            'count': len(latencies),
+            'p50': percentile(latencies, 0.50),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'max': round(latencies[-1], 3) if latencies else None,
+        },
+        'db_bytes_before': size_before,
+        'db_bytes_after': size_after,
+        'db_bytes_per_row': round((size_after - size_before) / stored['rows'], 1) if stored['rows'] else None,
+        'queue': {k: queue_stats[k] for k in ('flushes', 'backpressure', 'write_errors', 'batch_size')},
+        'broker': broker.stats(),
+    }
+
+    client.loop_stop()
+    client.disconnect()
+    app.sensor_write_queue.stop()
+    app.retention_engine.stop()
+    broker.stop()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tanks', type=int, default=20, help='peceras simuladas')
+    parser.add_argument('--rate', type=float, default=5.0, help='ciclos de sensores por segundo y pecera')
+    parser.add_argument('--duration', type=float, default=10.0, help='segundos publicando')
+    parser.add_argument('--drain', type=float, default=15.0, help='espera máxima para que se escriba lo publicado')
+    parser.add_argument('--format', choices=('json', 'bin'), default='json', help='payload JSON o trama binaria (/bin)')
+    parser.add_argument('--publishers', type=int, default=4, help='clientes MQTT publicando en paralelo')
+    parser.add_argument('--json', help='guardar resultados en este archivo')
+    parser.add_argument('--baseline', help='comparar contra un JSON guardado antes')
+    args = parser.parse_args()
+
+    result = run(args)
+    latency = result['latency_ms']
+    print(f"Objetivo:   {result['target_msgs_per_s']} msg/s ({args.tanks} peceras x {args.rate:g} Hz x {len(SENSORS)} sensores)")
+    print(f"Publicado:  {result['published']} msg ({result['publish_msgs_per_s']} msg/s)")
+    print(f"Recibido:   {result['received']} msg ({result['received_msgs_per_s']} msg/s)")
+    print(f"Escrito:    {result['stored_rows']} filas ({result['stored_rows_per_s']} filas/s)")
+    print(f"Pérdidas:   broker {result['lost_in_broker']}, cola {result['dropped_by_queue']}, sin escribir {result['not_stored']}")
+    print(f"Latencia publicación -> commit (ms): p50 {latency['p50']}  p95 {latency['p95']}  "
+          f"p99 {latency['p99']}  máx {latency['max']}")
+    print(f"Base:       +{result['db_bytes_after'] - result['db_bytes_before']} bytes "
+          f"({result['db_bytes_per_row']} bytes/fila)")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        for key in ('stored_rows_per_s', 'received_msgs_per_s'):
+            print(f"Δ {key}: {result[key] - baseline[key]:+.1f}")
+        for q in ('p50', 'p95', 'p99'):
+            if latency[q] is not None and baseline['latency_ms'][q] is not None:
+                print(f"Δ latencia {q}: {latency[q] - baseline['latency_ms'][q]:+.3f} ms")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'results': result}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Tiempo de importación y memoria (RSS) de app.py en frío, con y sin los módulos pesados.
+
+Cada medición corre en un proceso nuevo con una base temporal. Escenarios:
+    lazy   -> import app (los módulos pesados quedan diferidos)
+    eager  -> módulos que app.py importaba antes al arrancar + import app
+    warmed -> import app + la precarga que hace warm_up_lazy_modules
+
+Uso:
+    python benchmarks/bench_startup.py --repeat 7 --json startup.json
+    python benchmarks/bench_startup.py --baseline startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from statistics import median
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Lo que app.py importaba a nivel de módulo antes de diferir reportes y Serial
+EAGER_IMPORTS = """
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot
+import matplotlib.dates
+import reportlab.platypus
+import reportlab.lib.styles
+import numpy
+import serial
+"""
+
+SCENARIOS = {
+    'lazy': "import app",
+    'eager': EAGER_IMPORTS + "import app",
+    'warmed': "import app\nfor name in app.LAZY_MODULES: __import__(name)\nimport reportes",
+}
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+exec(compile({code!r}, '<bench>', 'exec'))
+elapsed_ms = (time.perf_counter() - started) * 1000
+rss_kb = None
+try:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                rss_kb = int(line.split()[1])
+except OSError:
+    import resource
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+sys.stdout.write('\\n' + json.dumps({{'import_ms': elapsed_ms, 'rss_kb': rss_kb, 'modules': len(sys.modules)}}))
+"""
+
+
+def run_once(code, db_path):
+    env = dict(os.environ, DATABASE_FILE=db_path, PYTHONDONTWRITEBYTECODE='1')
+    env['PYTHONPATH'] = str(ROOT) + os.pathsep + env.get('PYTHONPATH', '')
+    out = subprocess.run(
+        [sys.executable, '-c', PROBE.format(code=code)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument('--json', help='guardar resultados en este archivo')
+    parser.add_argument('--baseline', help='comparar contra un JSON guardado antes')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench_startup.db')
+        run_once("import app", db_path)  # crear el esquema fuera de la medición
+        for name in args.scenarios:
+            samples = [run_once(SCENARIOS[name], db_path) for _ in range(args.repeat)]
+            results[name] = {
+                'import_ms_median': round(median(s['import_ms'] for s in samples), 1),
+                'import_ms_min': round(min(s['import_ms'] for s in samples), 1),
+                'rss_mb_median': round(median(s['rss_kb'] for s in samples) / 1024, 1),
+                'modules': samples[-1]['modules'],
+                'repeat': args.repeat,
+            }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    print(f"{'escenario':<8} {'import ms':>10} {'RSS MB':>8} {'módulos':>8}")
+    for name, r in results.items():
+        line = f"{name:<8} {r['import_ms_median']:>10.1f} {r['rss_mb_median']:>8.1f} {r['modules']:>8}"
+        if baseline and name in baseline:
+            b = baseline[name]
+            line += (f"   Δ {r['import_ms_median'] - b['import_ms_median']:+.1f} ms"
+                     f" / {r['rss_mb_median'] - b['rss_mb_median']:+.1f} MB")
+        print(line)
+    if 'lazy' in results and 'eager' in results:
+        lazy, eager = results['lazy'], results['eager']
+        print(f"\nDiferir módulos ahorra {eager['import_ms_median'] - lazy['import_ms_median']:.1f} ms "
+              f"y {eager['rss_mb_median'] - lazy['rss_mb_median']:.1f} MB al arrancar")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
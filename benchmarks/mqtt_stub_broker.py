@@ -0,0 +1,205 @@
+"""Broker MQTT 3.1.1 mínimo en proceso para pruebas de carga locales.
+
+Implementa lo que usan app.py y el firmware: CONNECT, SUBSCRIBE/UNSUBSCRIBE con
+comodines + y #, PUBLISH QoS 0/1/2 (se reenvía a los suscriptores con QoS 0),
+PINGREQ y DISCONNECT. Sin retained, sesiones persistentes ni autenticación.
+No reemplaza a Mosquitto: sirve para medir la ingesta sin depender de un
+broker externo y con resultados reproducibles.
+
+Uso:
+    from mqtt_stub_broker import StubBroker
+    broker = StubBroker().start()   # puerto libre en broker.port
+"""
+import socket
+import struct
+import threading
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+
+def topic_matches(pattern, topic):
+    """Filtro MQTT (con + y #) contra un tópico concreto."""
+    pattern_parts = pattern.split('/')
+    topic_parts = topic.split('/')
+    for i, part in enumerate(pattern_parts):
+        if part == '#':
+            return True
+        if i >= len(topic_parts):
+            return False
+        if part != '+' and part != topic_parts[i]:
+            return False
+    return len(pattern_parts) == len(topic_parts)
+
+
+def _encode_length(length):
+    out = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        out.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(out)
+
+
+def _packet(packet_type, flags, body):
+    return bytes([(packet_type << 4) | flags]) + _encode_length(len(body)) + body
+
+
+def _read_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("conexión cerrada")
+        data += chunk
+    return bytes(data)
+
+
+def _read_packet(sock):
+    header = _read_exact(sock, 1)[0]
+    multiplier, length = 1, 0
+    while True:
+        byte = _read_exact(sock, 1)[0]
+        length += (byte & 0x7F) * multiplier
+        if not byte & 0x80:
+            break
+        multiplier *= 128
+    return header >> 4, header & 0x0F, _read_exact(sock, length) if length else b''
+
+
+class _Session:
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.filters = set()
+        self.write_lock = threading.Lock()
+
+    def send(self, data):
+        with self.write_lock:
+            self.sock.sendall(data)
+
+
+class StubBroker:
+    """Broker en un hilo por conexión; expone contadores en stats()."""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self._server = None
+        self._sessions = set()
+        self._lock = threading.Lock()
+        self._stats = {'connections': 0, 'published': 0, 'delivered': 0, 'send_errors': 0}
+
+    def start(self):
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((self.host, self.port))
+        self._server.listen(64)
+        self.port = self._server.getsockname()[1]
+        threading.Thread(target=self._accept_loop, name='stub-broker', daemon=True).start()
+        return self
+
+    def stop(self):
+        server, self._server = self._server, None
+        if server is not None:
+            server.close()
+        with self._lock:
+            sessions = list(self._sessions)
+        for session in sessions:
+            try:
+                session.sock.close()
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data['sessions'] = len(self._sessions)
+        return data
+
+    def _accept_loop(self):
+        while self._server is not None:
+            try:
+                sock, address = self._server.accept()
+            except OSError:
+                break
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            session = _Session(sock, address)
+            with self._lock:
+                self._sessions.add(session)
+                self._stats['connections'] += 1
+            threading.Thread(target=self._serve, args=(session,), name=f'stub-broker-{address[1]}', daemon=True).start()
+
+    def _serve(self, session):
+        try:
+            while True:
+                packet_type, flags, body = _read_packet(session.sock)
+                if packet_type == CONNECT:
+                    session.send(_packet(CONNACK, 0, b'\x00\x00'))
+                elif packet_type == PUBLISH:
+                    self._on_publish(session, flags, body)
+                elif packet_type == PUBREL:
+                    session.send(_packet(PUBCOMP, 0, body[:2]))
+                elif packet_type == SUBSCRIBE:
+                    self._on_subscribe(session, body)
+                elif packet_type == UNSUBSCRIBE:
+                    self._on_unsubscribe(session, body)
+                elif packet_type == PINGREQ:
+                    session.send(_packet(PINGRESP, 0, b''))
+                elif packet_type == DISCONNECT:
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with self._lock:
+                self._sessions.discard(session)
+            try:
+                session.sock.close()
+            except OSError:
+                pass
+
+    def _on_subscribe(self, session, body):
+        packet_id, offset = body[:2], 2
+        granted = bytearray()
+        while offset < len(body):
+            (length,) = struct.unpack_from('!H', body, offset)
+            offset += 2
+            session.filters.add(body[offset:offset + length].decode())
+            offset += length + 1  # QoS pedido: se concede 0
+            granted.append(0)
+        session.send(_packet(SUBACK, 0, packet_id + bytes(granted)))
+
+    def _on_unsubscribe(self, session, body):
+        offset = 2
+        while offset < len(body):
+            (length,) = struct.unpack_from('!H', body, offset)
+            offset += 2
+            session.filters.discard(body[offset:offset + length].decode())
+            offset += length
+        session.send(_packet(UNSUBACK, 0, body[:2]))
+
+    def _on_publish(self, session, flags, body):
+        qos = (flags >> 1) & 0x03
+        (length,) = struct.unpack_from('!H', body, 0)
+        topic = body[2:2 + length].decode()
+        offset = 2 + length
+        if qos:
+            packet_id = body[offset:offset + 2]
+            offset += 2
+            session.send(_packet(PUBACK if qos == 1 else PUBREC, 0, packet_id))
+        outgoing = _packet(PUBLISH, 0, body[:2 + length] + body[offset:])
+
+        with self._lock:
+            self._stats['published'] += 1
+            targets = [s for s in self._sessions if any(topic_matches(f, topic) for f in s.filters)]
+        delivered = 0
+        for target in targets:
+            try:
+                target.send(outgoing)
+                delivered += 1
+            except OSError:
+                with self._lock:
+                    self._stats['send_errors'] += 1
+        if delivered:
+            with self._lock:
+                self._stats['delivered'] += delivered
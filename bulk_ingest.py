@@ -0,0 +1,186 @@
+import json
+from datetime import datetime, timezone
+
+import numpy as np
+
+from db import timed_query
+from ingest_queue import SENSOR_TABLE_COLUMNS
+from sensor_export import SENSOR_SOURCES
+
+# Ingesta HTTP por lotes (/api/lecturas, antes /save_sensor_data).
+# Pensada para pasarelas sin MQTT que guardan lecturas mientras están sin red y
+# después envían miles de una vez. Cada lectura es
+#     {"id_aspersor": 3, "tipo_sensor": "nivel", "valor_sensor": 12.5, "fecha_hora": ...}
+# y llegan como arreglo JSON, {"lecturas": [...]}, un solo objeto o NDJSON.
+# La validación trabaja por columnas con NumPy (una máscara por regla) en vez de
+# lectura por lectura, y las peceras se verifican con una sola consulta.
+
+# Nombres alternativos de tipo_sensor (como los publica el firmware por MQTT)
+TIPO_ALIASES = {
+    'ultrasonico': 'nivel',
+    'liquido': 'humedad',
+    'tds': 'calidad',
+}
+
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+# Rango aceptado de fecha_hora: antes de 2000 suele ser un reloj sin sincronizar
+MIN_EPOCH = 946684800
+MAX_CLOCK_SKEW = 300
+
+# Detalle de rechazos que se devuelve como mucho (el total siempre se informa)
+MAX_REJECTED_DETAILS = 100
+
+
+def parse_readings(body, mimetype):
+    """Lista de lecturas del cuerpo. Las líneas NDJSON ilegibles quedan como None.
+
+    Lanza ValueError si el cuerpo JSON no se puede leer o no tiene la forma esperada.
+    """
+    if mimetype in NDJSON_MIMETYPES:
+        readings = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                readings.append(json.loads(line))
+            except ValueError:
+                readings.append(None)
+        return readings
+
+    try:
+        data = json.loads(body)
+    except ValueError:
+        raise ValueError("JSON inválido")
+    if isinstance(data, dict):
+        data = data['lecturas'] if isinstance(data.get('lecturas'), list) else [data]
+    if not isinstance(data, list):
+        raise ValueError("Se esperaba un arreglo de lecturas")
+    return data
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return np.nan
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return np.nan
+    return np.nan
+
+
+def _field(readings, key):
+    return [reading.get(key) if isinstance(reading, dict) else None for reading in readings]
+
+
+def _epochs(raw_dates, now):
+    """Epoch en segundos de cada fecha_hora (ausente = now, ilegible = NaN)."""
+    epochs = np.fromiter((_number(v) if v is not None else now for v in raw_dates), float, len(raw_dates))
+    # Las cadenas que no son números se interpretan como ISO 8601 (sin zona = UTC), una vez por valor distinto
+    parsed = {}
+    for i in np.flatnonzero(np.isnan(epochs)):
+        value = raw_dates[i]
+        if not isinstance(value, str):
+            continue
+        if value not in parsed:
+            try:
+                moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+                if moment.tzinfo is None:
+                    moment = moment.replace(tzinfo=timezone.utc)
+                parsed[value] = moment.timestamp()
+            except ValueError:
+                parsed[value] = np.nan
+        epochs[i] = parsed[value]
+    # Epoch en milisegundos (habitual en firmware)
+    millis = epochs > 1e11
+    epochs[millis] /= 1000
+    return epochs
+
+
+def validate_readings(readings, connection, now=None):
+    """Valida las lecturas y las agrupa por tabla.
+
+    Devuelve {'rows_by_table', 'aceptadas', 'rechazadas', 'total_rechazadas'}; las
+    filas tienen la forma de SensorWriteQueue: (id_aspersor, *valores, fecha_hora).
+    """
+    now = now or datetime.now(timezone.utc).timestamp()
+    n = len(readings)
+    is_object = np.fromiter((isinstance(r, dict) for r in readings), bool, n)
+
+    ids = np.fromiter((_number(v) for v in _field(readings, 'id_aspersor')), float, n)
+    valores = np.fromiter((_number(v) for v in _field(readings, 'valor_sensor')), float, n)
+    tipos = np.array([
+        TIPO_ALIASES.get(v, v) if isinstance(v, str) else '' for v in _field(readings, 'tipo_sensor')
+    ], dtype=object)
+    epochs = _epochs(_field(readings, 'fecha_hora'), now)
+
+    with np.errstate(invalid='ignore'):
+        id_ok = np.isfinite(ids) & (ids > 0) & (ids == np.floor(ids))
+        fecha_ok = np.isfinite(epochs) & (epochs >= MIN_EPOCH) & (epochs <= now + MAX_CLOCK_SKEW)
+    tipo_ok = np.isin(tipos, list(SENSOR_SOURCES))
+    valor_ok = np.isfinite(valores)
+
+    # Peceras existentes: una consulta para todos los id distintos
+    tank_ok = np.zeros(n, dtype=bool)
+    candidates = np.unique(ids[id_ok]).astype(int).tolist()
+    if candidates:
+        cursor = connection.cursor()
+        placeholders = ', '.join('?' * len(candidates))
+        with timed_query('bulk_tanks'):
+            cursor.execute(f"SELECT id_aspersor FROM aspersores WHERE id_aspersor IN ({placeholders})", candidates)
+            known = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        tank_ok = id_ok & np.isin(ids, known)
+
+    # La primera regla que falla es el motivo del rechazo
+    checks = (
+        (is_object, "No es un objeto JSON"),
+        (id_ok, "id_aspersor inválido"),
+        (tank_ok, "Pecera inexistente"),
+        (tipo_ok, "tipo_sensor desconocido"),
+        (valor_ok, "valor_sensor no numérico"),
+        (fecha_ok, "fecha_hora inválida o fuera de rango"),
+    )
+    valid = np.ones(n, dtype=bool)
+    rechazadas = []
+    for mask, error in checks:
+        failed = valid & ~mask
+        if len(rechazadas) < MAX_REJECTED_DETAILS:
+            for i in np.flatnonzero(failed)[:MAX_REJECTED_DETAILS - len(rechazadas)]:
+                rechazadas.append({'indice': int(i), 'error': error})
+        valid &= mask
+    rechazadas.sort(key=lambda r: r['indice'])
+
+    fechas = np.char.replace(
+        np.datetime_as_string(epochs[valid].astype('datetime64[s]'), unit='s').astype(str), 'T', ' '
+    )
+    ids_validos = ids[valid].astype(int)
+    valores_validos = valores[valid]
+    tipos_validos = tipos[valid]
+
+    rows_by_table = {}
+    for tipo, (table, column) in SENSOR_SOURCES.items():
+        selected = np.flatnonzero(tipos_validos == tipo)
+        if not len(selected):
+            continue
+        columns = SENSOR_TABLE_COLUMNS[table]
+        position = columns.index(column)
+        empty = [None] * len(columns)
+        rows = rows_by_table.setdefault(table, [])
+        for id_aspersor, valor, fecha_hora in zip(
+            ids_validos[selected].tolist(), valores_validos[selected].tolist(), fechas[selected].tolist()
+        ):
+            values = list(empty)
+            values[position] = valor
+            rows.append((id_aspersor, *values, fecha_hora))
+
+    aceptadas = int(valid.sum())
+    return {
+        'rows_by_table': rows_by_table,
+        'aceptadas': aceptadas,
+        'rechazadas': rechazadas,
+        'total_rechazadas': n - aceptadas,
+    }
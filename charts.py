@@ -0,0 +1,145 @@
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from config import CHART_CACHE_MAX_MB
+
+# Gráficas PNG para los reportes.
+# Usa la API orientada a objetos (Figure + FigureCanvasAgg) en lugar de pyplot,
+# cuyo estado global no es seguro entre hilos. Cada hilo reutiliza una figura ya
+# estilizada y solo cambia los datos; el PNG resultante se guarda en una caché
+# LRU con clave = hash de la serie y del estilo, así que repetir una gráfica es gratis.
+
+TITLE_COLOR = '#0891b2'
+AXES_FACECOLOR = '#f0fdfa'
+FIGSIZE = (7, 3)
+DPI = 100
+
+# Márgenes que aplicaría el autoscale de matplotlib
+_MARGIN = 0.05
+
+
+class _ChartTemplate:
+    """Figura con ejes, rejilla y leyenda ya configurados; se rellena con cada serie."""
+
+    def __init__(self):
+        self.figure = Figure(figsize=FIGSIZE, facecolor='white')
+        self.canvas = FigureCanvasAgg(self.figure)
+        ax = self.figure.add_subplot()
+        ax.set_facecolor(AXES_FACECOLOR)
+        ax.grid(True, alpha=0.3)
+        ax.set_xlabel('Lecturas', fontsize=9)
+        self.ax = ax
+        self.line, = ax.plot([], [], linewidth=2, marker='o', markersize=3)
+        self.mean_line = ax.axhline(y=0, color='red', linestyle='--', alpha=0.5, label='Promedio')
+        self.legend = ax.legend(handles=[self.mean_line], fontsize=8)
+        self.fill = None
+
+    def render(self, valores, titulo, color, ylabel):
+        ax = self.ax
+        x = np.arange(len(valores), dtype=np.float64)
+        promedio = float(valores.mean())
+
+        self.line.set_data(x, valores)
+        self.line.set_color(color)
+        if self.fill is not None:
+            self.fill.remove()
+        self.fill = ax.fill_between(x, valores, alpha=0.3, color=color)
+        self.mean_line.set_ydata([promedio, promedio])
+        self.legend.get_texts()[0].set_text(f'Promedio: {promedio:.1f}')
+
+        ax.set_title(titulo, fontsize=12, fontweight='bold', color=TITLE_COLOR)
+        ax.set_ylabel(ylabel, fontsize=9)
+        # Límites calculados a mano (el relleno llega hasta 0, como con autoscale)
+        x_pad = (x[-1] - x[0]) * _MARGIN
+        y_min = min(0.0, float(valores.min()))
+        y_max = max(0.0, float(valores.max()))
+        y_pad = (y_max - y_min) * _MARGIN or 1.0
+        ax.set_xlim(x[0] - x_pad, x[-1] + x_pad)
+        ax.set_ylim(y_min - y_pad, y_max + y_pad)
+
+        buffer = io.BytesIO()
+        self.figure.savefig(buffer, format='png', dpi=DPI, bbox_inches='tight')
+        return buffer.getvalue()
+
+
+class ChartCache:
+    """Caché LRU de PNGs acotada por bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            png = self._items.get(key)
+            if png is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return png
+
+    def put(self, key, png):
+        with self._lock:
+            if key in self._items or len(png) > self.max_bytes:
+                return
+            self._items[key] = png
+            self._bytes += len(png)
+            while self._bytes > self.max_bytes:
+                _, old = self._items.popitem(last=False)
+                self._bytes -= len(old)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._items),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+_templates = threading.local()
+_cache = ChartCache(int(CHART_CACHE_MAX_MB * 1024 * 1024))
+
+
+def _template():
+    template = getattr(_templates, 'chart', None)
+    if template is None:
+        template = _ChartTemplate()
+        _templates.chart = template
+    return template
+
+
+def chart_key(valores, titulo, color, ylabel):
+    digest = hashlib.sha256(valores.tobytes())
+    digest.update(f"{len(valores)}|{titulo}|{color}|{ylabel}|{FIGSIZE}|{DPI}".encode())
+    return digest.hexdigest()
+
+
+def render_line_chart(valores, titulo, color, ylabel):
+    """PNG (bytes) de la serie con área, línea de promedio y leyenda. None si hay menos de 2 puntos."""
+    valores = np.asarray(valores, dtype=np.float64)
+    if valores.size < 2:
+        return None
+    key = chart_key(valores, titulo, color, ylabel)
+    png = _cache.get(key)
+    if png is None:
+        png = _template().render(valores, titulo, color, ylabel)
+        _cache.put(key, png)
+    return png
+
+
+def chart_cache_stats():
+    return _cache.stats()
@@ -1,6 +1,6 @@
-import sqlite3
+from db import open_connection
 
-conn = sqlite3.connect('database.db')
+conn = open_connection('database.db', row_factory=None)
 cursor = conn.cursor()
 
 print('=== DATOS RECIENTES ===')
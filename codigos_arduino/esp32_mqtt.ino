@@ -21,6 +21,16 @@ const char* mqtt_client_id = "AquaZen_ESP32";
 // Tópicos MQTT
 const char* topic_catcher = "AquaZen/catcher";
 const char* topic_sender = "AquaZen/sender";
+const char* topic_sender_bin = "AquaZen/sender/bin";
+
+// ========== TRAMAS BINARIAS ==========
+// 1 = las lecturas de sensores se publican en topic_sender_bin como tramas
+// compactas (formato en sensor_frames.py del servidor), agrupadas en lotes.
+// Los demás mensajes (teclado, confirmaciones, estado) siguen en JSON.
+#define USAR_TRAMAS_BINARIAS 0
+#define TRAMA_VERSION 1
+#define MAX_LECTURAS_TRAMA 32
+const unsigned long TRAMA_INTERVALO = 5000;  // ms máximos que una lectura espera en el lote
 
 // ========== CONFIGURACIÓN UART ==========
 #define UART_MEGA Serial2
@@ -38,6 +48,13 @@ unsigned long lastReconnectAttempt = 0;
 unsigned long lastStatusReport = 0;
 const unsigned long STATUS_INTERVAL = 30000;
 
+// Lote binario en construcción: cabecera (versión, cantidad) + lecturas
+uint8_t trama[2 + MAX_LECTURAS_TRAMA * 9];
+size_t tramaLen = 2;
+uint8_t tramaCount = 0;
+size_t tramaOffsets[MAX_LECTURAS_TRAMA];         // posición de cada lectura en la trama
+unsigned long tramaTiempos[MAX_LECTURAS_TRAMA];  // millis() de cada lectura (para su antigüedad)
+
 // ========== SETUP ==========
 void setup() {
   Serial.begin(115200);
@@ -80,6 +97,11 @@ void loop() {
   
   leerDatosDelMega();
   enviarEstadoSistema();
+#if USAR_TRAMAS_BINARIAS
+  if (tramaCount > 0 && millis() - tramaTiempos[0] >= TRAMA_INTERVALO) {
+    enviarTramaBinaria();
+  }
+#endif
 }
 
 // ========== CONFIGURACIÓN WiFi ==========
@@ -291,6 +313,14 @@ void procesarMensajeMega(String mensaje) {
     DeserializationError error = deserializeJson(doc, jsonData);
     
     if (!error) {
+#if USAR_TRAMAS_BINARIAS
+      if (agregarLecturaBinaria(doc)) {
+        Serial.print("  → Agregado al lote binario [");
+        Serial.print(tipoSensor);
+        Serial.println("]");
+        return;
+      }
+#endif
       bool publicado = mqttClient.publish(topic_sender, jsonData.c_str());
       
       if (publicado) {
@@ -340,4 +370,104 @@ void enviarEstadoSistema() {
       Serial.println("[INFO] Estado del sistema enviado a MQTT");
     }
   }
-}
\ No newline at end of file
+}
+
+// ========== TRAMAS BINARIAS ==========
+void escribirU16(uint8_t* destino, uint16_t valor) {
+  destino[0] = valor & 0xFF;
+  destino[1] = valor >> 8;
+}
+
+void escribirF32(uint8_t* destino, float valor) {
+  memcpy(destino, &valor, 4);  // ESP32 es little-endian, igual que la trama
+}
+
+uint8_t indiceEstado(const char* estado) {
+  const char* estados[] = {"MENU", "AUTO", "VACIAR", "LLENAR", "RENOV", "DESC"};
+  for (uint8_t i = 0; i < 6; i++) {
+    if (strcmp(estado, estados[i]) == 0) {
+      return i;
+    }
+  }
+  return 5;  // DESC
+}
+
+// Agrega la lectura al lote. Devuelve false si el sensor no tiene formato binario.
+bool agregarLecturaBinaria(JsonDocument& doc) {
+  const char* sensor = doc["sensor"] | "";
+  uint8_t cuerpo[7];
+  size_t largo;
+  uint8_t tipo;
+
+  if (strcmp(sensor, "ultrasonico") == 0) {
+    tipo = 1;
+    escribirU16(cuerpo, (uint16_t)(int16_t)(doc["distancia_cm"] | 0));
+    largo = 2;
+  } else if (strcmp(sensor, "liquido") == 0) {
+    tipo = 2;
+    escribirF32(cuerpo, doc["nivel_pct"] | 0.0f);
+    escribirU16(cuerpo + 4, doc["raw"] | 0);
+    largo = 6;
+  } else if (strcmp(sensor, "tds") == 0) {
+    tipo = 3;
+    escribirF32(cuerpo, doc["ppm"] | 0.0f);
+    escribirU16(cuerpo + 4, doc["raw"] | 0);
+    cuerpo[6] = strcmp(doc["calidad"] | "", "MALA") == 0 ? 1 : 0;
+    largo = 7;
+  } else if (strcmp(sensor, "sistema") == 0) {
+    tipo = 4;
+    cuerpo[0] = indiceEstado(doc["estado"] | "DESC");
+    cuerpo[1] = doc["bomba6"] | 0;
+    cuerpo[2] = doc["bomba7"] | 0;
+    cuerpo[3] = doc["servo_pos"] | 0;
+    cuerpo[4] = doc["eventos_activos"] | 0;
+    largo = 5;
+  } else {
+    return false;
+  }
+
+  if (tramaCount == MAX_LECTURAS_TRAMA) {
+    enviarTramaBinaria();
+  }
+  if (tramaCount == MAX_LECTURAS_TRAMA) {
+    // Sin conexión y lote lleno: se descarta el lote más viejo
+    Serial.println("  ✗ Lote binario lleno sin conexión, se descarta");
+    tramaCount = 0;
+    tramaLen = 2;
+  }
+
+  tramaOffsets[tramaCount] = tramaLen;
+  tramaTiempos[tramaCount] = millis();
+  trama[tramaLen] = tipo;
+  tramaLen += 3;  // tipo + antigüedad (se completa al enviar)
+  memcpy(trama + tramaLen, cuerpo, largo);
+  tramaLen += largo;
+  tramaCount++;
+  return true;
+}
+
+void enviarTramaBinaria() {
+  if (tramaCount == 0 || !mqttClient.connected()) {
+    return;
+  }
+
+  unsigned long ahora = millis();
+  trama[0] = TRAMA_VERSION;
+  trama[1] = tramaCount;
+  for (uint8_t i = 0; i < tramaCount; i++) {
+    unsigned long edad = (ahora - tramaTiempos[i]) / 1000;
+    escribirU16(trama + tramaOffsets[i] + 1, edad > 0xFFFF ? 0xFFFF : edad);
+  }
+
+  if (mqttClient.publish(topic_sender_bin, trama, tramaLen)) {
+    Serial.print("  → Trama binaria publicada (");
+    Serial.print(tramaCount);
+    Serial.print(" lecturas, ");
+    Serial.print(tramaLen);
+    Serial.println(" bytes)");
+    tramaCount = 0;
+    tramaLen = 2;
+  } else {
+    Serial.println("  ✗ Error al publicar trama binaria");
+  }
+}
@@ -0,0 +1,231 @@
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import paho.mqtt.client as mqtt
+
+# Despacho de comandos MQTT sin bloquear la petición HTTP.
+# submit() publica con QoS 1 y devuelve un id al instante; el PUBACK llega por
+# on_publish en el hilo de paho y marca el comando como confirmado. Si no llega
+# antes del plazo, el comando pasa a expirado. Cada tipo de comando guarda un
+# histograma de latencia publicación -> PUBACK.
+
+ESTADO_PENDIENTE = 'pendiente'
+ESTADO_CONFIRMADO = 'confirmado'
+ESTADO_EXPIRADO = 'expirado'
+ESTADO_ERROR = 'error'
+
+# Límites superiores (ms) de los buckets del histograma; el último es +inf
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class LatencyHistogram:
+    """Histograma acumulado de latencias en milisegundos."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, value_ms):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value_ms <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.total_ms += value_ms
+        self.max_ms = max(self.max_ms, value_ms)
+
+    def quantile(self, q):
+        """Cota superior del bucket que contiene el cuantil q (None sin datos)."""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.buckets[i] if i < len(self.buckets) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self):
+        labels = [f"le_{b}" for b in self.buckets] + ['le_inf']
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total_ms / self.count, 3) if self.count else None,
+            'max_ms': round(self.max_ms, 3),
+            'p50_ms': self.quantile(0.5),
+            'p95_ms': self.quantile(0.95),
+            'p99_ms': self.quantile(0.99),
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+
+class CommandDispatcher:
+    """Publica comandos con QoS 1 y sigue su PUBACK con un plazo por comando."""
+
+    def __init__(self, topic, ack_timeout=5.0, max_commands=500):
+        self.topic = topic
+        self.ack_timeout = ack_timeout
+        self.max_commands = max_commands
+        self._client = None
+        self._commands = OrderedDict()
+        self._by_mid = {}
+        # PUBACKs que llegaron antes de registrar el mid devuelto por publish()
+        self._early_acks = {}
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._stats = {
+            'submitted': 0,
+            'confirmed': 0,
+            'expired': 0,
+            'failed': 0,
+            'late_acks': 0,
+        }
+
+    def attach(self, client):
+        """Usa este cliente paho para publicar y escucha sus PUBACK."""
+        self._client = client
+        client.on_publish = self.on_publish
+
+    def submit(self, payload, tipo=None, topic=None):
+        """Publica el comando sin esperar confirmación. Devuelve su estado inicial.
+
+        topic reemplaza al tópico del dispatcher (comandos dirigidos a una pecera).
+        """
+        topic = topic or self.topic
+        now = time.monotonic()
+        command = {
+            'id': uuid.uuid4().hex,
+            'tipo': tipo or payload.get('tipo'),
+            'topic': topic,
+            'estado': ESTADO_PENDIENTE,
+            'creado': datetime.now(timezone.utc).isoformat(),
+            'latencia_ms': None,
+            'error': None,
+            '_sent': now,
+            '_deadline': now + self.ack_timeout,
+            '_mid': None,
+        }
+        with self._lock:
+            self._stats['submitted'] += 1
+            self._remember(command)
+
+        client = self._client
+        if client is None:
+            self._fail(command, "Cliente MQTT no inicializado")
+            return self.get(command['id'])
+        try:
+            info = client.publish(topic, json.dumps(payload), qos=1)
+        except Exception as e:
+            self._fail(command, str(e))
+            return self.get(command['id'])
+
+        # Sin conexión paho conserva el mensaje QoS 1 y lo envía al reconectar;
+        # el plazo decide si todavía sirve
+        if info.rc not in (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN):
+            self._fail(command, mqtt.error_string(info.rc))
+            return self.get(command['id'])
+
+        with self._lock:
+            command['_mid'] = info.mid
+            acked_at = self._early_acks.pop(info.mid, None)
+            # Un ack anterior al envío es de un mid reciclado, no de este comando
+            if acked_at is not None and acked_at >= command['_sent']:
+                self._confirm(command, acked_at)
+            else:
+                self._by_mid[info.mid] = command
+        return self.get(command['id'])
+
+    def on_publish(self, client, userdata, mid, reason_code=None, properties=None):
+        """Callback de paho (hilo de red): llegó el PUBACK del mensaje mid."""
+        now = time.monotonic()
+        with self._lock:
+            command = self._by_mid.pop(mid, None)
+            if command is None:
+                self._early_acks[mid] = now
+                # Los mids se reciclan: no acumular acks huérfanos
+                while len(self._early_acks) > 1000:
+                    self._early_acks.pop(next(iter(self._early_acks)))
+                return
+            self._confirm(command, now)
+
+    def _confirm(self, command, acked_at):
+        latency_ms = round((acked_at - command['_sent']) * 1000, 3)
+        if command['estado'] == ESTADO_EXPIRADO or acked_at > command['_deadline']:
+            # Confirmado después del plazo: se informa pero sigue expirado
+            if command['estado'] != ESTADO_EXPIRADO:
+                self._expire(command)
+            command['confirmado_tarde_ms'] = latency_ms
+            self._stats['late_acks'] += 1
+            return
+        command['estado'] = ESTADO_CONFIRMADO
+        command['latencia_ms'] = latency_ms
+        self._stats['confirmed'] += 1
+        self._histogram(command['tipo']).observe(latency_ms)
+
+    def _expire(self, command):
+        command['estado'] = ESTADO_EXPIRADO
+        command['error'] = f"Sin PUBACK en {self.ack_timeout:g} s"
+        self._stats['expired'] += 1
+
+    def _fail(self, command, error):
+        print(f"MQTT error publicando en {command['topic']}: {error}")
+        with self._lock:
+            command['estado'] = ESTADO_ERROR
+            command['error'] = error
+            self._stats['failed'] += 1
+
+    def _histogram(self, tipo):
+        histogram = self._histograms.get(tipo)
+        if histogram is None:
+            histogram = self._histograms[tipo] = LatencyHistogram()
+        return histogram
+
+    def _remember(self, command):
+        self._commands[command['id']] = command
+        while len(self._commands) > self.max_commands:
+            _, old = self._commands.popitem(last=False)
+            if old['_mid'] is not None and self._by_mid.get(old['_mid']) is old:
+                del self._by_mid[old['_mid']]
+
+    def _sweep(self, now=None):
+        """Marca como expirados los pendientes cuyo plazo ya pasó (con el lock tomado)."""
+        now = now or time.monotonic()
+        for command in self._commands.values():
+            if command['estado'] == ESTADO_PENDIENTE and now > command['_deadline']:
+                self._expire(command)
+        # Un ack temprano se reclama en microsegundos; pasado el plazo ya no es de nadie
+        stale = [mid for mid, acked_at in self._early_acks.items() if now - acked_at > self.ack_timeout]
+        for mid in stale:
+            del self._early_acks[mid]
+
+    @staticmethod
+    def _public(command):
+        return {k: v for k, v in command.items() if not k.startswith('_')}
+
+    def get(self, command_id):
+        with self._lock:
+            self._sweep()
+            command = self._commands.get(command_id)
+            return self._public(command) if command else None
+
+    def stats(self):
+        with self._lock:
+            self._sweep()
+            data = dict(self._stats)
+            data['pending'] = sum(1 for c in self._commands.values() if c['estado'] == ESTADO_PENDIENTE)
+            data['latency'] = {tipo: h.snapshot() for tipo, h in self._histograms.items()}
+        data.update({
+            'topic': self.topic,
+            'ack_timeout': self.ack_timeout,
+            'connected': bool(self._client and self._client.is_connected()),
+        })
+        return data
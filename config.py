@@ -5,6 +5,11 @@ import os
 
 # Base de datos
 DATABASE = os.environ.get('DATABASE_FILE', 'icc_database.db')
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))                  # conexiones reutilizables
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))          # segundos esperando una libre
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))
+DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 64 * 1024 * 1024))   # bytes
+DB_CACHE_SIZE_KB = int(os.environ.get('DB_CACHE_SIZE_KB', 16384))
 
 # MQTT
 MQTT_BROKER = os.environ.get('MQTT_BROKER', '192.168.18.215')  # IP del broker actual
@@ -22,3 +27,68 @@ MQTT_TOPICS = {
     'sender': MQTT_TOPIC_SENDER,
     'catcher': MQTT_TOPIC_CATCHER,
 }
+
+# Cola write-behind de lecturas MQTT
+INGEST_QUEUE_MAX = int(os.environ.get('INGEST_QUEUE_MAX', 10000))        # lecturas en espera antes de descartar
+INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', 500))        # máximo de lecturas por transacción
+INGEST_FLUSH_INTERVAL = float(os.environ.get('INGEST_FLUSH_INTERVAL', 0.5))  # segundos por ventana de escritura
+INGEST_WRITE_RETRIES = int(os.environ.get('INGEST_WRITE_RETRIES', 3))    # reintentos de un lote con la BD bloqueada
+INGEST_RETRY_BACKOFF = float(os.environ.get('INGEST_RETRY_BACKOFF', 0.1))  # segundos de la primera espera (se duplica)
+
+# Retención de lecturas (se aplica en segundo plano, no en cada INSERT)
+MAX_SENSOR_RECORDS = int(os.environ.get('MAX_SENSOR_RECORDS', 100))          # 0 = sin límite de filas
+SENSOR_TTL_HOURS = float(os.environ.get('SENSOR_TTL_HOURS', 0))              # 0 = sin TTL
+RETENTION_INTERVAL = float(os.environ.get('RETENTION_INTERVAL', 30))         # segundos entre pasadas
+RETENTION_HIGH_WATER = int(os.environ.get('RETENTION_HIGH_WATER', 0)) or None  # inserciones que disparan una pasada
+
+# Stream SSE de sensores (/stream/sensors)
+SSE_CLIENT_BUFFER = int(os.environ.get('SSE_CLIENT_BUFFER', 100))   # mensajes en cola por cliente antes de desconectarlo
+SSE_HEARTBEAT = float(os.environ.get('SSE_HEARTBEAT', 15))          # segundos entre keep-alive
+
+# Reportes PDF en segundo plano (/api/reportes)
+REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', 2))                 # procesos generando PDFs
+REPORT_CACHE_DIR = os.environ.get('REPORT_CACHE_DIR', 'report_cache')     # PDFs terminados
+REPORT_CACHE_MAX_MB = float(os.environ.get('REPORT_CACHE_MAX_MB', 200))   # tamaño máximo en disco (LRU)
+REPORT_CACHE_TTL = int(os.environ.get('REPORT_CACHE_TTL', 300))           # segundos que un PDF se reutiliza sin datos nuevos
+REPORT_SYNC_TIMEOUT = float(os.environ.get('REPORT_SYNC_TIMEOUT', 120))   # espera máxima de GET /generar_reporte
+CHART_CACHE_MAX_MB = float(os.environ.get('CHART_CACHE_MAX_MB', 32))       # PNGs de gráficas en memoria (LRU)
+
+# Puerto Serial del Arduino (/api/cambiar_modo_motor)
+SERIAL_PORT = os.environ.get('SERIAL_PORT', 'COM6')
+SERIAL_BAUD_RATE = int(os.environ.get('SERIAL_BAUD_RATE', 9600))
+SERIAL_ACK_TIMEOUT = float(os.environ.get('SERIAL_ACK_TIMEOUT', 2))      # segundos esperando la respuesta del Arduino
+SERIAL_ACK_WAIT = float(os.environ.get('SERIAL_ACK_WAIT', 0.25))         # espera máxima de la petición HTTP antes de responder 202
+SERIAL_ASPERSOR_ID = int(os.environ.get('SERIAL_ASPERSOR_ID', 0)) or None  # pecera de las lecturas Serial (vacío = la de por defecto)
+
+# Ejecución de programaciones_riego (comandos EXCEPCIONAL/CANCELAR hacia el catcher)
+SCHEDULE_EVENT = os.environ.get('SCHEDULE_EVENT', 'BOMBA6')                     # evento que se activa durante la programación (BOMBA6 = llenado)
+SCHEDULE_MISFIRE_GRACE = float(os.environ.get('SCHEDULE_MISFIRE_GRACE', 300))   # segundos de retraso tras los que un disparo se omite
+
+# Logging estructurado (logs.py)
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')                  # nivel de los loggers aquazen.*
+LOG_LEVELS = os.environ.get('LOG_LEVELS', '')                    # por logger: 'mqtt=DEBUG,serial=WARNING'
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')                # json (una línea por registro) o text
+LOG_RATE_LIMIT = float(os.environ.get('LOG_RATE_LIMIT', 20))     # registros por segundo por sitio de llamada (0 = sin límite)
+LOG_SAMPLE_EVERY = int(os.environ.get('LOG_SAMPLE_EVERY', 100))  # los sitios muestreados emiten 1 de cada N
+
+# Precarga en segundo plano de módulos pesados tras el arranque (-1 = desactivada)
+WARMUP_DELAY = float(os.environ.get('WARMUP_DELAY', 2))
+
+# Comandos MQTT hacia el catcher (/api/catcher_command)
+MQTT_COMMAND_TIMEOUT = float(os.environ.get('MQTT_COMMAND_TIMEOUT', 5))    # segundos esperando el PUBACK
+MQTT_COMMAND_HISTORY = int(os.environ.get('MQTT_COMMAND_HISTORY', 500))    # comandos recordados para consultar su estado
+
+# Respuestas JSON de sensores (ETag por marca de agua, micro-caché y compresión)
+HTTP_CACHE_TTL = float(os.environ.get('HTTP_CACHE_TTL', 1.0))                  # segundos que se reutiliza un cuerpo ya generado
+HTTP_COMPRESS_MIN_BYTES = int(os.environ.get('HTTP_COMPRESS_MIN_BYTES', 1024))  # cuerpos más chicos se envían sin comprimir
+
+# Ingesta HTTP por lotes (/api/lecturas)
+BULK_INGEST_MAX_ROWS = int(os.environ.get('BULK_INGEST_MAX_ROWS', 50000))   # lecturas por petición
+BULK_INGEST_MAX_MB = float(os.environ.get('BULK_INGEST_MAX_MB', 16))        # tamaño máximo del cuerpo
+
+# Ingesta en un proceso aparte (ingest_service.py)
+INGEST_MODE = os.environ.get('INGEST_MODE', 'embedded')                    # embedded = Flask se suscribe a MQTT; service = lo hace ingest_service.py
+INGEST_IPC_HOST = os.environ.get('INGEST_IPC_HOST', '127.0.0.1')           # canal local servicio -> procesos web
+INGEST_IPC_PORT = int(os.environ.get('INGEST_IPC_PORT', 6789))
+INGEST_IPC_AUTHKEY = os.environ.get('INGEST_IPC_AUTHKEY')                  # clave compartida del handshake; obligatoria con el servicio, sin valor por defecto
+INGEST_METRICS_PORT = int(os.environ.get('INGEST_METRICS_PORT', 9108))      # /metrics del servicio de ingesta (0 = sin servidor)
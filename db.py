@@ -0,0 +1,245 @@
+import queue
+import sqlite3
+import threading
+import time
+
+import metrics
+from logs import get_logger
+from config import (
+    DATABASE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_BUSY_TIMEOUT_MS,
+    DB_MMAP_SIZE,
+    DB_CACHE_SIZE_KB
+)
+
+# Gestor de conexiones SQLite.
+# Las conexiones se abren una sola vez con WAL y los PRAGMA de rendimiento y se
+# reutilizan desde un pool pequeño. Con WAL las escrituras del hilo MQTT ya no
+# bloquean las lecturas de los hilos de Flask.
+
+log = get_logger('db')
+
+# Duración de sentencias por nombre: with timed_query('nombre'): cursor.execute(...)
+QUERY_SECONDS = metrics.histogram(
+    'aquazen_sqlite_query_seconds', 'Duración de sentencias SQLite por consulta', ('query',)
+)
+
+
+def timed_query(name):
+    return QUERY_SECONDS.time(name)
+
+
+def _configure(connection, journal_mode='WAL'):
+    cursor = connection.cursor()
+    if journal_mode:
+        cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT_MS)}")
+    cursor.execute(f"PRAGMA mmap_size={int(DB_MMAP_SIZE)}")
+    cursor.execute(f"PRAGMA cache_size=-{int(DB_CACHE_SIZE_KB)}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    # SQLite no aplica FOREIGN KEY ... ON DELETE CASCADE si no se activa en cada conexión
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def open_connection(path=DATABASE, row_factory=sqlite3.Row, check_same_thread=True):
+    """Abre una conexión suelta (sin pool) con los mismos PRAGMA que el pool. Para scripts."""
+    connection = sqlite3.connect(
+        str(path),
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=check_same_thread
+    )
+    if row_factory is not None:
+        connection.row_factory = row_factory
+    _configure(connection)
+    return connection
+
+
+class PooledConnection:
+    """Conexión prestada por el pool: se usa igual que sqlite3.Connection y close() la devuelve."""
+
+    __slots__ = ('_pool', '_raw', '_overflow')
+
+    def __init__(self, pool, raw, overflow=False):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_raw', raw)
+        object.__setattr__(self, '_overflow', overflow)
+
+    def __getattr__(self, name):
+        raw = object.__getattribute__(self, '_raw')
+        if raw is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(raw, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._raw, name, value)
+
+    def __enter__(self):
+        self._raw.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._raw.__exit__(exc_type, exc, tb)
+
+    def close(self):
+        raw = self._raw
+        if raw is None:
+            return
+        object.__setattr__(self, '_raw', None)
+        self._pool._release(raw, self._overflow)
+
+    def __del__(self):
+        # Red de seguridad para rutas que olvidan cerrar la conexión
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Pool acotado de conexiones SQLite reutilizables entre hilos."""
+
+    def __init__(self, database=DATABASE, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        # LIFO: se reutiliza primero la conexión con la caché más caliente
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._stats = {
+            'acquired': 0,
+            'hits': 0,
+            'opens': 0,
+            'waits': 0,
+            'wait_ms_total': 0.0,
+            'wait_ms_max': 0.0,
+            'overflow': 0,
+        }
+
+    def _open(self):
+        connection = sqlite3.connect(
+            self.database,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False
+        )
+        connection.row_factory = sqlite3.Row
+        _configure(connection)
+        return connection
+
+    def acquire(self):
+        """Presta una conexión: reutiliza una libre, abre otra si hay cupo o espera."""
+        try:
+            raw = self._idle.get_nowait()
+            self._record(hit=True)
+            return PooledConnection(self, raw)
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_open = self._opened < self.size
+            if can_open:
+                self._opened += 1
+        if can_open:
+            try:
+                raw = self._open()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+            self._record(opened=True)
+            return PooledConnection(self, raw)
+
+        started = time.perf_counter()
+        try:
+            raw = self._idle.get(timeout=self.timeout)
+            overflow = False
+        except queue.Empty:
+            # Pool agotado (posible fuga): conexión temporal que se cierra al devolverla
+            raw = self._open()
+            overflow = True
+        waited_ms = (time.perf_counter() - started) * 1000
+        self._record(waited_ms=waited_ms, overflow=overflow)
+        return PooledConnection(self, raw, overflow)
+
+    def _release(self, raw, overflow=False):
+        try:
+            if raw.in_transaction:
+                raw.rollback()
+        except sqlite3.Error:
+            # Conexión en mal estado: se descarta y se libera su cupo
+            if not overflow:
+                overflow = True
+                with self._lock:
+                    self._opened -= 1
+        if overflow:
+            raw.close()
+            return
+        self._idle.put(raw)
+
+    def _record(self, hit=False, opened=False, waited_ms=None, overflow=False):
+        with self._lock:
+            self._stats['acquired'] += 1
+            if hit:
+                self._stats['hits'] += 1
+            if opened:
+                self._stats['opens'] += 1
+            if waited_ms is not None:
+                self._stats['waits'] += 1
+                self._stats['wait_ms_total'] += waited_ms
+                self._stats['wait_ms_max'] = max(self._stats['wait_ms_max'], waited_ms)
+            if overflow:
+                self._stats['overflow'] += 1
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            opened = self._opened
+        idle = self._idle.qsize()
+        data.update({
+            'database': self.database,
+            'size': self.size,
+            'open': opened,
+            'idle': idle,
+            'in_use': opened - idle,
+            'hit_ratio': round(data['hits'] / data['acquired'], 4) if data['acquired'] else None,
+            'wait_ms_total': round(data['wait_ms_total'], 3),
+            'wait_ms_max': round(data['wait_ms_max'], 3),
+        })
+        return data
+
+    def close_all(self):
+        while True:
+            try:
+                raw = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            raw.close()
+            with self._lock:
+                self._opened -= 1
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Pool compartido del proceso para la base de datos configurada."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def get_db_connection():
+    """Devuelve una conexión del pool (close() la devuelve) o None si falla."""
+    try:
+        return get_pool().acquire()
+    except Exception as e:
+        log.error("Error al conectar a la base de datos", extra={'error': str(e)})
+        return None
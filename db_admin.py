@@ -1,17 +1,17 @@
-import sqlite3
 import argparse
 import sys
 from pathlib import Path
 
-DB_PATH = Path(__file__).parent / 'icc_database.db'
+from config import DATABASE
+from db import open_connection
+
+DB_PATH = Path(DATABASE) if Path(DATABASE).is_absolute() else Path(__file__).parent / DATABASE
 
 def connect():
     if not DB_PATH.exists():
         print(f'ERROR: No existe la base de datos en {DB_PATH}. Ejecuta primero la aplicación para inicializarla.')
         sys.exit(1)
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return open_connection(DB_PATH)
 
 def show_users():
     conn = connect(); cur = conn.cursor()
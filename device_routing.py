@@ -0,0 +1,106 @@
+import threading
+import time
+
+# Enrutamiento de lecturas MQTT por pecera.
+# Cada dispositivo publica en AquaZen/<dispositivo>/sender; <dispositivo> es el
+# device_id registrado en aspersores o directamente el id_aspersor. Los comandos
+# dirigidos a una pecera salen por AquaZen/<dispositivo>/catcher con la misma regla. El mapa
+# dispositivo -> id_aspersor vive en memoria para no consultar la BD por mensaje
+# y se invalida cuando se crea, edita o elimina una pecera.
+
+# Segundos que se recuerda un dispositivo desconocido antes de volver a consultarlo
+UNKNOWN_DEVICE_TTL = 60.0
+
+
+def device_topic(base_topic, device):
+    """Tópico de un dispositivo: AquaZen/catcher -> AquaZen/<dispositivo>/catcher."""
+    prefix, _, leaf = base_topic.rpartition('/')
+    return f"{prefix}/{device}/{leaf}" if prefix else f"{device}/{leaf}"
+
+
+def sender_topic_filter(base_topic):
+    """Filtro con comodín para los tópicos por pecera: AquaZen/sender -> AquaZen/+/sender."""
+    return device_topic(base_topic, '+')
+
+
+def parse_sender_topic(topic, base_topic):
+    """Devuelve el segmento de dispositivo de AquaZen/<dispositivo>/sender, o None para el tópico base."""
+    if topic == base_topic:
+        return None
+    prefix, _, leaf = base_topic.rpartition('/')
+    parts = topic.split('/')
+    expected = (prefix.split('/') if prefix else []) + ['*', leaf]
+    if len(parts) != len(expected):
+        return None
+    for part, want in zip(parts, expected):
+        if want != '*' and part != want:
+            return None
+    return parts[len(expected) - 2] or None
+
+
+class DeviceRegistry:
+    """Mapa en memoria dispositivo -> id_aspersor con invalidación explícita."""
+
+    def __init__(self, connection_factory, unknown_ttl=UNKNOWN_DEVICE_TTL):
+        self._connection_factory = connection_factory
+        self.unknown_ttl = unknown_ttl
+        self._devices = {}
+        self._unknown = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'lookups': 0, 'unknown': 0, 'invalidations': 0}
+
+    def resolve(self, device_id):
+        """id_aspersor del dispositivo, o None si no corresponde a ninguna pecera."""
+        id_aspersor = self._devices.get(device_id)
+        if id_aspersor is not None:
+            self._stats['hits'] += 1
+            return id_aspersor
+        unknown_until = self._unknown.get(device_id)
+        if unknown_until is not None and unknown_until > time.monotonic():
+            self._stats['unknown'] += 1
+            return None
+
+        with self._lock:
+            self._stats['lookups'] += 1
+            id_aspersor = self._lookup(device_id)
+            if id_aspersor is None:
+                self._unknown[device_id] = time.monotonic() + self.unknown_ttl
+                self._stats['unknown'] += 1
+            else:
+                self._unknown.pop(device_id, None)
+                self._devices[device_id] = id_aspersor
+        return id_aspersor
+
+    def _lookup(self, device_id):
+        connection = self._connection_factory()
+        if not connection:
+            return None
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT id_aspersor FROM aspersores WHERE device_id = ?", (device_id,))
+            row = cursor.fetchone()
+            if row is None and device_id.isdigit():
+                cursor.execute("SELECT id_aspersor FROM aspersores WHERE id_aspersor = ?", (int(device_id),))
+                row = cursor.fetchone()
+            cursor.close()
+            return row[0] if row else None
+        finally:
+            connection.close()
+
+    def invalidate(self, device_id=None):
+        """Olvida un dispositivo (o todos); la próxima lectura vuelve a consultar la BD."""
+        with self._lock:
+            self._stats['invalidations'] += 1
+            if device_id is None:
+                self._devices.clear()
+                self._unknown.clear()
+            else:
+                self._devices.pop(device_id, None)
+                self._unknown.pop(device_id, None)
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data['devices'] = dict(self._devices)
+            data['unknown_devices'] = len(self._unknown)
+        return data
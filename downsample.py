@@ -0,0 +1,42 @@
+import numpy as np
+
+# Reducción de series para gráficas.
+# Largest-Triangle-Three-Buckets (Steinarsson, 2013): conserva la forma visual y
+# los picos de la serie eligiendo en cada bucket el punto que forma el triángulo
+# de mayor área con el punto anterior elegido y el promedio del bucket siguiente.
+
+
+def lttb(x, y, n_out):
+    """Devuelve los índices de los n_out puntos elegidos por LTTB (x creciente)."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # Bordes de los n_out - 2 buckets interiores (primer y último punto fijos)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_end = n - 1, n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        bucket_x = x[start:end]
+        bucket_y = y[start:end]
+        # Área (x2) del triángulo (a, punto del bucket, promedio siguiente)
+        areas = np.abs(
+            (x[a] - avg_x) * (bucket_y - y[a])
+            - (x[a] - bucket_x) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
@@ -0,0 +1,225 @@
+import functools
+import gzip
+import hashlib
+import itertools
+import os
+import threading
+import time
+
+from flask import Response, request, session
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se comprime con gzip
+    brotli = None
+
+# Capa de respuestas para los endpoints JSON que el front-end consulta con setInterval.
+#  - Cada tabla tiene una marca de agua de escritura en memoria que se incrementa
+#    después de que la app confirma una escritura en ella (lotes de ingesta,
+#    retención, formularios). Incrementarla antes del commit permitiría guardar
+#    en caché datos viejos con el ETag nuevo.
+#  - El ETag se arma con esas marcas: si el cliente ya tiene la versión se responde
+#    304 sin abrir una conexión a SQLite.
+#  - El cuerpo se guarda unos instantes (micro-caché) y las peticiones idénticas
+#    concurrentes esperan a la primera en vez de repetir la consulta.
+#  - Los cuerpos grandes se envían con br (si está instalado) o gzip.
+
+
+class TableWatermarks:
+    """Contador de escrituras por tabla; el prefijo distingue reinicios del proceso."""
+
+    def __init__(self):
+        self._boot = os.urandom(3).hex()
+        self._counter = itertools.count(1)
+        self._marks = {}
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """listener(tables) se llama con cada bump local (para avisar a otros procesos)."""
+        self._listeners.append(listener)
+
+    def bump(self, *tables, propagate=True):
+        """Marca tables como modificadas; propagate=False para cambios que ya vienen de otro proceso."""
+        with self._lock:
+            value = next(self._counter)
+            for table in tables:
+                self._marks[table] = value
+        if propagate:
+            for listener in self._listeners:
+                listener(list(tables))
+
+    def on_commit(self, rows_by_table):
+        """Hook posterior al commit de SensorWriteQueue: las tablas del lote cambiaron."""
+        self.bump(*rows_by_table)
+
+    def on_prune(self, table, deleted):
+        """Hook de RetentionEngine: se borraron filas de table."""
+        self.bump(table)
+
+    def etag_for(self, tables):
+        marks = self._marks
+        return self._boot + '.' + '.'.join(str(marks.get(table, 0)) for table in tables)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._marks)
+
+
+class _Entry:
+    __slots__ = ('etag', 'created', 'status', 'mimetype', 'body', 'encoded', 'ready')
+
+    def __init__(self, etag):
+        self.etag = etag
+        self.created = time.monotonic()
+        self.status = None
+        self.mimetype = None
+        self.body = None
+        self.encoded = {}
+        self.ready = threading.Event()
+
+
+def _accepted_encoding():
+    accept = request.accept_encodings
+    if brotli is not None and accept['br']:
+        return 'br'
+    if accept['gzip']:
+        return 'gzip'
+    return None
+
+
+class ResponseCache:
+    """ETags por marca de agua, 304, micro-caché con una sola consulta en vuelo y compresión."""
+
+    def __init__(self, watermarks, ttl=1.0, min_compress_size=1024, max_entries=256):
+        self.watermarks = watermarks
+        self.ttl = ttl
+        self.min_compress_size = min_compress_size
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'not_modified': 0,
+            'hits': 0,
+            'coalesced': 0,
+            'misses': 0,
+            'compressed': 0,
+            'bytes_raw': 0,
+            'bytes_sent': 0,
+        }
+
+    def cached_json(self, *tables, per_user=False):
+        """Decorador para vistas JSON de solo lectura que dependen de tables."""
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                return self._serve(view, tables, per_user, args, kwargs)
+            return wrapper
+        return decorator
+
+    def _key(self, per_user):
+        key = request.full_path
+        if per_user:
+            key += f"|u={session.get('id_usuario')}"
+        return key
+
+    def _serve(self, view, tables, per_user, args, kwargs):
+        key = self._key(per_user)
+        etag = hashlib.sha1(f"{key}|{self.watermarks.etag_for(tables)}".encode()).hexdigest()[:20]
+
+        if request.if_none_match.contains(etag):
+            with self._lock:
+                self._stats['not_modified'] += 1
+            return self._finish(Response(status=304), etag)
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            fresh = entry is not None and entry.etag == etag and now - entry.created < self.ttl
+            if fresh:
+                self._stats['hits' if entry.ready.is_set() else 'coalesced'] += 1
+                owner = False
+            else:
+                entry = _Entry(etag)
+                self._entries[key] = entry
+                self._stats['misses'] += 1
+                owner = True
+                if len(self._entries) > self.max_entries:
+                    self._evict(now)
+
+        if owner:
+            try:
+                self._fill(entry, view(*args, **kwargs))
+            finally:
+                entry.ready.set()
+        else:
+            entry.ready.wait()
+
+        if entry.body is None or entry.status != 200:
+            # Error o respuesta no cacheable: la siguiente petición vuelve a ejecutar la vista
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            if entry.body is None:
+                return self._finish(Response(status=entry.status or 500), None)
+            return self._finish(Response(entry.body, status=entry.status, mimetype=entry.mimetype), None)
+        return self._respond(entry, etag)
+
+    def _fill(self, entry, result):
+        response = result
+        status = None
+        if isinstance(result, tuple):
+            response, status = result[0], result[1]
+        if not isinstance(response, Response):
+            response = Response(response)
+        entry.status = status or response.status_code
+        entry.mimetype = response.mimetype
+        entry.body = response.get_data()
+
+    def _respond(self, entry, etag):
+        body = entry.body
+        encoding = _accepted_encoding() if len(body) >= self.min_compress_size else None
+        if encoding:
+            encoded = entry.encoded.get(encoding)
+            if encoded is None:
+                if encoding == 'br':
+                    encoded = brotli.compress(body, quality=5)
+                else:
+                    encoded = gzip.compress(body, compresslevel=6)
+                entry.encoded[encoding] = encoded
+                with self._lock:
+                    self._stats['compressed'] += 1
+            body = encoded
+        response = Response(body, status=entry.status, mimetype=entry.mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        with self._lock:
+            self._stats['bytes_raw'] += len(entry.body)
+            self._stats['bytes_sent'] += len(body)
+        return self._finish(response, etag)
+
+    @staticmethod
+    def _finish(response, etag):
+        if etag:
+            response.set_etag(etag)
+        # no-cache: el navegador guarda la respuesta pero siempre revalida con If-None-Match
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def _evict(self, now):
+        for key, entry in list(self._entries.items()):
+            if now - entry.created >= self.ttl and entry.ready.is_set():
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data['entries'] = len(self._entries)
+        data.update({
+            'ttl': self.ttl,
+            'min_compress_size': self.min_compress_size,
+            'brotli': brotli is not None,
+            'watermarks': self.watermarks.snapshot(),
+        })
+        return data
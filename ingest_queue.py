@@ -0,0 +1,273 @@
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from db import timed_query
+from logs import get_logger
+
+# Cola write-behind para las lecturas de sensores.
+# El hilo de red de MQTT solo encola; un hilo escritor dedicado agrupa las
+# lecturas y las escribe con executemany en una sola transacción por ventana.
+# Si la BD está bloqueada (otro escritor retuvo el lock más que busy_timeout) el
+# lote se reintenta con espera exponencial antes de darlo por perdido.
+
+log = get_logger('ingest')
+
+# Columnas de valor de cada tabla de lecturas (id_aspersor y fecha_hora aparte)
+SENSOR_TABLE_COLUMNS = {
+    'lecturas_humedad': ('humedad', 'raw'),
+    'lecturas_ultrasonico': ('nivel',),
+    'lecturas_calidad': ('calidad',),
+}
+
+
+def db_timestamp(moment=None):
+    """Formatea una fecha igual que CURRENT_TIMESTAMP de SQLite (UTC, sin zona)."""
+    moment = moment or datetime.now(timezone.utc)
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+class SensorWriteQueue:
+    """Cola acotada con un hilo escritor que vacía lecturas por lotes."""
+
+    def __init__(self, connection_factory, max_size=10000, batch_size=500,
+                 flush_interval=0.5, put_timeout=0.05, write_retries=3, retry_backoff=0.1):
+        self._connection_factory = connection_factory
+        self._queue = queue.Queue(maxsize=max_size)
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.write_retries = write_retries
+        self.retry_backoff = retry_backoff
+        self._flush_hooks = []
+        self._commit_hooks = []
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._counters = {
+            'enqueued': 0,
+            'written': 0,
+            'dropped': 0,
+            'backpressure': 0,
+            'flushes': 0,
+            'write_errors': 0,
+            'write_retries': 0,
+            'failed_rows': 0,
+            'direct_writes': 0,
+            'direct_written': 0,
+        }
+        self._last_flush_size = 0
+        self._last_flush_seconds = 0.0
+
+    def add_flush_hook(self, hook):
+        """Registra hook(cursor, rows_by_table) ejecutado dentro de la transacción del lote."""
+        self._flush_hooks.append(hook)
+
+    def add_commit_hook(self, hook):
+        """Registra hook(rows_by_table) ejecutado después de confirmar el lote."""
+        self._commit_hooks.append(hook)
+
+    def write_rows(self, rows_by_table):
+        """Escribe ya, sin pasar por la cola, filas (id_aspersor, *valores, fecha_hora) por tabla.
+
+        Usa una sola transacción y los mismos hooks que un lote de la cola.
+        Lanza la excepción si la escritura falla (nada queda escrito).
+        """
+        for table in rows_by_table:
+            if table not in SENSOR_TABLE_COLUMNS:
+                raise ValueError(f"Tabla de lecturas desconocida: {table}")
+        self._write_rows(rows_by_table)
+        self._bump('direct_writes')
+        self._bump('direct_written', sum(len(rows) for rows in rows_by_table.values()))
+
+    def start(self):
+        """Arranca el hilo escritor (idempotente)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run, name='sensor-write-queue', daemon=True
+            )
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Detiene el escritor tras vaciar lo pendiente."""
+        self._stop_event.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self._thread = None
+
+    def put(self, table, id_aspersor, values, fecha_hora=None):
+        """Encola una lectura. Devuelve False si se descartó por cola llena."""
+        if table not in SENSOR_TABLE_COLUMNS:
+            raise ValueError(f"Tabla de lecturas desconocida: {table}")
+        item = (table, id_aspersor, tuple(values), fecha_hora or db_timestamp())
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # Backpressure: esperar brevemente a que el escritor libere espacio
+            self._bump('backpressure')
+            try:
+                self._queue.put(item, timeout=self.put_timeout)
+            except queue.Full:
+                self._bump('dropped')
+                return False
+        self._bump('enqueued')
+        return True
+
+    def stats(self):
+        """Contadores de ingesta, profundidad de cola y último lote."""
+        with self._lock:
+            data = dict(self._counters)
+        data.update({
+            'queue_depth': self._queue.qsize(),
+            'queue_max': self.max_size,
+            'batch_size': self.batch_size,
+            'flush_interval': self.flush_interval,
+            'last_flush_size': self._last_flush_size,
+            'last_flush_ms': round(self._last_flush_seconds * 1000, 3),
+            'running': self._thread is not None and self._thread.is_alive(),
+        })
+        return data
+
+    def _bump(self, key, amount=1):
+        with self._lock:
+            self._counters[key] += amount
+
+    def _collect_batch(self):
+        """Espera la primera lectura y junta más hasta llenar el lote o vencer la ventana."""
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain_nowait(self):
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self._write_batch(batch)
+        # Vaciar lo que quede antes de salir
+        batch = self._drain_nowait()
+        while batch:
+            self._write_batch(batch)
+            batch = self._drain_nowait()
+
+    def _write_batch(self, batch):
+        rows_by_table = {}
+        for table, id_aspersor, values, fecha_hora in batch:
+            rows_by_table.setdefault(table, []).append((id_aspersor, *values, fecha_hora))
+
+        started = time.perf_counter()
+        written = len(batch)
+        try:
+            try:
+                self._write_with_retry(rows_by_table)
+            except sqlite3.IntegrityError:
+                # FOREIGN KEY: una pecera se eliminó con lecturas suyas todavía en la cola
+                written = self._drop_unknown_tanks(rows_by_table)
+                self._bump('failed_rows', len(batch) - written)
+                self._write_with_retry(rows_by_table)
+        except Exception as e:
+            log.error("Error escribiendo lote de lecturas", extra={'rows': len(batch), 'error': str(e)})
+            self._bump('write_errors')
+            self._bump('failed_rows', written)
+            return
+        finally:
+            self._last_flush_size = len(batch)
+            self._last_flush_seconds = time.perf_counter() - started
+        self._bump('written', written)
+        self._bump('flushes')
+
+    def _write_with_retry(self, rows_by_table):
+        """_write_rows reintentando los errores transitorios (BD bloqueada u ocupada)."""
+        for attempt in range(self.write_retries + 1):
+            try:
+                return self._write_rows(rows_by_table)
+            except sqlite3.OperationalError as e:
+                message = str(e)
+                if attempt == self.write_retries or ('locked' not in message and 'busy' not in message):
+                    raise
+                delay = self.retry_backoff * (2 ** attempt)
+                self._bump('write_retries')
+                log.warning("Lote de lecturas bloqueado, reintentando", extra={
+                    'attempt': attempt + 1, 'delay_s': delay, 'error': message
+                })
+                time.sleep(delay)
+
+    def _drop_unknown_tanks(self, rows_by_table):
+        """Quita (en el lugar) las filas de peceras que ya no existen; devuelve cuántas quedan."""
+        connection = self._connection_factory()
+        if not connection:
+            raise RuntimeError("sin conexión a la base de datos")
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT id_aspersor FROM aspersores")
+            existing = {row[0] for row in cursor.fetchall()}
+            cursor.close()
+        finally:
+            connection.close()
+        kept = 0
+        for table in list(rows_by_table):
+            rows = [row for row in rows_by_table[table] if row[0] in existing]
+            if rows:
+                rows_by_table[table] = rows
+            else:
+                del rows_by_table[table]
+            kept += len(rows)
+        return kept
+
+    def _write_rows(self, rows_by_table):
+        connection = self._connection_factory()
+        if not connection:
+            raise RuntimeError("sin conexión a la base de datos")
+
+        cursor = connection.cursor()
+        try:
+            for table, rows in rows_by_table.items():
+                columns = ('id_aspersor',) + SENSOR_TABLE_COLUMNS[table] + ('fecha_hora',)
+                placeholders = ', '.join('?' * len(columns))
+                with timed_query(f'insert_{table}'):
+                    cursor.executemany(
+                        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+                        rows
+                    )
+            for hook in self._flush_hooks:
+                hook(cursor, rows_by_table)
+            with timed_query('ingest_commit'):
+                connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+        for hook in self._commit_hooks:
+            try:
+                hook(rows_by_table)
+            except Exception as e:
+                log.error("Cola de lecturas: falló un hook posterior al commit", extra={'error': str(e)})
@@ -0,0 +1,78 @@
+"""Servicio de ingesta MQTT separado del servidor web.
+
+Es el único proceso suscrito al tópico sender y el único que escribe lecturas
+MQTT (cola write-behind, rollups y retención); también ejecuta las
+programaciones de riego. Los procesos web, arrancados con
+INGEST_MODE=service, solo leen SQLite y reciben las lecturas en vivo y los
+cambios de tablas por el canal local de live_ipc. Así la ingesta no compite por
+el GIL con las peticiones y un servidor WSGI con varios workers no duplica filas.
+
+Ambos lados comparten INGEST_IPC_AUTHKEY, que es obligatoria (no hay clave por
+defecto: el canal puede recargar programaciones e invalidar cachés).
+
+Uso:
+    export INGEST_IPC_AUTHKEY=$(python -c 'import secrets; print(secrets.token_hex(32))')
+    python ingest_service.py
+    INGEST_MODE=service gunicorn -w 4 app:app
+"""
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import metrics
+import app as web  # reutiliza la cola, rollups, retención y el listener de app.py
+from config import INGEST_IPC_HOST, INGEST_METRICS_PORT
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """GET /metrics con las métricas de este proceso (MQTT, cola, retención)."""
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', metrics.CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server():
+    if not INGEST_METRICS_PORT:
+        return None
+    server = ThreadingHTTPServer((INGEST_IPC_HOST, INGEST_METRICS_PORT), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    print(f"Métricas en http://{INGEST_IPC_HOST}:{INGEST_METRICS_PORT}/metrics")
+    return server
+
+
+def main():
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+
+    web.run_ingest_service()
+    metrics_server = start_metrics_server()
+    print("Servicio de ingesta en marcha (Ctrl+C para detener)")
+    stop.wait()
+
+    print("Deteniendo servicio de ingesta...")
+    if web.mqtt_client is not None:
+        web.mqtt_client.loop_stop()
+        web.mqtt_client.disconnect()
+    web.sensor_write_queue.stop()
+    web.retention_engine.stop()
+    web.schedule_executor.stop()
+    web.live_link.stop()
+    if metrics_server is not None:
+        metrics_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
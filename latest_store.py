@@ -0,0 +1,143 @@
+import os
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+# Último valor de cada sensor por pecera.
+# Los escritores (hilo MQTT) nunca modifican un snapshot publicado: arman uno
+# nuevo y reemplazan la referencia (copy-on-write). Los lectores (hilos Flask)
+# solo leen una referencia, así que no toman ningún lock y nunca ven un estado
+# a medio escribir. Cada escritura incrementa una versión global monótona que
+# permite responder 304 o un delta vacío cuando el cliente ya tiene lo último.
+# Los valores replicados desde otro proceso llegan con su origen (epoch del
+# proceso que los leyó, versión allí): la versión local sigue siendo la de este
+# store y el origen solo sirve para descartar duplicados o mensajes viejos. Si
+# el servicio de ingesta se reinicia, su contador vuelve a 1 con otro epoch y
+# sus lecturas se aceptan de nuevo.
+
+SENSORS = ('ultrasonico', 'liquido', 'tds', 'sistema')
+
+# Campos de cada sensor (misma forma que /get_latest_sensor_data)
+SENSOR_FIELDS = {
+    'ultrasonico': ('distancia_cm',),
+    'liquido': ('nivel_pct', 'raw'),
+    'tds': ('ppm', 'raw', 'calidad'),
+    'sistema': ('estado', 'bomba6', 'bomba7', 'servo_pos', 'eventos_activos'),
+}
+
+# Valor de un sensor: data es de solo lectura
+SensorValue = namedtuple('SensorValue', 'version timestamp data')
+
+# Estado de una pecera: sensors es un mapping de solo lectura sensor -> SensorValue
+TankSnapshot = namedtuple('TankSnapshot', 'id_aspersor version timestamp sensors')
+
+
+def _empty_sensor(sensor):
+    data = {field: None for field in SENSOR_FIELDS[sensor]}
+    data['timestamp'] = None
+    return data
+
+
+class LatestValueStore:
+    """Snapshots inmutables por pecera con versión monótona."""
+
+    def __init__(self, epoch=None):
+        self.epoch = epoch or os.urandom(4).hex()   # identifica este proceso en los orígenes
+        self._tanks = MappingProxyType({})
+        self._latest_tank = None
+        self._version = 0
+        self._origins = {}                          # (id_aspersor, sensor) -> (epoch, versión)
+        self._write_lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self._version
+
+    def update(self, id_aspersor, sensor, data, timestamp, origin=None):
+        """Publica un nuevo valor del sensor y devuelve la versión local asignada.
+
+        origin=(epoch, versión) viene dado cuando se replica el estado de otro
+        proceso; si el sensor ya tiene un valor de ese mismo epoch con esa
+        versión o una más nueva se ignora y se devuelve None.
+        """
+        if sensor not in SENSOR_FIELDS:
+            raise ValueError(f"Sensor desconocido: {sensor}")
+        value = dict(data)
+        value['timestamp'] = timestamp
+        key = (id_aspersor, sensor)
+        with self._write_lock:
+            if origin is not None:
+                known = self._origins.get(key)
+                if known is not None and known[0] == origin[0] and known[1] >= origin[1]:
+                    return None
+            current = self._tanks.get(id_aspersor)
+            version = self._version + 1
+            self._origins[key] = tuple(origin) if origin is not None else (self.epoch, version)
+            sensors = dict(current.sensors) if current else {}
+            sensors[sensor] = SensorValue(version, timestamp, MappingProxyType(value))
+            snapshot = TankSnapshot(
+                id_aspersor, max(version, current.version if current else 0), timestamp, MappingProxyType(sensors)
+            )
+            tanks = dict(self._tanks)
+            tanks[id_aspersor] = snapshot
+            # Publicar: primero el mapa nuevo, después la versión
+            self._tanks = MappingProxyType(tanks)
+            self._latest_tank = id_aspersor
+            self._version = max(self._version, version)
+        return version
+
+    def forget(self, id_aspersor):
+        with self._write_lock:
+            if id_aspersor not in self._tanks:
+                return
+            tanks = dict(self._tanks)
+            del tanks[id_aspersor]
+            self._tanks = MappingProxyType(tanks)
+            for sensor in SENSOR_FIELDS:
+                self._origins.pop((id_aspersor, sensor), None)
+            if self._latest_tank == id_aspersor:
+                self._latest_tank = None
+            self._version += 1
+
+    def origin(self, id_aspersor, sensor):
+        """(epoch, versión) con que se leyó el valor actual del sensor, o None."""
+        return self._origins.get((id_aspersor, sensor))
+
+    def latest_tank(self):
+        """Pecera que reportó más recientemente (o None)."""
+        return self._latest_tank
+
+    def snapshot(self, id_aspersor):
+        """Snapshot de la pecera o None. Sin locks: es una sola lectura de referencia."""
+        return self._tanks.get(id_aspersor)
+
+    def tanks(self):
+        return self._tanks
+
+    def to_payload(self, id_aspersor, since=None):
+        """Respuesta JSON de la pecera; con since solo incluye los sensores más nuevos que esa versión."""
+        snapshot = self._tanks.get(id_aspersor)
+        sensors = snapshot.sensors if snapshot else {}
+        payload = {
+            'id_aspersor': id_aspersor,
+            'version': snapshot.version if snapshot else 0,
+            'timestamp': snapshot.timestamp if snapshot else None,
+        }
+        if since is not None:
+            payload['since'] = since
+            payload['changed'] = {
+                sensor: dict(value.data)
+                for sensor, value in sensors.items()
+                if value.version > since
+            }
+            return payload
+
+        payload['has_data'] = any(
+            value.data.get(field) is not None
+            for sensor, value in sensors.items() if sensor != 'sistema'
+            for field in SENSOR_FIELDS[sensor]
+        )
+        for sensor in SENSORS:
+            value = sensors.get(sensor)
+            payload[sensor] = dict(value.data) if value else _empty_sensor(sensor)
+        return payload
@@ -0,0 +1,229 @@
+import json
+import queue
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+# Canal local entre el servicio de ingesta (ingest_service.py) y los procesos web.
+# El servicio escucha en una dirección local; cada proceso web se conecta y
+# recibe las lecturas en vivo (para /get_latest_sensor_data y /stream/sensors) y
+# los cambios de tablas (ETags). En sentido contrario, los procesos web avisan
+# de sus propias escrituras y de cambios en las peceras. Los datos persistentes
+# se comparten por SQLite; por aquí solo viaja lo efímero.
+# Mensajes: listas JSON [tipo, ...] sobre multiprocessing.connection (sin pickle),
+# con el handshake HMAC de authkey.
+
+
+def _encode(message):
+    return json.dumps(message, separators=(',', ':')).encode()
+
+
+class _Peer:
+    """Proceso web conectado: cola de salida propia para no frenar al publicador."""
+
+    def __init__(self, connection, buffer_size, name):
+        self.connection = connection
+        self.queue = queue.Queue(maxsize=buffer_size)
+        self.name = name
+        self.closed = False
+
+
+class LiveUpdateServer:
+    """Lado del servicio de ingesta: difunde mensajes a todos los procesos web conectados."""
+
+    def __init__(self, address, authkey, on_message=None, on_connect=None, buffer_size=1000):
+        self.address = address
+        self._authkey = authkey.encode() if isinstance(authkey, str) else authkey
+        self._on_message = on_message    # on_message(mensaje, peer) para lo que envían los procesos web
+        self._on_connect = on_connect    # on_connect() -> mensajes iniciales para un proceso nuevo
+        self.buffer_size = buffer_size
+        self._listener = None
+        self._peers = set()
+        self._lock = threading.Lock()
+        self._ids = 0
+        self._stats = {'sent': 0, 'received': 0, 'connections': 0, 'dropped_peers': 0, 'auth_errors': 0}
+
+    def start(self):
+        self._listener = Listener(self.address, authkey=self._authkey)
+        self.address = self._listener.address
+        threading.Thread(target=self._accept_loop, name='live-ipc-accept', daemon=True).start()
+        print(f"Canal en vivo escuchando en {self.address[0]}:{self.address[1]}")
+
+    def stop(self):
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.close()
+        with self._lock:
+            peers = list(self._peers)
+        for peer in peers:
+            self._drop(peer)
+
+    def send(self, message, exclude=None):
+        """Encola el mensaje para cada proceso web; el que tenga la cola llena se desconecta."""
+        data = _encode(message)
+        with self._lock:
+            peers = [peer for peer in self._peers if peer is not exclude]
+            self._stats['sent'] += 1
+        for peer in peers:
+            try:
+                peer.queue.put_nowait(data)
+            except queue.Full:
+                print(f"Canal en vivo: {peer.name} no consume mensajes, se desconecta")
+                with self._lock:
+                    self._stats['dropped_peers'] += 1
+                self._drop(peer)
+
+    def _accept_loop(self):
+        while self._listener is not None:
+            try:
+                connection = self._listener.accept()
+            except AuthenticationError:
+                with self._lock:
+                    self._stats['auth_errors'] += 1
+                continue
+            except OSError:
+                break
+            with self._lock:
+                self._ids += 1
+                peer = _Peer(connection, self.buffer_size, f"web-{self._ids}")
+                self._stats['connections'] += 1
+                self._peers.add(peer)
+            # Estado inicial: puede cruzarse con mensajes nuevos, el receptor descarta versiones viejas del mismo epoch
+            for message in (self._on_connect() if self._on_connect else ()):
+                peer.queue.put(_encode(message))
+            threading.Thread(target=self._send_loop, args=(peer,), name=f'live-ipc-{peer.name}-tx', daemon=True).start()
+            threading.Thread(target=self._recv_loop, args=(peer,), name=f'live-ipc-{peer.name}-rx', daemon=True).start()
+
+    def _send_loop(self, peer):
+        while not peer.closed:
+            data = peer.queue.get()
+            if data is None:
+                break
+            try:
+                peer.connection.send_bytes(data)
+            except (OSError, ValueError):
+                self._drop(peer)
+                break
+
+    def _recv_loop(self, peer):
+        while not peer.closed:
+            try:
+                message = json.loads(peer.connection.recv_bytes())
+            except (EOFError, OSError, ValueError):
+                self._drop(peer)
+                break
+            with self._lock:
+                self._stats['received'] += 1
+            if self._on_message is not None:
+                try:
+                    self._on_message(message, peer)
+                except Exception as e:
+                    print(f"Canal en vivo: error procesando mensaje de {peer.name}: {e}")
+
+    def _drop(self, peer):
+        with self._lock:
+            if peer.closed:
+                return
+            peer.closed = True
+            self._peers.discard(peer)
+        try:
+            peer.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        try:
+            peer.connection.close()
+        except OSError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data['peers'] = {peer.name: peer.queue.qsize() for peer in self._peers}
+        data.update({'role': 'server', 'address': f"{self.address[0]}:{self.address[1]}"})
+        return data
+
+
+class LiveUpdateClient:
+    """Lado del proceso web: recibe mensajes del servicio y reconecta con backoff."""
+
+    def __init__(self, address, authkey, on_message, max_delay=30.0):
+        self.address = address
+        self._authkey = authkey.encode() if isinstance(authkey, str) else authkey
+        self._on_message = on_message
+        self.max_delay = max_delay
+        self._connection = None
+        self._send_lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._stats = {'received': 0, 'sent': 0, 'unsent': 0, 'connects': 0, 'failures': 0}
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='live-ipc-client', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            connection.close()
+
+    def send(self, message):
+        """Envía al servicio; sin conexión se descarta (el servicio no guarda estado de los procesos web)."""
+        connection = self._connection
+        if connection is None:
+            self._stats['unsent'] += 1
+            return False
+        try:
+            with self._send_lock:
+                connection.send_bytes(_encode(message))
+        except (OSError, ValueError):
+            self._stats['unsent'] += 1
+            return False
+        self._stats['sent'] += 1
+        return True
+
+    def _run(self):
+        delay = 0.5
+        while not self._stop_event.is_set():
+            try:
+                connection = Client(self.address, authkey=self._authkey)
+            except (OSError, AuthenticationError) as e:
+                self._stats['failures'] += 1
+                if self._stats['failures'] == 1:
+                    print(f"Canal en vivo: sin conexión con el servicio de ingesta ({e}), reintentando")
+                self._stop_event.wait(delay)
+                delay = min(delay * 2, self.max_delay)
+                continue
+
+            delay = 0.5
+            self._connection = connection
+            self._stats['connects'] += 1
+            print(f"Canal en vivo conectado a {self.address[0]}:{self.address[1]}")
+            try:
+                while not self._stop_event.is_set():
+                    message = json.loads(connection.recv_bytes())
+                    self._stats['received'] += 1
+                    try:
+                        self._on_message(message)
+                    except Exception as e:
+                        print(f"Canal en vivo: error aplicando mensaje {message[:1]}: {e}")
+            except (EOFError, OSError, ValueError):
+                print("Canal en vivo: conexión con el servicio de ingesta perdida")
+            finally:
+                self._connection = None
+                try:
+                    connection.close()
+                except OSError:
+                    pass
+
+    def stats(self):
+        data = dict(self._stats)
+        data.update({
+            'role': 'client',
+            'address': f"{self.address[0]}:{self.address[1]}",
+            'connected': self._connection is not None,
+        })
+        return data
@@ -0,0 +1,149 @@
+import atexit
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from config import LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_RATE_LIMIT, LOG_SAMPLE_EVERY
+
+# Logging estructurado de la aplicación (loggers aquazen.*).
+# El hilo que registra solo filtra y encola; un QueueListener escribe en stdout
+# desde su propio hilo, así un stdout lento (pipe, journald) no frena al hilo de
+# paho ni a las peticiones. Con el nivel apagado un logger.debug() es una
+# comparación de enteros: los argumentos se formatean solo si el registro pasa.
+# Por sitio de llamada (archivo:línea) hay un límite de registros por segundo y,
+# para los marcados con extra=SAMPLED, se conserva 1 de cada LOG_SAMPLE_EVERY.
+#
+# Ejemplo:
+#     log = get_logger('mqtt')
+#     log.debug("Lectura %s", sensor, extra={'id_aspersor': 3, **SAMPLED})
+
+ROOT = 'aquazen'
+
+# extra para los sitios de llamada muestreados
+SAMPLED = {'sampled': True}
+
+# Atributos propios de LogRecord: el resto son campos estructurados (extra=...)
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'sampled'}
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+class CallSiteFilter(logging.Filter):
+    """Muestreo y límite de registros por segundo para cada sitio de llamada."""
+
+    def __init__(self, rate_limit=LOG_RATE_LIMIT, sample_every=LOG_SAMPLE_EVERY):
+        super().__init__()
+        self.rate_limit = rate_limit
+        self.sample_every = max(1, int(sample_every))
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        site = (record.pathname, record.lineno)
+        with self._lock:
+            state = self._sites.get(site)
+            if state is None:
+                # [tokens, último relleno, suprimidos, contador de muestreo]
+                state = self._sites[site] = [float(self.rate_limit), time.monotonic(), 0, 0]
+            if getattr(record, 'sampled', False) and self.sample_every > 1:
+                state[3] += 1
+                if state[3] % self.sample_every != 1:
+                    return False
+                record.sample_every = self.sample_every
+            if self.rate_limit:
+                now = time.monotonic()
+                state[0] = min(float(self.rate_limit), state[0] + (now - state[1]) * self.rate_limit)
+                state[1] = now
+                if state[0] < 1:
+                    state[2] += 1
+                    return False
+                state[0] -= 1
+            if state[2]:
+                # El primer registro que pasa informa cuántos se descartaron
+                record.suppressed = state[2]
+                state[2] = 0
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro con los campos de extra=..."""
+
+    def format(self, record):
+        data = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                data[key] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Formato legible para desarrollo: los campos extra van al final como clave=valor."""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        text = super().format(record)
+        fields = ' '.join(f"{k}={v}" for k, v in vars(record).items() if k not in _RECORD_ATTRS)
+        return f"{text} {fields}" if fields else text
+
+
+def _parse_levels(value):
+    """'mqtt=DEBUG,serial=WARNING' -> {'aquazen.mqtt': 'DEBUG', ...}"""
+    levels = {}
+    for item in (value or '').split(','):
+        name, sep, level = item.partition('=')
+        if sep and name.strip():
+            levels[f"{ROOT}.{name.strip()}"] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level=LOG_LEVEL, levels=LOG_LEVELS, fmt=LOG_FORMAT, stream=None):
+    """Configura los loggers aquazen.* con el sink en segundo plano (idempotente)."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return _listener
+        root = logging.getLogger(ROOT)
+        root.setLevel(str(level).upper())
+        root.propagate = False
+        for name, logger_level in _parse_levels(levels).items():
+            logging.getLogger(name).setLevel(logger_level)
+
+        sink = logging.StreamHandler(stream or sys.stdout)
+        sink.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+        records = queue.SimpleQueue()
+        handler = QueueHandler(records)
+        handler.addFilter(CallSiteFilter())
+        root.addHandler(handler)
+
+        _listener = QueueListener(records, sink, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+        return _listener
+
+
+def stop_logging():
+    """Vacía la cola y detiene el hilo escritor."""
+    global _listener
+    with _setup_lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+
+def get_logger(name):
+    return logging.getLogger(f"{ROOT}.{name}")
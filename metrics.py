@@ -0,0 +1,225 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Registro de métricas con exposición en formato de texto de Prometheus (/metrics).
+# Contadores e histogramas guardan sus valores por hilo: cada hilo suma en su
+# propio dict sin tomar locks y el scrape agrega todos los hilos. Así se pueden
+# dejar en los caminos calientes (on_message, escritor de la cola, peticiones).
+# Los hilos terminados (el servidor de desarrollo abre uno por petición) se
+# pliegan en un acumulado para que la lista de hilos no crezca sin límite.
+# Las etiquetas se pasan posicionalmente en el orden declarado.
+
+# Buckets por defecto en segundos
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Hilos registrados por métrica a partir de los cuales se pliegan los terminados
+MAX_SHARDS = 64
+
+
+def _merge(target, values):
+    for key, cell in values:
+        current = target.get(key)
+        if current is None:
+            target[key] = list(cell)
+        else:
+            for i, value in enumerate(cell):
+                current[i] += value
+
+
+class _Shards:
+    """Celdas por hilo: key -> lista de números que solo modifica el hilo dueño."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []       # (hilo, dict)
+        self._retired = {}      # suma de los hilos ya terminados
+        self._lock = threading.Lock()
+
+    def local(self):
+        try:
+            return self._local.cells
+        except AttributeError:
+            cells = self._local.cells = {}
+            with self._lock:
+                if len(self._shards) >= MAX_SHARDS:
+                    self._retire()
+                self._shards.append((threading.current_thread(), cells))
+            return cells
+
+    def _retire(self):
+        alive = []
+        for thread, cells in self._shards:
+            if thread.is_alive():
+                alive.append((thread, cells))
+            else:
+                _merge(self._retired, list(cells.items()))
+        self._shards = alive
+
+    def collect(self):
+        """Suma de todos los hilos. Un hilo puede estar a mitad de una observación: se verá en el próximo scrape."""
+        with self._lock:
+            self._retire()
+            total = {key: list(cell) for key, cell in self._retired.items()}
+            for _, cells in self._shards:
+                # list(items()) copia el dict de una vez bajo el GIL
+                _merge(total, [(key, list(cell)) for key, cell in list(cells.items())])
+        return total
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.type = 'counter'
+        self._shards = _Shards()
+
+    def inc(self, *label_values, amount=1):
+        cells = self._shards.local()
+        cell = cells.get(label_values)
+        if cell is None:
+            cells[label_values] = [amount]
+        else:
+            cell[0] += amount
+
+    def samples(self):
+        for key, cell in sorted(self._shards.collect().items()):
+            yield self.name, dict(zip(self.labels, key)), cell[0]
+
+    def value(self, *label_values):
+        cell = self._shards.collect().get(label_values)
+        return cell[0] if cell else 0
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.type = 'histogram'
+        self.buckets = tuple(sorted(buckets))
+        self._shards = _Shards()
+
+    def observe(self, value, *label_values):
+        cells = self._shards.local()
+        cell = cells.get(label_values)
+        if cell is None:
+            # un contador por bucket (+Inf al final), suma y cantidad
+            cell = cells[label_values] = [0] * (len(self.buckets) + 3)
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def samples(self):
+        bounds = [_format_value(b) for b in self.buckets] + ['+Inf']
+        for key, cell in sorted(self._shards.collect().items()):
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip(bounds, cell):
+                cumulative += count
+                yield self.name + '_bucket', dict(labels, le=bound), cumulative
+            yield self.name + '_sum', labels, cell[-2]
+            yield self.name + '_count', labels, cell[-1]
+
+
+class CallbackMetric:
+    """Valor leído en cada scrape (profundidad de cola, contadores de otros módulos)."""
+
+    def __init__(self, name, help_text, callback, labels=(), metric_type='gauge'):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.type = metric_type
+        self._callback = callback
+
+    def samples(self):
+        value = self._callback()
+        if isinstance(value, dict):
+            for key, item in sorted(value.items()):
+                key = key if isinstance(key, tuple) else (key,)
+                yield self.name, dict(zip(self.labels, key)), item
+        elif value is not None:
+            yield self.name, {}, value
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Importar dos veces un módulo (p. ej. __main__ y app) reutiliza la métrica
+                if type(existing) is not type(metric):
+                    raise ValueError(f"Métrica duplicada con otro tipo: {metric.name}")
+                if isinstance(metric, CallbackMetric):
+                    existing._callback = metric._callback
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._register(Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def callback(self, name, help_text, callback, labels=(), metric_type='gauge'):
+        return self._register(CallbackMetric(name, help_text, callback, labels, metric_type))
+
+    def render(self):
+        """Exposición en formato de texto 0.0.4."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                print(f"Métricas: no se pudo leer {metric.name}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in samples:
+                if labels:
+                    label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                    lines.append(f"{name}{{{label_text}}} {_format_value(value)}")
+                else:
+                    lines.append(f"{name} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+# Registro del proceso
+REGISTRY = MetricsRegistry()
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
+callback = REGISTRY.callback
+render = REGISTRY.render
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
@@ -0,0 +1,102 @@
+import sqlite3
+
+from rollups import create_rollup_table
+
+# Migraciones versionadas del esquema.
+# La versión aplicada se guarda en PRAGMA user_version. Cada migración corre en
+# su propia transacción (BEGIN IMMEDIATE) junto con el cambio de versión, así que
+# o se aplica completa o no se aplica. Para cambiar el esquema se agrega una
+# función al final de MIGRATIONS; nunca se edita una ya publicada.
+
+SENSOR_TABLES = ('lecturas_humedad', 'lecturas_ultrasonico', 'lecturas_calidad')
+
+
+def _columns(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return {row[1] for row in cursor.fetchall()}
+
+
+def _m001_camera_url(cursor):
+    """Columna camera_url en aspersores (antes era un ALTER TABLE ad hoc en init_db)."""
+    if 'camera_url' not in _columns(cursor, 'aspersores'):
+        cursor.execute("ALTER TABLE aspersores ADD COLUMN camera_url VARCHAR(255)")
+
+
+def _m002_sensor_indexes(cursor):
+    """Índices de series temporales para las tablas de lecturas."""
+    for table in SENSOR_TABLES:
+        # Filtros por pecera + rango de fechas (generar_reporte)
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{table}_aspersor_fecha "
+            f"ON {table} (id_aspersor, fecha_hora)"
+        )
+        # Últimas N lecturas sin filtro de pecera (/sensor_data/*)
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{table}_fecha "
+            f"ON {table} (fecha_hora)"
+        )
+
+
+def _m003_rollups(cursor):
+    """Tabla lecturas_rollup (1 min / 1 h / 1 día) con relleno desde las lecturas existentes."""
+    create_rollup_table(cursor)
+
+
+def _m004_device_id(cursor):
+    """Columna device_id en aspersores para enrutar AquaZen/<dispositivo>/sender."""
+    if 'device_id' not in _columns(cursor, 'aspersores'):
+        cursor.execute("ALTER TABLE aspersores ADD COLUMN device_id VARCHAR(64)")
+    cursor.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_aspersores_device_id ON aspersores (device_id)"
+    )
+
+
+def _m005_orphans(cursor):
+    """Borra filas huérfanas que quedaron mientras las FOREIGN KEY no se aplicaban."""
+    cursor.execute("DELETE FROM aspersores WHERE id_usuario NOT IN (SELECT id_usuario FROM usuarios)")
+    for table in SENSOR_TABLES + ('programaciones_riego', 'lecturas_rollup'):
+        cursor.execute(f"DELETE FROM {table} WHERE id_aspersor NOT IN (SELECT id_aspersor FROM aspersores)")
+
+
+MIGRATIONS = [
+    _m001_camera_url,
+    _m002_sensor_indexes,
+    _m003_rollups,
+    _m004_device_id,
+    _m005_orphans,
+]
+
+
+def current_version(connection):
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(connection, migrations=None, verbose=True):
+    """Aplica las migraciones pendientes en orden. Devuelve la versión final."""
+    migrations = MIGRATIONS if migrations is None else migrations
+    if connection.in_transaction:
+        connection.commit()
+    version = current_version(connection)
+    for number, migration in enumerate(migrations, start=1):
+        if number <= version:
+            continue
+        cursor = connection.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            # Otro proceso pudo aplicarla mientras esperábamos el bloqueo
+            cursor.execute("PRAGMA user_version")
+            if cursor.fetchone()[0] >= number:
+                connection.commit()
+                continue
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {number}")
+            connection.commit()
+            if verbose:
+                print(f"Migración {number} aplicada: {migration.__doc__}")
+        except sqlite3.Error:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+        version = number
+    return current_version(connection)
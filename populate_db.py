@@ -1,106 +1,286 @@
-import sqlite3
-from datetime import datetime, timedelta
-import random
+"""Genera datos sintéticos realistas en el esquema real para pruebas de rendimiento.
 
-# Conectar a la base de datos
-conn = sqlite3.connect('database.db')
-cursor = conn.cursor()
+Crea usuarios, peceras (aspersores), programaciones_riego y lecturas en
+lecturas_humedad (nivel % + temperatura en raw), lecturas_ultrasonico
+(distancia al agua en cm) y lecturas_calidad (TDS en ppm). Las señales se
+calculan con NumPy por bloques de tiempo:
+    - temperatura con ciclo diario y desfase por pecera
+    - distancia que crece por evaporación y vuelve a su mínimo al rellenar
+    - TDS que sube entre cambios de agua, con picos al alimentar
+Todo se escribe con executemany en una sola transacción, con los índices de
+lecturas recreados al final. Los rollups (lecturas_rollup) se agregan con
+NumPy desde los mismos arreglos, respetando la ventana de cada resolución.
 
-print("Iniciando creación de datos de ejemplo...")
+Uso:
+    python populate_db.py --tanks 20 --days 14 --interval 60
+    python populate_db.py --db /tmp/carga.db --users 200 --tanks 500 --days 90 --interval 30 --no-rollups
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
 
-# Limpiar tablas simplificadas existentes
-tables = ['lecturas_humedad_simple', 'lecturas_temperatura_simple', 
-          'lecturas_ultrasonico_simple', 'lecturas_calidad_simple']
+SECONDS_PER_DAY = 86400
 
-for table in tables:
-    try:
-        cursor.execute(f'DELETE FROM {table}')
-        print(f'Limpiadas tablas: {table}')
-    except:
-        print(f'Tabla {table} no existe, se creará.')
-
-# Crear las tablas simplificadas
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS lecturas_humedad_simple (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        valor REAL,
-        timestamp TEXT
-    )
-''')
+# Filas por bloque de executemany (acota la memoria con decenas de millones)
+DEFAULT_BATCH = 500_000
+
+READING_TABLES = ('lecturas_humedad', 'lecturas_ultrasonico', 'lecturas_calidad')
+
+INSERT_SQL = {
+    'lecturas_humedad': "INSERT INTO lecturas_humedad (id_aspersor, humedad, raw, fecha_hora) VALUES (?, ?, ?, ?)",
+    'lecturas_ultrasonico': "INSERT INTO lecturas_ultrasonico (id_aspersor, nivel, fecha_hora) VALUES (?, ?, ?)",
+    'lecturas_calidad': "INSERT INTO lecturas_calidad (id_aspersor, calidad, fecha_hora) VALUES (?, ?, ?)",
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='base de datos destino (por defecto DATABASE_FILE de config.py)')
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--tanks', type=int, default=10, help='peceras nuevas')
+    parser.add_argument('--days', type=float, default=14, help='días de historia hasta --end')
+    parser.add_argument('--interval', type=int, default=300, help='segundos entre lecturas de cada sensor')
+    parser.add_argument('--schedules', type=int, default=3, help='programaciones por pecera')
+    parser.add_argument('--end', help="última lectura, 'YYYY-MM-DD HH:MM:SS' UTC (por defecto ahora)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch', type=int, default=DEFAULT_BATCH)
+    parser.add_argument('--reset', action='store_true', help='vaciar lecturas y rollups antes de generar')
+    parser.add_argument('--no-rollups', action='store_true', help='no escribir lecturas_rollup')
+    return parser.parse_args()
+
+
+def tank_profiles(rng, count):
+    """Parámetros fijos por pecera: geometría, evaporación, temperatura y agua."""
+    return {
+        'min_cm': rng.uniform(4, 8, count),               # distancia sensor-agua recién rellenada
+        'depth_cm': rng.uniform(25, 40, count),           # distancia con la pecera vacía
+        'evap_cm_day': rng.uniform(0.3, 1.5, count),
+        'refill_cm': rng.uniform(3, 8, count),            # se rellena al bajar esto desde el mínimo
+        'temp_base': rng.uniform(23.5, 27.0, count),
+        'temp_amp': rng.uniform(0.5, 2.0, count),
+        'temp_phase': rng.uniform(-2, 2, count),          # horas de desfase del máximo (≈15 h)
+        'tds_base': rng.uniform(150, 350, count),
+        'tds_rise_day': rng.uniform(5, 25, count),
+        'water_change_days': rng.choice([7.0, 10.0, 14.0], count),
+        'offset_s': rng.integers(0, 1 << 30, count),      # fase de los ciclos y del reloj del dispositivo
+    }
+
+
+def signals(rng, profile, epochs):
+    """Valores de los tres sensores para epochs (peceras x instantes, segundos UTC)."""
+    import numpy as np
+
+    p = {key: value[:, None] for key, value in profile.items()}
+    shifted = epochs + p['offset_s']
+
+    # Evaporación en diente de sierra: al perder refill_cm se vuelve al mínimo
+    refill_period = p['refill_cm'] / p['evap_cm_day'] * SECONDS_PER_DAY
+    drop = np.mod(shifted, refill_period) / refill_period * p['refill_cm']
+    distancia = p['min_cm'] + drop + rng.normal(0, 0.15, epochs.shape)
+    nivel_pct = np.clip((p['depth_cm'] - distancia) / (p['depth_cm'] - p['min_cm']) * 100, 0, 100)
+
+    hours = np.mod(epochs, SECONDS_PER_DAY) / 3600
+    temperatura = (p['temp_base']
+                   + p['temp_amp'] * np.sin(2 * np.pi * (hours - 9 - p['temp_phase']) / 24)
+                   + rng.normal(0, 0.1, epochs.shape))
+
+    days_since_change = np.mod(shifted, p['water_change_days'] * SECONDS_PER_DAY) / SECONDS_PER_DAY
+    tds = p['tds_base'] + p['tds_rise_day'] * days_since_change + rng.normal(0, 3, epochs.shape)
+    spikes = rng.random(epochs.shape) < 0.01
+    tds[spikes] += rng.exponential(80, int(spikes.sum()))
+
+    return {
+        'lecturas_humedad': (np.round(nivel_pct, 1), np.round(temperatura, 2)),
+        'lecturas_ultrasonico': (np.round(distancia, 1),),
+        'lecturas_calidad': (np.round(tds, 1),),
+    }
+
+
+def format_timestamps(epochs):
+    """Epochs -> 'YYYY-MM-DD HH:MM:SS' (como CURRENT_TIMESTAMP), vectorizado."""
+    import numpy as np
+
+    text = np.datetime_as_string(epochs.astype('datetime64[s]'), unit='s')
+    return np.char.replace(text, 'T', ' ').tolist()
+
+
+def rollup_rows(ids, epochs, values_by_table, now):
+    """Filas de lecturas_rollup para un bloque (peceras x instantes crecientes), vectorizado.
 
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS lecturas_temperatura_simple (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        valor REAL,
-        timestamp TEXT
+    En cada fila de epochs el tiempo crece, así que recorriendo pecera por pecera
+    cada bucket es un tramo contiguo y se agrega con reduceat.
+    """
+    import numpy as np
+    from ingest_queue import SENSOR_TABLE_COLUMNS
+    from rollups import RESOLUTIONS, SENSOR_METRICS
+
+    tanks = np.repeat(ids, epochs.shape[1])
+    flat_epochs = epochs.ravel()
+    rows = []
+    for metrica, (table, column) in SENSOR_METRICS.items():
+        values = values_by_table[table][SENSOR_TABLE_COLUMNS[table].index(column)].ravel()
+        for resolucion, keep in RESOLUTIONS:
+            buckets = flat_epochs - flat_epochs % resolucion
+            if keep is not None:
+                # Lo que el prune de RollupAggregator ya habría borrado
+                mask = buckets >= int(now) - keep
+                if not mask.any():
+                    continue
+                t, b, e, v = tanks[mask], buckets[mask], flat_epochs[mask], values[mask]
+            else:
+                t, b, e, v = tanks, buckets, flat_epochs, values
+            starts = np.flatnonzero(np.r_[True, (b[1:] != b[:-1]) | (t[1:] != t[:-1])])
+            ends = np.r_[starts[1:], len(v)] - 1
+            rows.extend(zip(
+                [metrica] * len(starts), [resolucion] * len(starts),
+                t[starts].tolist(), b[starts].tolist(),
+                (ends - starts + 1).tolist(),
+                np.minimum.reduceat(v, starts).tolist(),
+                np.maximum.reduceat(v, starts).tolist(),
+                np.add.reduceat(v, starts).tolist(),
+                v[ends].tolist(), e[ends].tolist(),
+            ))
+    return rows
+
+
+def insert_entities(cursor, rng, users, tanks, schedules, start_ts, end_ts):
+    """Usuarios, peceras y programaciones; devuelve los id de las peceras nuevas."""
+    cursor.execute("SELECT COALESCE(MAX(id_usuario), 0) FROM usuarios")
+    first_user = cursor.fetchone()[0] + 1
+    cursor.executemany(
+        "INSERT INTO usuarios (nombre, correo, contrasena, tipo_usuario) VALUES (?, ?, '123', 'usuario')",
+        [(f"Usuario {i}", f"sim{i}@irrigo.com") for i in range(first_user, first_user + users)]
     )
-''')
+    cursor.execute("SELECT id_usuario FROM usuarios")
+    user_ids = [row[0] for row in cursor.fetchall()]
 
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS lecturas_ultrasonico_simple (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        distance_cm REAL,
-        timestamp TEXT
+    cursor.execute("SELECT COALESCE(MAX(id_aspersor), 0) FROM aspersores")
+    first_tank = cursor.fetchone()[0] + 1
+    owners = rng.choice(user_ids, tanks).tolist()
+    estados = rng.choice(['activo', 'inactivo'], tanks, p=[0.8, 0.2]).tolist()
+    cursor.executemany(
+        "INSERT INTO aspersores (id_usuario, nombre, ubicacion, estado) VALUES (?, ?, ?, ?)",
+        [(owner, f"Pecera {first_tank + i}", f"Sala {i % 20 + 1}", estado)
+         for i, (owner, estado) in enumerate(zip(owners, estados))]
     )
-''')
+    cursor.execute("SELECT id_aspersor FROM aspersores WHERE id_aspersor >= ? ORDER BY id_aspersor", (first_tank,))
+    tank_ids = [row[0] for row in cursor.fetchall()]
+
+    # Riegos a horas redondas repartidos en la ventana y la semana siguiente
+    count = len(tank_ids) * schedules
+    if count:
+        span_hours = max(1, int((end_ts - start_ts) // 3600) + 7 * 24)
+        starts = (start_ts // 3600 + rng.integers(0, span_hours, count)) * 3600
+        durations = rng.choice([5, 10, 15, 30], count).tolist()
+        cursor.executemany(
+            "INSERT INTO programaciones_riego (id_aspersor, hora_inicio, duracion_minutos) VALUES (?, ?, ?)",
+            zip([tank for tank in tank_ids for _ in range(schedules)], format_timestamps(starts), durations)
+        )
+    return tank_ids
+
 
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS lecturas_calidad_simple (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        valor REAL,
-        timestamp TEXT
+def insert_readings(cursor, rng, tank_ids, start_ts, end_ts, interval, batch, rollups=True):
+    """Lecturas en orden de fecha (como las escribe la ingesta), por bloques de tiempo."""
+    import numpy as np
+    from rollups import upsert_rollup_rows
+
+    ids = np.asarray(tank_ids)
+    profile = tank_profiles(rng, len(ids))
+    jitter = rng.integers(0, interval, len(ids))[:, None]   # cada dispositivo reporta en su segundo
+    steps = np.arange(start_ts, end_ts, interval, dtype=np.int64)
+    steps_per_block = max(1, batch // max(1, len(ids)))
+    written = dict.fromkeys(READING_TABLES, 0)
+    now = time.time()
+
+    for block_start in range(0, len(steps), steps_per_block):
+        epochs = steps[block_start:block_start + steps_per_block][None, :] + jitter
+        # Orden por instante y luego por pecera
+        epochs_flat = epochs.T.ravel()
+        id_list = np.broadcast_to(ids[None, :], (epochs.shape[1], len(ids))).ravel().tolist()
+        fechas = format_timestamps(epochs_flat)
+        values_by_table = signals(rng, profile, epochs)
+        for table, columns in values_by_table.items():
+            values = [column.T.ravel().tolist() for column in columns]
+            cursor.executemany(INSERT_SQL[table], zip(id_list, *values, fechas))
+            written[table] += len(id_list)
+        if rollups:
+            # Un bucket partido entre dos bloques se completa con el UPSERT
+            upsert_rollup_rows(cursor, rollup_rows(ids, epochs, values_by_table, now))
+    return written
+
+
+def reading_indexes(cursor):
+    cursor.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+        f"AND tbl_name IN ({','.join('?' * len(READING_TABLES))})",
+        READING_TABLES
     )
-''')
-
-print("Tablas creadas correctamente.")
-
-# Generar datos de ejemplo para las últimas 2 semanas
-end_date = datetime.now()
-start_date = end_date - timedelta(days=14)
-current = start_date
-
-datos_insertados = 0
-
-while current <= end_date:
-    # Datos de humedad (45-65%)
-    humedad = round(random.uniform(45, 65), 1)
-    cursor.execute('INSERT INTO lecturas_humedad_simple (valor, timestamp) VALUES (?, ?)', 
-                   (humedad, current.isoformat()))
-    
-    # Datos de temperatura (23-27°C)
-    temperatura = round(random.uniform(23, 27), 1)
-    cursor.execute('INSERT INTO lecturas_temperatura_simple (valor, timestamp) VALUES (?, ?)', 
-                   (temperatura, current.isoformat()))
-    
-    # Datos del ultrasónico (16-24cm)
-    distancia = round(random.uniform(16, 24), 1)
-    cursor.execute('INSERT INTO lecturas_ultrasonico_simple (distance_cm, timestamp) VALUES (?, ?)', 
-                   (distancia, current.isoformat()))
-    
-    # Datos de calidad (6.8-7.8 pH)
-    ph = round(random.uniform(6.8, 7.8), 1)
-    cursor.execute('INSERT INTO lecturas_calidad_simple (valor, timestamp) VALUES (?, ?)', 
-                   (ph, current.isoformat()))
-    
-    datos_insertados += 4
-    current += timedelta(hours=2)
-
-conn.commit()
-
-# Verificar datos insertados
-print(f"\nDatos insertados exitosamente! Total de registros: {datos_insertados}")
-
-for table in tables:
-    cursor.execute(f'SELECT COUNT(*) FROM {table}')
-    count = cursor.fetchone()[0]
-    
-    cursor.execute(f'SELECT * FROM {table} ORDER BY timestamp DESC LIMIT 3')
-    samples = cursor.fetchall()
-    
-    print(f"\n{table}: {count} registros")
-    print("Últimos 3 registros:")
-    for sample in samples:
-        print(f"  {sample}")
-
-conn.close()
-print("\n✅ Base de datos lista para generar reportes!")
\ No newline at end of file
+    return cursor.fetchall()
+
+
+def main():
+    args = parse_args()
+    if args.db:
+        os.environ['DATABASE_FILE'] = args.db
+
+    # init_db() de app.py (al importarse) crea el esquema y aplica las migraciones
+    import numpy as np
+    import app  # noqa: F401
+    from config import DATABASE
+    from db import open_connection
+
+    end = (datetime.strptime(args.end, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+           if args.end else datetime.now(timezone.utc))
+    end_ts = int(end.timestamp())
+    start_ts = int((end - timedelta(days=args.days)).timestamp())
+    rng = np.random.default_rng(args.seed)
+
+    connection = open_connection(DATABASE, row_factory=None)
+    cursor = connection.cursor()
+    # Carga masiva: sin fsync por página y con más caché; una sola transacción
+    cursor.execute("PRAGMA synchronous = OFF")
+    cursor.execute("PRAGMA cache_size = -262144")
+    started = time.perf_counter()
+    try:
+        cursor.execute("BEGIN")
+        if args.reset:
+            for table in READING_TABLES:
+                cursor.execute(f"DELETE FROM {table}")
+            cursor.execute("DELETE FROM lecturas_rollup")
+
+        tank_ids = insert_entities(cursor, rng, args.users, args.tanks, args.schedules, start_ts, end_ts)
+
+        # Insertar sin índices y recrearlos al final es más rápido que mantenerlos fila a fila
+        indexes = reading_indexes(cursor)
+        for name, _ in indexes:
+            cursor.execute(f"DROP INDEX {name}")
+        written = insert_readings(cursor, rng, tank_ids, start_ts, end_ts, args.interval, args.batch,
+                                  rollups=not args.no_rollups)
+        readings_s = time.perf_counter() - started
+        for _, sql in indexes:
+            cursor.execute(sql)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.execute("PRAGMA synchronous = NORMAL")
+        cursor.close()
+        connection.close()
+
+    total = sum(written.values())
+    elapsed = time.perf_counter() - started
+    print(f"Base: {DATABASE}")
+    print(f"Peceras nuevas: {len(tank_ids)}  usuarios nuevos: {args.users}  "
+          f"programaciones: {len(tank_ids) * args.schedules}")
+    for table, count in written.items():
+        print(f"  {table}: {count} lecturas")
+    print(f"{total} lecturas{' y rollups' if not args.no_rollups else ''} en {readings_s:.1f}s "
+          f"({total / max(readings_s, 1e-9):,.0f} filas/s); total con índices: {elapsed:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+import itertools
+import json
+import queue
+import threading
+
+# Fan-out en memoria de actualizaciones de sensores hacia clientes SSE.
+# Cada suscriptor tiene su propio buffer acotado: si un cliente lento lo llena
+# se le desconecta, en lugar de frenar al publicador (hilo MQTT) o a los demás.
+
+
+def format_sse(event, data, event_id=None):
+    """Serializa un mensaje Server-Sent Events (data ya en JSON)."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {data}")
+    return '\n'.join(lines) + '\n\n'
+
+
+class Subscription:
+    """Buffer de un cliente conectado al stream."""
+
+    def __init__(self, buffer_size, channel=None):
+        self.queue = queue.Queue(maxsize=buffer_size)
+        self.channel = channel  # None = recibe todos los canales (peceras)
+        self.dropped = False
+
+    def get(self, timeout):
+        return self.queue.get(timeout=timeout)
+
+
+class SensorBroadcaster:
+    """Publica cada actualización una sola vez a cada suscriptor activo."""
+
+    def __init__(self, buffer_size=100):
+        self.buffer_size = buffer_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._stats = {
+            'published': 0,
+            'delivered': 0,
+            'dropped_clients': 0,
+            'total_clients': 0,
+        }
+
+    def subscribe(self, channel=None):
+        subscription = Subscription(self.buffer_size, channel)
+        with self._lock:
+            self._subscribers.add(subscription)
+            self._stats['total_clients'] += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event, payload, channel=None):
+        """Serializa una vez y entrega a los suscriptores del canal; descarta clientes con el buffer lleno."""
+        message = format_sse(event, json.dumps(payload), next(self._ids))
+        with self._lock:
+            subscribers = [
+                s for s in self._subscribers
+                if s.channel is None or channel is None or s.channel == channel
+            ]
+            self._stats['published'] += 1
+        delivered = 0
+        slow = []
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(message)
+                delivered += 1
+            except queue.Full:
+                slow.append(subscription)
+        with self._lock:
+            self._stats['delivered'] += delivered
+            for subscription in slow:
+                subscription.dropped = True
+                self._subscribers.discard(subscription)
+                self._stats['dropped_clients'] += 1
+        return delivered
+
+    def stream(self, subscription, initial=None, heartbeat=15.0):
+        """Generador SSE para una respuesta Flask; envía keep-alive cuando no hay datos."""
+        try:
+            if initial is not None:
+                yield initial
+            while not subscription.dropped:
+                try:
+                    yield subscription.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+            # El cliente se quedó atrás: EventSource reconectará y recibirá un snapshot nuevo
+            yield format_sse('dropped', json.dumps({'reason': 'buffer lleno'}))
+        finally:
+            self.unsubscribe(subscription)
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data['clients'] = len(self._subscribers)
+        data['buffer_size'] = self.buffer_size
+        return data
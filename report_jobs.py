@@ -0,0 +1,314 @@
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import metrics
+
+# Trabajos de generación de reportes PDF.
+# POST /api/reportes encola el reporte en un pool de procesos y devuelve un
+# job_id; el cliente consulta el estado y descarga el PDF cuando está listo.
+# Los PDFs terminados se guardan en disco con clave (id_usuario, rol, dias,
+# marca de agua de los datos), así que pedir el mismo reporte sin lecturas ni
+# peceras nuevas no vuelve a generarlo. El directorio se poda por LRU (mtime).
+
+# Tablas cuyo MAX(id_lectura) cambia con cada lectura nueva o borrada
+WATERMARK_TABLES = ('lecturas_humedad', 'lecturas_ultrasonico', 'lecturas_calidad')
+
+ESTADO_EN_COLA = 'en_cola'
+ESTADO_GENERANDO = 'generando'
+ESTADO_LISTO = 'listo'
+ESTADO_ERROR = 'error'
+
+# Segundos desde que el trabajo entra al pool hasta que el PDF queda en disco
+REPORT_SECONDS = metrics.histogram(
+    'aquazen_report_generation_seconds', 'Duración de la generación de reportes PDF', ('result',),
+    buckets=(0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+)
+
+
+def report_filename(tipo_usuario, moment=None):
+    """Nombre de descarga del reporte según el rol y la fecha de generación."""
+    moment = moment or datetime.now()
+    tipo_reporte = "admin_completo" if tipo_usuario == 'admin' else "personal"
+    return f"reporte_aquazen_{tipo_reporte}_{moment.strftime('%Y%m%d_%H%M')}.pdf"
+
+
+def _write_report(path, id_usuario, tipo_usuario, nombre_usuario, dias):
+    # Se ejecuta en el proceso del pool: solo ahí se cargan ReportLab y matplotlib
+    import reportes
+    return reportes.write_report_pdf(path, id_usuario, tipo_usuario, nombre_usuario, dias)
+
+
+def _warm_worker():
+    import reportes  # noqa: F401
+    return os.getpid()
+
+
+def data_watermark(connection, ttl_seconds=300, now=None):
+    """Huella de los datos que entran en un reporte; cambia si cambian lecturas, peceras o usuarios."""
+    cursor = connection.cursor()
+    try:
+        digest = hashlib.sha256()
+        for table in WATERMARK_TABLES:
+            cursor.execute(f"SELECT MAX(id_lectura) FROM {table}")
+            digest.update(f"{table}:{cursor.fetchone()[0]};".encode())
+        # Tablas chicas: se incluyen completas para detectar ediciones (estado, nombre, dueño)
+        cursor.execute("SELECT id_aspersor, id_usuario, nombre, ubicacion, estado FROM aspersores ORDER BY id_aspersor")
+        digest.update(repr([tuple(row) for row in cursor.fetchall()]).encode())
+        cursor.execute("SELECT id_usuario, nombre, correo, tipo_usuario FROM usuarios ORDER BY id_usuario")
+        digest.update(repr([tuple(row) for row in cursor.fetchall()]).encode())
+    finally:
+        cursor.close()
+    # La ventana del reporte es relativa a "ahora": sin datos nuevos igual caduca
+    if ttl_seconds:
+        digest.update(f"t:{int((now or time.time()) // ttl_seconds)}".encode())
+    return digest.hexdigest()[:16]
+
+
+def cache_key(id_usuario, tipo_usuario, dias, watermark):
+    raw = f"{id_usuario}|{tipo_usuario}|{dias}|{watermark}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+class ReportJobManager:
+    """Registro de trabajos de reporte, pool de procesos y caché LRU en disco."""
+
+    def __init__(self, connection_factory, cache_dir, max_cache_bytes, max_workers=2,
+                 cache_ttl=300, max_jobs=200):
+        self._connection_factory = connection_factory
+        self.cache_dir = cache_dir
+        self.max_cache_bytes = max_cache_bytes
+        self.max_workers = max_workers
+        self.cache_ttl = cache_ttl
+        self.max_jobs = max_jobs
+        self._executor = None
+        self._jobs = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'submitted': 0,
+            'cache_hits': 0,
+            'deduplicated': 0,
+            'generated': 0,
+            'failed': 0,
+            'evicted': 0,
+            'generate_ms_total': 0.0,
+            'generate_ms_max': 0.0,
+        }
+
+    def _get_executor(self):
+        # spawn: los procesos no heredan hilos ni conexiones SQLite del servidor web
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def warm_up(self):
+        """Arranca los procesos del pool y precarga en ellos el módulo de reportes."""
+        executor = self._get_executor()
+        return [executor.submit(_warm_worker) for _ in range(self.max_workers)]
+
+    def cache_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def submit(self, id_usuario, tipo_usuario, nombre_usuario, dias):
+        """Encola un reporte (o lo resuelve desde la caché). Devuelve el estado del trabajo."""
+        connection = self._connection_factory()
+        if not connection:
+            raise RuntimeError("Sin conexión a la base de datos")
+        try:
+            watermark = data_watermark(connection, self.cache_ttl)
+        finally:
+            connection.close()
+        key = cache_key(id_usuario, tipo_usuario, dias, watermark)
+        path = self.cache_path(key)
+
+        with self._lock:
+            self._stats['submitted'] += 1
+            # Mismo reporte ya en curso: se comparte el trabajo
+            inflight_id = self._inflight.get(key)
+            if inflight_id in self._jobs:
+                self._stats['deduplicated'] += 1
+                return self._public(self._jobs[inflight_id])
+
+            job = {
+                'job_id': uuid.uuid4().hex,
+                'key': key,
+                'id_usuario': id_usuario,
+                'tipo_usuario': tipo_usuario,
+                'dias': dias,
+                'estado': ESTADO_EN_COLA,
+                'cache': 'miss',
+                'creado': datetime.now(timezone.utc).isoformat(),
+                'terminado': None,
+                'duracion_ms': None,
+                'tamano': None,
+                'error': None,
+                'future': None,
+                'event': threading.Event(),
+            }
+            self._remember(job)
+
+            if self._touch(path):
+                self._stats['cache_hits'] += 1
+                job.update(estado=ESTADO_LISTO, cache='hit', tamano=os.path.getsize(path),
+                           terminado=job['creado'], duracion_ms=0.0)
+                job['event'].set()
+                return self._public(job)
+
+            self._inflight[key] = job['job_id']
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        started = time.perf_counter()
+        try:
+            future = self._get_executor().submit(
+                _write_report, path, id_usuario, tipo_usuario, nombre_usuario, dias
+            )
+        except Exception as e:
+            self._finish(job, started, error=e)
+            return self.get(job['job_id'])
+        job['future'] = future
+        future.add_done_callback(lambda f: self._on_done(job, started, f))
+        return self.get(job['job_id'])
+
+    def _remember(self, job):
+        self._jobs[job['job_id']] = job
+        # Olvidar los trabajos terminados más viejos (los PDFs siguen en la caché)
+        while len(self._jobs) > self.max_jobs:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if not oldest['event'].is_set():
+                break
+            del self._jobs[oldest_id]
+
+    def _on_done(self, job, started, future):
+        try:
+            size = future.result()
+        except Exception as e:
+            self._finish(job, started, error=e)
+            return
+        self._finish(job, started, size=size)
+        self._evict(keep=self.cache_path(job['key']))
+
+    def _finish(self, job, started, size=None, error=None):
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 3)
+        REPORT_SECONDS.observe(elapsed_ms / 1000, 'error' if error is not None else 'ok')
+        with self._lock:
+            self._inflight.pop(job['key'], None)
+            job['terminado'] = datetime.now(timezone.utc).isoformat()
+            job['duracion_ms'] = elapsed_ms
+            if error is not None:
+                print(f"Reporte {job['job_id']} falló: {error}")
+                job['estado'] = ESTADO_ERROR
+                job['error'] = str(error)
+                self._stats['failed'] += 1
+            else:
+                job['estado'] = ESTADO_LISTO
+                job['tamano'] = size
+                self._stats['generated'] += 1
+                self._stats['generate_ms_total'] += elapsed_ms
+                self._stats['generate_ms_max'] = max(self._stats['generate_ms_max'], elapsed_ms)
+        job['event'].set()
+
+    def _touch(self, path):
+        """Marca el PDF como usado recientemente. False si no está en la caché."""
+        try:
+            os.utime(path)
+            return True
+        except OSError:
+            return False
+
+    def _evict(self, keep=None):
+        """Borra los PDFs menos usados hasta quedar bajo max_cache_bytes."""
+        try:
+            entries = []
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.endswith('.pdf'):
+                        st = entry.stat()
+                        entries.append((st.st_mtime, st.st_size, entry.path))
+        except OSError:
+            return 0
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_cache_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        if evicted:
+            with self._lock:
+                self._stats['evicted'] += evicted
+        return evicted
+
+    def _public(self, job):
+        data = {k: v for k, v in job.items() if k not in ('future', 'event', 'key')}
+        future = job['future']
+        if data['estado'] == ESTADO_EN_COLA and future is not None and future.running():
+            data['estado'] = ESTADO_GENERANDO
+        return data
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._public(job) if job else None
+
+    def wait(self, job_id, timeout=None):
+        """Bloquea hasta que el trabajo termine (o timeout). Devuelve su estado."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        job['event'].wait(timeout)
+        return self.get(job_id)
+
+    def pdf_path(self, job_id):
+        """Ruta del PDF de un trabajo listo, o None si no existe o ya fue expulsado de la caché."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['estado'] != ESTADO_LISTO:
+                return None
+            path = self.cache_path(job['key'])
+        return path if self._touch(path) else None
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            estados = {}
+            for job in self._jobs.values():
+                estado = self._public(job)['estado']
+                estados[estado] = estados.get(estado, 0) + 1
+        data.update({
+            'jobs': estados,
+            'workers': self.max_workers,
+            'cache_dir': self.cache_dir,
+            'max_cache_bytes': self.max_cache_bytes,
+        })
+        try:
+            with os.scandir(self.cache_dir) as it:
+                sizes = [e.stat().st_size for e in it if e.is_file() and e.name.endswith('.pdf')]
+            data['cache_files'] = len(sizes)
+            data['cache_bytes'] = sum(sizes)
+        except OSError:
+            data['cache_files'] = 0
+            data['cache_bytes'] = 0
+        return data
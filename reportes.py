@@ -0,0 +1,701 @@
+from datetime import datetime, timedelta, timezone
+import io
+import os
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+from charts import render_line_chart
+from db import get_db_connection
+from rollups import query_series, query_summary
+
+# Construcción del reporte técnico en PDF (antes vivía dentro de /generar_reporte).
+# Está en su propio módulo, sin Flask ni sesión, para que los procesos de
+# report_jobs puedan importarlo y generar el PDF fuera del proceso web.
+
+
+def build_report_pdf(id_usuario, tipo_usuario, nombre_usuario, dias):
+    """Genera el reporte de los últimos `dias` días y devuelve el PDF en bytes."""
+    es_admin = (tipo_usuario == 'admin')
+    
+    # Crear buffer para el PDF
+    buffer = io.BytesIO()
+    
+    # Crear documento PDF
+    doc = SimpleDocTemplate(buffer, pagesize=A4, 
+                           rightMargin=50, leftMargin=50, 
+                           topMargin=40, bottomMargin=40)
+    
+    elements = []
+    styles = getSampleStyleSheet()
+    
+    # Estilos personalizados
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=22,
+        spaceAfter=20,
+        textColor=colors.HexColor('#0891b2'),
+        alignment=1
+    )
+    
+    subtitle_style = ParagraphStyle(
+        'Subtitle',
+        parent=styles['Normal'],
+        fontSize=11,
+        textColor=colors.gray,
+        alignment=1
+    )
+    
+    section_style = ParagraphStyle(
+        'SectionTitle',
+        parent=styles['Heading2'],
+        fontSize=14,
+        spaceBefore=15,
+        spaceAfter=10,
+        textColor=colors.HexColor('#0e7490'),
+    )
+    
+    normal_style = ParagraphStyle(
+        'NormalText',
+        parent=styles['Normal'],
+        fontSize=10,
+        spaceAfter=6,
+    )
+    
+    alert_style = ParagraphStyle(
+        'AlertText',
+        parent=styles['Normal'],
+        fontSize=10,
+        textColor=colors.HexColor('#dc2626'),
+        spaceAfter=4,
+    )
+    
+    success_style = ParagraphStyle(
+        'SuccessText',
+        parent=styles['Normal'],
+        fontSize=10,
+        textColor=colors.HexColor('#059669'),
+        spaceAfter=4,
+    )
+    
+    warning_style = ParagraphStyle(
+        'WarningText',
+        parent=styles['Normal'],
+        fontSize=10,
+        textColor=colors.HexColor('#d97706'),
+        spaceAfter=4,
+    )
+    
+    # ═══════════════════════════════════════════════════════════════
+    # PORTADA
+    # ═══════════════════════════════════════════════════════════════
+    elements.append(Spacer(1, 50))
+    elements.append(Paragraph("🐟 REPORTE TÉCNICO AQUAZEN", title_style))
+    elements.append(Paragraph("Sistema Inteligente de Monitoreo de Peceras", subtitle_style))
+    elements.append(Spacer(1, 20))
+    elements.append(Paragraph(f"Período de Análisis: Últimos {dias} días", subtitle_style))
+    elements.append(Paragraph(f"Fecha de Generación: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}", subtitle_style))
+    elements.append(Paragraph(f"Usuario: {nombre_usuario}", subtitle_style))
+    elements.append(Paragraph(f"Tipo de Reporte: {'Administrador (Completo)' if es_admin else 'Personal'}", subtitle_style))
+    elements.append(Spacer(1, 30))
+    
+    # Contenido del reporte
+    elements.append(Paragraph("📋 Contenido del Reporte:", normal_style))
+    
+    if es_admin:
+        contenido_items = [
+            "• Resumen de todas las peceras del sistema",
+            "• Gráficas de tendencias de todos los sensores",
+            "• Análisis estadístico completo",
+            "• Monitoreo de temperatura y nivel",
+            "• Análisis de calidad del agua",
+            "• Alertas y recomendaciones técnicas",
+            "• Diagnóstico completo del sistema",
+            "• Histórico por período seleccionado",
+            "• Vista de todos los usuarios (solo admin)"
+        ]
+    else:
+        contenido_items = [
+            "• Resumen de mis peceras",
+            "• Gráficas de tendencias de mis sensores",
+            "• Análisis estadístico de mis peceras",
+            "• Monitoreo de temperatura y nivel",
+            "• Análisis de calidad del agua",
+            "• Alertas y recomendaciones técnicas",
+            "• Diagnóstico de mis peceras",
+            "• Histórico por período seleccionado"
+        ]
+    for item in contenido_items:
+        elements.append(Paragraph(item, normal_style))
+    
+    elements.append(Spacer(1, 30))
+    elements.append(Paragraph("─" * 70, subtitle_style))
+    
+    # Conexión a BD para obtener datos
+    connection = get_db_connection()
+    alertas = []
+    recomendaciones = []
+    
+    # Variables para almacenar datos de gráficas
+    humedad_data = []
+    temp_data = []
+    nivel_data = []
+    calidad_data = []
+    fechas_humedad = []
+    fechas_nivel = []
+    fechas_calidad = []
+    
+    if connection:
+        cursor = connection.cursor()
+        fecha_inicio = datetime.now() - timedelta(days=dias)
+        fecha_inicio_str = fecha_inicio.strftime('%Y-%m-%d %H:%M:%S')
+        
+        # Obtener IDs de peceras del usuario (solo sus peceras si no es admin)
+        if es_admin:
+            cursor.execute("SELECT id_aspersor FROM aspersores")
+        else:
+            cursor.execute("SELECT id_aspersor FROM aspersores WHERE id_usuario = ?", (id_usuario,))
+        mis_peceras = [row['id_aspersor'] for row in cursor.fetchall()]
+        
+        # Si el usuario no tiene peceras, mostrar mensaje
+        if not mis_peceras:
+            elements.append(Paragraph("⚠️ No tienes peceras registradas en el sistema.", warning_style))
+            elements.append(Spacer(1, 20))
+        
+        # Crear placeholder para consultas (para filtrar por peceras del usuario)
+        placeholders = ','.join('?' * len(mis_peceras)) if mis_peceras else '0'
+        
+        # ═══════════════════════════════════════════════════════════════
+        # OBTENER DATOS PARA GRÁFICAS (filtrados por peceras del usuario)
+        # ═══════════════════════════════════════════════════════════════
+        
+        # Series desde los rollups: cubren todo el período con como mucho 50 puntos,
+        # aunque la retención ya haya borrado las lecturas crudas
+        desde_ts = int((datetime.now(timezone.utc) - timedelta(days=dias)).timestamp())
+        hasta_ts = int(datetime.now(timezone.utc).timestamp())
+
+        def serie_rollup(metrica):
+            _, filas = query_series(connection, metrica, desde_ts, hasta_ts, mis_peceras, max_points=50)
+            fechas = [datetime.fromtimestamp(f['bucket'], timezone.utc).strftime('%Y-%m-%d %H:%M:%S') for f in filas]
+            return fechas, [f['promedio'] if f['promedio'] else 0 for f in filas]
+
+        fechas_humedad, humedad_data = serie_rollup('humedad')
+        _, temp_data = serie_rollup('temperatura')
+        fechas_nivel, nivel_data = serie_rollup('nivel')
+        fechas_calidad, calidad_data = serie_rollup('calidad')
+        
+        # ═══════════════════════════════════════════════════════════════
+        # SECCIÓN 1: RESUMEN DE PECERAS
+        # ═══════════════════════════════════════════════════════════════
+        if es_admin:
+            elements.append(Paragraph("📊 1. RESUMEN DE TODAS LAS PECERAS (ADMIN)", section_style))
+            cursor.execute("""
+                SELECT a.nombre, a.ubicacion, a.estado, u.nombre as propietario
+                FROM aspersores a
+                LEFT JOIN usuarios u ON a.id_usuario = u.id_usuario
+            """)
+        else:
+            elements.append(Paragraph("📊 1. RESUMEN DE MIS PECERAS", section_style))
+            cursor.execute("""
+                SELECT a.nombre, a.ubicacion, a.estado, u.nombre as propietario
+                FROM aspersores a
+                LEFT JOIN usuarios u ON a.id_usuario = u.id_usuario
+                WHERE a.id_usuario = ?
+            """, (id_usuario,))
+        peceras = cursor.fetchall()
+        
+        activas = sum(1 for p in peceras if p['estado'] == 'activo')
+        inactivas = len(peceras) - activas
+        
+        if es_admin:
+            elements.append(Paragraph(f"Total de peceras en el sistema: {len(peceras)}", normal_style))
+        else:
+            elements.append(Paragraph(f"Total de tus peceras: {len(peceras)}", normal_style))
+        elements.append(Paragraph(f"Peceras activas: {activas} | Peceras inactivas: {inactivas}", normal_style))
+        elements.append(Spacer(1, 10))
+        
+        if peceras:
+            if es_admin:
+                # Admin ve todas las columnas incluyendo propietario
+                data = [['Nombre', 'Ubicación', 'Estado', 'Propietario']]
+                for p in peceras:
+                    estado = 'Activo' if p['estado'] == 'activo' else 'Inactivo'
+                    data.append([p['nombre'], p['ubicacion'], estado, p['propietario'] or 'N/A'])
+                col_widths = [110, 130, 70, 110]
+            else:
+                # Usuario normal no necesita ver propietario (es él mismo)
+                data = [['Nombre', 'Ubicación', 'Estado']]
+                for p in peceras:
+                    estado = 'Activo' if p['estado'] == 'activo' else 'Inactivo'
+                    data.append([p['nombre'], p['ubicacion'] or 'N/A', estado])
+                col_widths = [150, 180, 90]
+            
+            table = Table(data, colWidths=col_widths)
+            table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0891b2')),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 10),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+                ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#f0fdfa')),
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#67e8f9')),
+                ('FONTSIZE', (0, 1), (-1, -1), 9),
+                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ]))
+            elements.append(table)
+        
+        if inactivas > 0:
+            alertas.append(f"Hay {inactivas} pecera(s) inactiva(s) que requieren revisión")
+        
+        elements.append(Spacer(1, 20))
+        
+        # ═══════════════════════════════════════════════════════════════
+        # SECCIÓN 2: GRÁFICAS DE TENDENCIAS DE SENSORES
+        # ═══════════════════════════════════════════════════════════════
+        elements.append(Paragraph("📉 2. GRÁFICAS DE TENDENCIAS DE SENSORES", section_style))
+        elements.append(Paragraph("Visualización de datos de los sensores durante el período seleccionado.", normal_style))
+        elements.append(Spacer(1, 10))
+        
+        # Gráficas renderizadas con charts (figura reutilizada + caché de PNG)
+        def crear_grafica(titulo, valores, color, ylabel):
+            png = render_line_chart(valores, titulo, color, ylabel)
+            return io.BytesIO(png) if png else None
+        
+        # Gráfica 1: Temperatura
+        if temp_data and len(temp_data) >= 2:
+            elements.append(Paragraph("Gráfica de Temperatura:", styles['Heading3']))
+            img_temp = crear_grafica("Tendencia de Temperatura", temp_data, '#f59e0b', 'Temperatura (°C)')
+            if img_temp:
+                elements.append(Image(img_temp, width=450, height=180))
+            elements.append(Spacer(1, 10))
+        
+        # Gráfica 2: Humedad
+        if humedad_data and len(humedad_data) >= 2:
+            elements.append(Paragraph("Gráfica de Humedad:", styles['Heading3']))
+            img_hum = crear_grafica("Tendencia de Humedad", humedad_data, '#3b82f6', 'Humedad (%)')
+            if img_hum:
+                elements.append(Image(img_hum, width=450, height=180))
+            elements.append(Spacer(1, 10))
+        
+        # Gráfica 3: Nivel de Agua
+        if nivel_data and len(nivel_data) >= 2:
+            elements.append(Paragraph("Gráfica de Nivel de Agua:", styles['Heading3']))
+            img_nivel = crear_grafica("Tendencia de Nivel de Agua", nivel_data, '#22c55e', 'Nivel (cm)')
+            if img_nivel:
+                elements.append(Image(img_nivel, width=450, height=180))
+            elements.append(Spacer(1, 10))
+        
+        # Gráfica 4: Calidad del Agua
+        if calidad_data and len(calidad_data) >= 2:
+            elements.append(Paragraph("Gráfica de Calidad del Agua:", styles['Heading3']))
+            img_cal = crear_grafica("Tendencia de Calidad del Agua", calidad_data, '#ec4899', 'Calidad')
+            if img_cal:
+                elements.append(Image(img_cal, width=450, height=180))
+            elements.append(Spacer(1, 10))
+        
+        # Mensaje si no hay datos para gráficas
+        if not (temp_data or humedad_data or nivel_data or calidad_data):
+            elements.append(Paragraph("⚠️ No hay suficientes datos para generar gráficas en el período seleccionado.", warning_style))
+        
+        elements.append(Spacer(1, 20))
+        
+        # ═══════════════════════════════════════════════════════════════
+        # SECCIÓN 3: ANÁLISIS ESTADÍSTICO COMPLETO
+        # ═══════════════════════════════════════════════════════════════
+        if es_admin:
+            elements.append(Paragraph("📈 3. ANÁLISIS ESTADÍSTICO COMPLETO (ADMIN)", section_style))
+        else:
+            elements.append(Paragraph("📈 3. ANÁLISIS ESTADÍSTICO DE MIS PECERAS", section_style))
+        
+        # Estadísticas del período desde los rollups (no dependen de la retención cruda)
+        resumen_humedad = query_summary(connection, 'humedad', desde_ts, hasta_ts, mis_peceras)
+        resumen_temp = query_summary(connection, 'temperatura', desde_ts, hasta_ts, mis_peceras)
+        humedad_stats = {
+            'promedio': resumen_humedad['promedio'],
+            'minimo': resumen_humedad['minimo'],
+            'maximo': resumen_humedad['maximo'],
+            'lecturas': max(resumen_humedad['lecturas'], resumen_temp['lecturas']),
+            'temp_promedio': resumen_temp['promedio'],
+            'temp_min': resumen_temp['minimo'],
+            'temp_max': resumen_temp['maximo'],
+        }
+        nivel_stats = query_summary(connection, 'nivel', desde_ts, hasta_ts, mis_peceras)
+        calidad_stats = query_summary(connection, 'calidad', desde_ts, hasta_ts, mis_peceras)
+        
+        # Tabla de estadísticas
+        sensor_data = [['Sensor', 'Promedio', 'Mínimo', 'Máximo', 'Variación', 'Lecturas']]
+        
+        if humedad_stats and humedad_stats['lecturas'] and humedad_stats['lecturas'] > 0:
+            variacion_h = (humedad_stats['maximo'] - humedad_stats['minimo']) if humedad_stats['maximo'] and humedad_stats['minimo'] else 0
+            sensor_data.append([
+                'Humedad',
+                f"{humedad_stats['promedio']:.1f}%" if humedad_stats['promedio'] else 'N/A',
+                f"{humedad_stats['minimo']:.1f}%" if humedad_stats['minimo'] else 'N/A',
+                f"{humedad_stats['maximo']:.1f}%" if humedad_stats['maximo'] else 'N/A',
+                f"±{variacion_h:.1f}%",
+                str(humedad_stats['lecturas'])
+            ])
+            # Agregar temperatura si existe
+            if humedad_stats['temp_promedio']:
+                variacion_t = (humedad_stats['temp_max'] - humedad_stats['temp_min']) if humedad_stats['temp_max'] and humedad_stats['temp_min'] else 0
+                sensor_data.append([
+                    'Temperatura',
+                    f"{humedad_stats['temp_promedio']:.1f}°C" if humedad_stats['temp_promedio'] else 'N/A',
+                    f"{humedad_stats['temp_min']:.1f}°C" if humedad_stats['temp_min'] else 'N/A',
+                    f"{humedad_stats['temp_max']:.1f}°C" if humedad_stats['temp_max'] else 'N/A',
+                    f"±{variacion_t:.1f}°C",
+                    str(humedad_stats['lecturas'])
+                ])
+        
+        if nivel_stats and nivel_stats['lecturas'] and nivel_stats['lecturas'] > 0:
+            variacion_n = (nivel_stats['maximo'] - nivel_stats['minimo']) if nivel_stats['maximo'] and nivel_stats['minimo'] else 0
+            sensor_data.append([
+                'Nivel de Agua',
+                f"{nivel_stats['promedio']:.1f} cm" if nivel_stats['promedio'] else 'N/A',
+                f"{nivel_stats['minimo']:.1f} cm" if nivel_stats['minimo'] else 'N/A',
+                f"{nivel_stats['maximo']:.1f} cm" if nivel_stats['maximo'] else 'N/A',
+                f"±{variacion_n:.1f} cm",
+                str(nivel_stats['lecturas'])
+            ])
+            
+        if calidad_stats and calidad_stats['lecturas'] and calidad_stats['lecturas'] > 0:
+            variacion_c = (calidad_stats['maximo'] - calidad_stats['minimo']) if calidad_stats['maximo'] and calidad_stats['minimo'] else 0
+            sensor_data.append([
+                'Calidad Agua',
+                f"{calidad_stats['promedio']:.1f}" if calidad_stats['promedio'] else 'N/A',
+                f"{calidad_stats['minimo']:.1f}" if calidad_stats['minimo'] else 'N/A',
+                f"{calidad_stats['maximo']:.1f}" if calidad_stats['maximo'] else 'N/A',
+                f"±{variacion_c:.1f}",
+                str(calidad_stats['lecturas'])
+            ])
+        
+        if len(sensor_data) > 1:
+            table2 = Table(sensor_data, colWidths=[90, 70, 70, 70, 70, 60])
+            table2.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0e7490')),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 9),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+                ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#ecfeff')),
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#06b6d4')),
+                ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ]))
+            elements.append(table2)
+        else:
+            elements.append(Paragraph("⚠️ No hay datos de sensores para el período seleccionado.", warning_style))
+            alertas.append("No se registraron lecturas de sensores en el período")
+        
+        elements.append(Spacer(1, 20))
+        
+        # ═══════════════════════════════════════════════════════════════
+        # SECCIÓN 4: MONITOREO DE TEMPERATURA Y NIVEL
+        # ═══════════════════════════════════════════════════════════════
+        elements.append(Paragraph("🌡️ 4. MONITOREO DE TEMPERATURA Y NIVEL", section_style))
+        
+        # Análisis de temperatura
+        elements.append(Paragraph("Análisis de Temperatura:", styles['Heading3']))
+        if humedad_stats and humedad_stats['temp_promedio']:
+            temp_prom = humedad_stats['temp_promedio']
+            if temp_prom < 22:
+                elements.append(Paragraph(f"⚠️ Temperatura promedio BAJA: {temp_prom:.1f}°C (Rango óptimo: 24-28°C)", warning_style))
+                alertas.append(f"Temperatura por debajo del rango óptimo: {temp_prom:.1f}°C")
+                recomendaciones.append("Considerar instalar un calentador de acuario")
+            elif temp_prom > 30:
+                elements.append(Paragraph(f"🔴 Temperatura promedio ALTA: {temp_prom:.1f}°C (Rango óptimo: 24-28°C)", alert_style))
+                alertas.append(f"Temperatura por encima del rango seguro: {temp_prom:.1f}°C")
+                recomendaciones.append("Mejorar ventilación o instalar enfriador")
+            else:
+                elements.append(Paragraph(f"✅ Temperatura promedio ÓPTIMA: {temp_prom:.1f}°C", success_style))
+        else:
+            elements.append(Paragraph("Sin datos de temperatura disponibles", normal_style))
+        
+        elements.append(Spacer(1, 10))
+        
+        # Análisis de nivel de agua
+        elements.append(Paragraph("Análisis de Nivel de Agua:", styles['Heading3']))
+        if nivel_stats and nivel_stats['promedio']:
+            nivel_prom = nivel_stats['promedio']
+            if nivel_prom < 10:
+                elements.append(Paragraph(f"🔴 Nivel de agua CRÍTICO: {nivel_prom:.1f} cm", alert_style))
+                alertas.append(f"Nivel de agua crítico: {nivel_prom:.1f} cm")
+                recomendaciones.append("Rellenar pecera urgentemente")
+            elif nivel_prom < 20:
+                elements.append(Paragraph(f"⚠️ Nivel de agua BAJO: {nivel_prom:.1f} cm", warning_style))
+                alertas.append(f"Nivel de agua bajo: {nivel_prom:.1f} cm")
+                recomendaciones.append("Programar relleno de agua")
+            else:
+                elements.append(Paragraph(f"✅ Nivel de agua ADECUADO: {nivel_prom:.1f} cm", success_style))
+        else:
+            elements.append(Paragraph("Sin datos de nivel de agua disponibles", normal_style))
+        
+        elements.append(Spacer(1, 20))
+        
+        # ═══════════════════════════════════════════════════════════════
+        # SECCIÓN 5: ANÁLISIS DE CALIDAD DEL AGUA
+        # ═══════════════════════════════════════════════════════════════
+        elements.append(Paragraph("💧 5. ANÁLISIS DE CALIDAD DEL AGUA", section_style))
+        
+        if calidad_stats and calidad_stats['promedio']:
+            calidad_prom = calidad_stats['promedio']
+            
+            # Escala de calidad (asumiendo 0-100 o similar)
+            if calidad_prom >= 80:
+                elements.append(Paragraph(f"✅ Calidad del agua EXCELENTE: {calidad_prom:.1f}/100", success_style))
+                elements.append(Paragraph("El agua presenta condiciones óptimas para los peces.", normal_style))
+            elif calidad_prom >= 60:
+                elements.append(Paragraph(f"✅ Calidad del agua BUENA: {calidad_prom:.1f}/100", success_style))
+                elements.append(Paragraph("El agua está en condiciones aceptables.", normal_style))
+            elif calidad_prom >= 40:
+                elements.append(Paragraph(f"⚠️ Calidad del agua REGULAR: {calidad_prom:.1f}/100", warning_style))
+                alertas.append(f"Calidad del agua en nivel regular: {calidad_prom:.1f}")
+                recomendaciones.append("Realizar cambio parcial de agua (25-30%)")
+                elements.append(Paragraph("Se recomienda realizar mantenimiento preventivo.", normal_style))
+            else:
+                elements.append(Paragraph(f"🔴 Calidad del agua DEFICIENTE: {calidad_prom:.1f}/100", alert_style))
+                alertas.append(f"Calidad del agua crítica: {calidad_prom:.1f}")
+                recomendaciones.append("Cambio de agua urgente (50%)")
+                recomendaciones.append("Verificar filtros y sistema de oxigenación")
+                elements.append(Paragraph("¡ATENCIÓN! Se requiere intervención inmediata.", normal_style))
+            
+            elements.append(Spacer(1, 10))
+            
+            # Parámetros detallados
+            elements.append(Paragraph("Parámetros registrados:", styles['Heading3']))
+            params_data = [
+                ['Parámetro', 'Valor', 'Estado'],
+                ['Calidad General', f"{calidad_prom:.1f}", 'Óptimo' if calidad_prom >= 60 else 'Revisar'],
+                ['Lecturas en período', str(calidad_stats['lecturas']), 'OK'],
+                ['Valor máximo', f"{calidad_stats['maximo']:.1f}" if calidad_stats['maximo'] else 'N/A', '-'],
+                ['Valor mínimo', f"{calidad_stats['minimo']:.1f}" if calidad_stats['minimo'] else 'N/A', '-'],
+            ]
+            
+            table3 = Table(params_data, colWidths=[150, 100, 100])
+            table3.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0891b2')),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, -1), 9),
+                ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#f0fdfa')),
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#67e8f9')),
+            ]))
+            elements.append(table3)
+        else:
+            elements.append(Paragraph("⚠️ No hay datos de calidad de agua para el período seleccionado.", warning_style))
+            alertas.append("Sin datos de calidad de agua registrados")
+            recomendaciones.append("Verificar sensor de calidad de agua")
+        
+        elements.append(Spacer(1, 20))
+        
+        # ═══════════════════════════════════════════════════════════════
+        # SECCIÓN 6: HISTÓRICO POR PERÍODO
+        # ═══════════════════════════════════════════════════════════════
+        elements.append(Paragraph("📅 6. HISTÓRICO POR PERÍODO", section_style))
+        
+        # Obtener últimas lecturas - filtradas por peceras del usuario
+        if mis_peceras:
+            cursor.execute(f"""
+                SELECT fecha_hora, humedad, raw as temperatura
+                FROM lecturas_humedad
+                WHERE fecha_hora >= ? AND id_aspersor IN ({placeholders})
+                ORDER BY fecha_hora DESC
+                LIMIT 10
+            """, (fecha_inicio_str, *mis_peceras))
+        else:
+            cursor.execute("""
+                SELECT fecha_hora, humedad, raw as temperatura
+                FROM lecturas_humedad
+                WHERE 1=0
+            """)
+        ultimas_humedad = cursor.fetchall()
+        
+        if ultimas_humedad:
+            elements.append(Paragraph("Últimas 10 lecturas de Humedad/Temperatura:", styles['Heading3']))
+            hist_data = [['Fecha/Hora', 'Humedad', 'Temperatura']]
+            for lectura in ultimas_humedad:
+                fecha = lectura['fecha_hora'] if lectura['fecha_hora'] else 'N/A'
+                hist_data.append([
+                    str(fecha)[:19],
+                    f"{lectura['humedad']:.1f}%" if lectura['humedad'] else 'N/A',
+                    f"{lectura['temperatura']:.1f}°C" if lectura['temperatura'] else 'N/A'
+                ])
+            
+            table4 = Table(hist_data, colWidths=[160, 100, 100])
+            table4.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0e7490')),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, -1), 8),
+                ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#ecfeff')),
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#06b6d4')),
+            ]))
+            elements.append(table4)
+        else:
+            elements.append(Paragraph("No hay registros históricos para el período.", normal_style))
+        
+        elements.append(Spacer(1, 20))
+        
+        # ═══════════════════════════════════════════════════════════════
+        # SECCIÓN 7: ALERTAS Y RECOMENDACIONES
+        # ═══════════════════════════════════════════════════════════════
+        elements.append(Paragraph("⚠️ 7. ALERTAS Y RECOMENDACIONES TÉCNICAS", section_style))
+        
+        if alertas:
+            elements.append(Paragraph("Alertas detectadas:", styles['Heading3']))
+            for i, alerta in enumerate(alertas, 1):
+                elements.append(Paragraph(f"  {i}. 🔔 {alerta}", alert_style))
+        else:
+            elements.append(Paragraph("✅ No se detectaron alertas críticas en el período.", success_style))
+        
+        elements.append(Spacer(1, 10))
+        
+        if recomendaciones:
+            elements.append(Paragraph("Recomendaciones:", styles['Heading3']))
+            for i, rec in enumerate(recomendaciones, 1):
+                elements.append(Paragraph(f"  {i}. 💡 {rec}", normal_style))
+        else:
+            elements.append(Paragraph("✅ Sistema funcionando correctamente. Mantener monitoreo regular.", success_style))
+        
+        elements.append(Spacer(1, 20))
+        
+        # ═══════════════════════════════════════════════════════════════
+        # SECCIÓN 8: DIAGNÓSTICO COMPLETO DEL SISTEMA
+        # ═══════════════════════════════════════════════════════════════
+        if es_admin:
+            elements.append(Paragraph("🔧 8. DIAGNÓSTICO COMPLETO DEL SISTEMA (ADMIN)", section_style))
+        else:
+            elements.append(Paragraph("🔧 8. DIAGNÓSTICO DE MIS PECERAS", section_style))
+        
+        # Calcular puntuación general
+        puntuacion = 100
+        if alertas:
+            puntuacion -= len(alertas) * 15
+        if puntuacion < 0:
+            puntuacion = 0
+        
+        if puntuacion >= 80:
+            estado_general = "EXCELENTE"
+            color_estado = success_style
+        elif puntuacion >= 60:
+            estado_general = "BUENO"
+            color_estado = success_style
+        elif puntuacion >= 40:
+            estado_general = "REGULAR"
+            color_estado = warning_style
+        else:
+            estado_general = "CRÍTICO"
+            color_estado = alert_style
+        
+        elements.append(Paragraph(f"Estado General del Sistema: {estado_general} ({puntuacion}/100 puntos)", color_estado))
+        elements.append(Spacer(1, 10))
+        
+        diag_data = [
+            ['Componente', 'Estado', 'Observaciones'],
+            ['Sensores de Humedad', '✅ Operativo' if humedad_stats and humedad_stats['lecturas'] else '❌ Sin datos', f"{humedad_stats['lecturas'] if humedad_stats else 0} lecturas"],
+            ['Sensor Ultrasónico', '✅ Operativo' if nivel_stats and nivel_stats['lecturas'] else '❌ Sin datos', f"{nivel_stats['lecturas'] if nivel_stats else 0} lecturas"],
+            ['Sensor de Calidad', '✅ Operativo' if calidad_stats and calidad_stats['lecturas'] else '❌ Sin datos', f"{calidad_stats['lecturas'] if calidad_stats else 0} lecturas"],
+            ['Peceras Registradas', '✅ Activas' if activas > 0 else '⚠️ Revisar', f"{activas} de {len(peceras)} activas"],
+            ['Conectividad', '✅ OK', 'Sistema en línea'],
+        ]
+        
+        table5 = Table(diag_data, colWidths=[130, 100, 150])
+        table5.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0891b2')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#f0fdfa')),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#67e8f9')),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ]))
+        elements.append(table5)
+        
+        # ═══════════════════════════════════════════════════════════════
+        # SECCIÓN 9: LISTADO DE USUARIOS (SOLO ADMIN)
+        # ═══════════════════════════════════════════════════════════════
+        if es_admin:
+            elements.append(Spacer(1, 20))
+            elements.append(Paragraph("👥 9. LISTADO DE USUARIOS DEL SISTEMA (ADMIN)", section_style))
+            
+            cursor.execute("""
+                SELECT u.id_usuario, u.nombre, u.correo, u.tipo_usuario, u.fecha_creacion,
+                       (SELECT COUNT(*) FROM aspersores a WHERE a.id_usuario = u.id_usuario) as num_peceras
+                FROM usuarios u
+                ORDER BY u.tipo_usuario DESC, u.nombre ASC
+            """)
+            usuarios = cursor.fetchall()
+            
+            elements.append(Paragraph(f"Total de usuarios registrados: {len(usuarios)}", normal_style))
+            admins = sum(1 for u in usuarios if u['tipo_usuario'] == 'admin')
+            elements.append(Paragraph(f"Administradores: {admins} | Usuarios: {len(usuarios) - admins}", normal_style))
+            elements.append(Spacer(1, 10))
+            
+            if usuarios:
+                users_data = [['Nombre', 'Correo', 'Tipo', 'Peceras', 'Registro']]
+                for u in usuarios:
+                    tipo = '👑 Admin' if u['tipo_usuario'] == 'admin' else '👤 Usuario'
+                    fecha = str(u['fecha_creacion'])[:10] if u['fecha_creacion'] else 'N/A'
+                    users_data.append([
+                        u['nombre'],
+                        u['correo'],
+                        tipo,
+                        str(u['num_peceras']),
+                        fecha
+                    ])
+                
+                table_users = Table(users_data, colWidths=[100, 130, 70, 50, 80])
+                table_users.setStyle(TableStyle([
+                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#7c3aed')),
+                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                    ('FONTSIZE', (0, 0), (-1, -1), 8),
+                    ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#f5f3ff')),
+                    ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#a78bfa')),
+                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                ]))
+                elements.append(table_users)
+        
+        cursor.close()
+        connection.close()
+    
+    elements.append(Spacer(1, 30))
+    
+    # ═══════════════════════════════════════════════════════════════
+    # PIE DE PÁGINA
+    # ═══════════════════════════════════════════════════════════════
+    footer_style = ParagraphStyle(
+        'Footer',
+        parent=styles['Normal'],
+        fontSize=8,
+        textColor=colors.gray,
+        alignment=1
+    )
+    elements.append(Paragraph("─" * 80, footer_style))
+    elements.append(Spacer(1, 5))
+    elements.append(Paragraph("AquaZen - Sistema Inteligente de Monitoreo de Peceras", footer_style))
+    elements.append(Paragraph(f"Reporte generado automáticamente | {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}", footer_style))
+    elements.append(Paragraph("© 2025 AquaZen - Todos los derechos reservados", footer_style))
+    
+    # Construir PDF
+    doc.build(elements)
+    
+    return buffer.getvalue()
+
+
+def write_report_pdf(path, id_usuario, tipo_usuario, nombre_usuario, dias):
+    """Genera el reporte y lo escribe de forma atómica en path. Devuelve el tamaño en bytes."""
+    pdf = build_report_pdf(id_usuario, tipo_usuario, nombre_usuario, dias)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(pdf)
+    os.replace(tmp_path, path)
+    return len(pdf)
@@ -0,0 +1,204 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import metrics
+
+# Motor de retención para las tablas de lecturas.
+# En vez de podar tras cada INSERT, un hilo en segundo plano borra en tramos
+# cada cierto intervalo o cuando se acumulan suficientes inserciones. El corte
+# se decide por fecha_hora (índice idx_<tabla>_fecha) y no por id_lectura: la
+# ingesta por lotes acepta lecturas atrasadas, así que el orden de inserción no
+# es el orden temporal. Cada lectura se borra una sola vez.
+
+PRUNE_SECONDS = metrics.histogram(
+    'aquazen_retention_prune_seconds', 'Duración de la poda por tabla o tarea de retención', ('table',)
+)
+
+
+class RetentionEngine:
+    """Aplica MAX filas (las más nuevas por fecha_hora) y/o TTL por tabla."""
+
+    def __init__(self, connection_factory, tables, max_rows=None, ttl_seconds=None,
+                 interval=30.0, high_water=None, chunk_size=5000, policies=None):
+        self._connection_factory = connection_factory
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self._policies = {}
+        for table in tables:
+            policy = {'max_rows': max_rows, 'ttl_seconds': ttl_seconds}
+            policy.update((policies or {}).get(table, {}))
+            self._policies[table] = policy
+        if high_water is None:
+            high_water = max(1, (max_rows or 1000) // 10)
+        self.high_water = high_water
+        self._pending = {table: 0 for table in self._policies}
+        self._tasks = {}
+        self._prune_hooks = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._stats = {
+            'runs': 0,
+            'deleted': {table: 0 for table in self._policies},
+            'errors': 0,
+            'last_run_ms': 0.0,
+            'last_run_at': None,
+        }
+
+    def start(self):
+        """Arranca el hilo de retención (idempotente)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name='sensor-retention', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop_event.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self._thread = None
+
+    def add_task(self, name, task):
+        """Registra task(connection) -> filas borradas, ejecutada en cada pasada."""
+        self._tasks[name] = task
+        with self._lock:
+            self._stats['deleted'].setdefault(name, 0)
+
+    def add_prune_hook(self, hook):
+        """Registra hook(table, deleted) llamado tras confirmar borrados en una tabla."""
+        self._prune_hooks.append(hook)
+
+    def note_inserts(self, table, count):
+        """Suma inserciones pendientes; despierta al hilo al pasar la marca de agua alta."""
+        if table not in self._pending:
+            return
+        with self._lock:
+            self._pending[table] += count
+            reached = self._pending[table] >= self.high_water
+        if reached:
+            self._wake.set()
+
+    def on_flush(self, cursor, rows_by_table):
+        """Hook para SensorWriteQueue: registra las filas escritas en el lote."""
+        for table, rows in rows_by_table.items():
+            self.note_inserts(table, len(rows))
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data['deleted'] = dict(self._stats['deleted'])
+            data['pending'] = dict(self._pending)
+        data.update({
+            'interval': self.interval,
+            'high_water': self.high_water,
+            'policies': {t: dict(p) for t, p in self._policies.items()},
+            'running': self._thread is not None and self._thread.is_alive(),
+        })
+        return data
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop_event.is_set():
+                break
+            self.run_once()
+
+    def run_once(self):
+        """Ejecuta una pasada de retención sobre todas las tablas. Devuelve filas borradas por tabla."""
+        started = time.perf_counter()
+        deleted = {}
+        connection = self._connection_factory()
+        if not connection:
+            print("Retención: sin conexión a BD")
+            with self._lock:
+                self._stats['errors'] += 1
+            return deleted
+        try:
+            for table, policy in self._policies.items():
+                with self._lock:
+                    self._pending[table] = 0
+                try:
+                    with PRUNE_SECONDS.time(table):
+                        deleted[table] = self._prune_table(connection, table, policy)
+                    if deleted[table]:
+                        for hook in self._prune_hooks:
+                            hook(table, deleted[table])
+                except Exception as e:
+                    connection.rollback()
+                    print(f"Retención: no se pudo podar {table}: {e}")
+                    with self._lock:
+                        self._stats['errors'] += 1
+            for name, task in self._tasks.items():
+                try:
+                    with PRUNE_SECONDS.time(name):
+                        deleted[name] = task(connection)
+                except Exception as e:
+                    connection.rollback()
+                    print(f"Retención: falló la tarea {name}: {e}")
+                    with self._lock:
+                        self._stats['errors'] += 1
+        finally:
+            connection.close()
+        with self._lock:
+            self._stats['runs'] += 1
+            for table, count in deleted.items():
+                self._stats['deleted'][table] += count
+            self._stats['last_run_ms'] = round((time.perf_counter() - started) * 1000, 3)
+            self._stats['last_run_at'] = datetime.now(timezone.utc).isoformat()
+        return deleted
+
+    def _prune_table(self, connection, table, policy):
+        cursor = connection.cursor()
+        try:
+            total = 0
+            ttl_seconds = policy.get('ttl_seconds')
+            if ttl_seconds:
+                limit = (datetime.now(timezone.utc) - timedelta(seconds=ttl_seconds)).strftime('%Y-%m-%d %H:%M:%S')
+                total += self._delete_chunks(connection, cursor, table, "fecha_hora < ?", (limit,))
+
+            max_rows = policy.get('max_rows')
+            if max_rows:
+                cursor.execute(f"SELECT MIN(id_lectura), MAX(id_lectura) FROM {table}")
+                min_id, max_id = cursor.fetchone()
+                # id_lectura es único: si el rango de ids cabe en max_rows no hay de más
+                if max_id is None or max_id - min_id + 1 <= max_rows:
+                    return total
+                # La fila max_rows+1 más nueva por fecha marca el corte (recorre idx_<tabla>_fecha)
+                cursor.execute(
+                    f"SELECT fecha_hora, id_lectura FROM {table} "
+                    f"ORDER BY fecha_hora DESC, id_lectura DESC LIMIT 1 OFFSET ?",
+                    (max_rows,)
+                )
+                row = cursor.fetchone()
+                if row is not None:
+                    total += self._delete_chunks(
+                        connection, cursor, table,
+                        "fecha_hora IS NULL OR fecha_hora < ? OR (fecha_hora = ? AND id_lectura <= ?)",
+                        (row[0], row[0], row[1])
+                    )
+            return total
+        finally:
+            cursor.close()
+
+    def _delete_chunks(self, connection, cursor, table, where, params):
+        """Borra las filas que cumplen where en tramos de chunk_size, confirmando cada tramo."""
+        total = 0
+        while True:
+            # Tramos cortos para no retener el bloqueo de escritura demasiado tiempo
+            cursor.execute(
+                f"DELETE FROM {table} WHERE id_lectura IN "
+                f"(SELECT id_lectura FROM {table} WHERE {where} LIMIT ?)",
+                (*params, self.chunk_size)
+            )
+            deleted = cursor.rowcount
+            connection.commit()
+            total += deleted
+            if deleted < self.chunk_size:
+                return total
@@ -0,0 +1,238 @@
+import calendar
+import time
+
+from db import timed_query
+from ingest_queue import SENSOR_TABLE_COLUMNS
+
+# Rollups incrementales de lecturas (1 minuto / 1 hora / 1 día).
+# Por cada métrica, pecera y bucket se guardan n, mínimo, máximo, suma y último
+# valor. Se actualizan en la misma transacción en que la cola de ingesta escribe
+# las lecturas crudas, así que consultar 30 días cuesta unos cientos de filas en
+# vez de recorrer todas las lecturas (que además la retención ya pudo borrar).
+
+# métrica -> (tabla de lecturas, columna)
+SENSOR_METRICS = {
+    'humedad': ('lecturas_humedad', 'humedad'),
+    'temperatura': ('lecturas_humedad', 'raw'),
+    'nivel': ('lecturas_ultrasonico', 'nivel'),
+    'calidad': ('lecturas_calidad', 'calidad'),
+}
+
+# (segundos por bucket, segundos que se conservan; None = siempre)
+RESOLUTIONS = (
+    (60, 7 * 86400),
+    (3600, 400 * 86400),
+    (86400, None),
+)
+
+ROLLUP_PRUNE_INTERVAL = 600
+
+_UPSERT = """
+    INSERT INTO lecturas_rollup
+        (metrica, resolucion, id_aspersor, bucket, n, minimo, maximo, suma, ultimo, ultimo_ts)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (metrica, resolucion, id_aspersor, bucket) DO UPDATE SET
+        n = n + excluded.n,
+        minimo = MIN(minimo, excluded.minimo),
+        maximo = MAX(maximo, excluded.maximo),
+        suma = suma + excluded.suma,
+        ultimo = CASE WHEN excluded.ultimo_ts >= ultimo_ts THEN excluded.ultimo ELSE ultimo END,
+        ultimo_ts = MAX(ultimo_ts, excluded.ultimo_ts)
+"""
+
+
+def create_rollup_table(cursor):
+    """Crea lecturas_rollup y la rellena con las lecturas crudas existentes."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS lecturas_rollup (
+            metrica TEXT NOT NULL,
+            resolucion INTEGER NOT NULL,
+            id_aspersor INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            n INTEGER NOT NULL,
+            minimo REAL,
+            maximo REAL,
+            suma REAL,
+            ultimo REAL,
+            ultimo_ts INTEGER,
+            PRIMARY KEY (metrica, resolucion, id_aspersor, bucket)
+        ) WITHOUT ROWID
+    """)
+    for metrica, (table, column) in SENSOR_METRICS.items():
+        for resolucion, _ in RESOLUTIONS:
+            # El último valor de cada bucket se toma con una función de ventana
+            cursor.execute(f"""
+                INSERT OR IGNORE INTO lecturas_rollup
+                    (metrica, resolucion, id_aspersor, bucket, n, minimo, maximo, suma, ultimo, ultimo_ts)
+                SELECT ?, ?, id_aspersor, bucket, COUNT(*), MIN(valor), MAX(valor), SUM(valor),
+                       MAX(ultimo), MAX(ts)
+                FROM (
+                    SELECT id_aspersor, valor, ts, (ts / ?) * ? AS bucket,
+                           FIRST_VALUE(valor) OVER (
+                               PARTITION BY id_aspersor, (ts / ?) * ?
+                               ORDER BY ts DESC, id_lectura DESC
+                           ) AS ultimo
+                    FROM (
+                        SELECT id_lectura, id_aspersor, {column} AS valor,
+                               CAST(strftime('%s', fecha_hora) AS INTEGER) AS ts
+                        FROM {table}
+                        WHERE {column} IS NOT NULL AND fecha_hora IS NOT NULL
+                    )
+                )
+                GROUP BY id_aspersor, bucket
+            """, (metrica, resolucion, resolucion, resolucion, resolucion, resolucion))
+
+
+def upsert_rollup_rows(cursor, rows):
+    """Suma filas (métrica, resolución, id_aspersor, bucket, n, mín, máx, suma, último, último_ts) a sus buckets."""
+    with timed_query('rollup_upsert'):
+        cursor.executemany(_UPSERT, rows)
+
+
+def _epoch(fecha_hora, cache):
+    value = cache.get(fecha_hora)
+    if value is None:
+        value = calendar.timegm(time.strptime(fecha_hora, '%Y-%m-%d %H:%M:%S'))
+        cache[fecha_hora] = value
+    return value
+
+
+class RollupAggregator:
+    """Hook de SensorWriteQueue que acumula cada lote en los buckets de rollup."""
+
+    def __init__(self):
+        # tabla -> [(métrica, posición de la columna en la fila del lote)]
+        self._metrics_by_table = {}
+        for metrica, (table, column) in SENSOR_METRICS.items():
+            position = 1 + SENSOR_TABLE_COLUMNS[table].index(column)
+            self._metrics_by_table.setdefault(table, []).append((metrica, position))
+        self._last_prune = 0.0
+
+    def aggregate(self, rows_by_table):
+        """Agrupa filas (id_aspersor, *valores, fecha_hora) en filas listas para el UPSERT."""
+        buckets = {}
+        epochs = {}
+        for table, rows in rows_by_table.items():
+            for metrica, position in self._metrics_by_table.get(table, ()):
+                for row in rows:
+                    valor = row[position]
+                    if valor is None:
+                        continue
+                    ts = _epoch(row[-1], epochs)
+                    for resolucion, _ in RESOLUTIONS:
+                        key = (metrica, resolucion, row[0], ts - ts % resolucion)
+                        agg = buckets.get(key)
+                        if agg is None:
+                            buckets[key] = [1, valor, valor, valor, valor, ts]
+                        else:
+                            agg[0] += 1
+                            if valor < agg[1]:
+                                agg[1] = valor
+                            if valor > agg[2]:
+                                agg[2] = valor
+                            agg[3] += valor
+                            if ts >= agg[5]:
+                                agg[4] = valor
+                                agg[5] = ts
+        return [key + tuple(agg) for key, agg in buckets.items()]
+
+    def on_flush(self, cursor, rows_by_table):
+        rows = self.aggregate(rows_by_table)
+        if rows:
+            upsert_rollup_rows(cursor, rows)
+
+    def prune(self, connection):
+        """Borra buckets fuera de la ventana de cada resolución (como mucho cada ROLLUP_PRUNE_INTERVAL)."""
+        now = time.time()
+        if now - self._last_prune < ROLLUP_PRUNE_INTERVAL:
+            return 0
+        self._last_prune = now
+        deleted = 0
+        cursor = connection.cursor()
+        try:
+            for metrica in SENSOR_METRICS:
+                for resolucion, keep in RESOLUTIONS:
+                    if keep is None:
+                        continue
+                    cursor.execute(
+                        "DELETE FROM lecturas_rollup WHERE metrica = ? AND resolucion = ? AND bucket < ?",
+                        (metrica, resolucion, int(now) - keep)
+                    )
+                    deleted += cursor.rowcount
+            connection.commit()
+        finally:
+            cursor.close()
+        return deleted
+
+
+def choose_resolution(start_ts, end_ts, max_points, now=None):
+    """Resolución menos gruesa cuyo número de buckets entra en max_points y cuya retención cubre el inicio."""
+    now = now or time.time()
+    span = max(end_ts - start_ts, 1)
+    for resolucion, keep in RESOLUTIONS:
+        fits_budget = span / resolucion <= max_points
+        covers_window = keep is None or start_ts >= now - keep
+        if fits_budget and covers_window:
+            return resolucion
+    return RESOLUTIONS[-1][0]
+
+
+def _tank_filter(id_aspersores):
+    if id_aspersores is None:
+        return '', ()
+    return f" AND id_aspersor IN ({','.join('?' * len(id_aspersores))})", tuple(id_aspersores)
+
+
+def query_series(connection, metrica, start_ts, end_ts, id_aspersores=None, max_points=500, resolucion=None):
+    """Serie agregada por bucket (todas las peceras indicadas juntas). Devuelve (resolucion, filas)."""
+    if metrica not in SENSOR_METRICS:
+        raise ValueError(f"Métrica desconocida: {metrica}")
+    if id_aspersores is not None and not id_aspersores:
+        return resolucion or choose_resolution(start_ts, end_ts, max_points), []
+    resolucion = resolucion or choose_resolution(start_ts, end_ts, max_points)
+    tank_sql, tank_params = _tank_filter(id_aspersores)
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT bucket, SUM(n) AS n, MIN(minimo) AS minimo, MAX(maximo) AS maximo,
+                   SUM(suma) / SUM(n) AS promedio
+            FROM lecturas_rollup
+            WHERE metrica = ? AND resolucion = ? AND bucket >= ? AND bucket <= ?{tank_sql}
+            GROUP BY bucket
+            ORDER BY bucket ASC
+        """, (metrica, resolucion, start_ts - start_ts % resolucion, end_ts, *tank_params))
+        rows = [dict(row) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+    return resolucion, rows
+
+
+def query_summary(connection, metrica, start_ts, end_ts, id_aspersores=None):
+    """Promedio, mínimo, máximo y conteo del período con la resolución más fina que lo cubre."""
+    empty = {'promedio': None, 'minimo': None, 'maximo': None, 'lecturas': 0}
+    if id_aspersores is not None and not id_aspersores:
+        return empty
+    resolucion = choose_resolution(start_ts, end_ts, float('inf'))
+    tank_sql, tank_params = _tank_filter(id_aspersores)
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT SUM(suma) / SUM(n) AS promedio, MIN(minimo) AS minimo,
+                   MAX(maximo) AS maximo, COALESCE(SUM(n), 0) AS lecturas
+            FROM lecturas_rollup
+            WHERE metrica = ? AND resolucion = ? AND bucket >= ? AND bucket <= ?{tank_sql}
+        """, (metrica, resolucion, start_ts - start_ts % resolucion, end_ts, *tank_params))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    return dict(row) if row else empty
+
+
+def delete_rollups_for_table(cursor, table):
+    """Elimina los rollups de las métricas que salen de una tabla de lecturas."""
+    metricas = [m for m, (t, _) in SENSOR_METRICS.items() if t == table]
+    if metricas:
+        cursor.execute(
+            f"DELETE FROM lecturas_rollup WHERE metrica IN ({','.join('?' * len(metricas))})",
+            metricas
+        )
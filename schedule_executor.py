@@ -0,0 +1,290 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from command_dispatcher import LatencyHistogram
+from logs import get_logger
+
+# Ejecutor de programaciones_riego.
+# Las programaciones pendientes viven en un heap ordenado por instante de
+# disparo; un hilo duerme hasta el primero (o hasta que llega uno más próximo)
+# y entrega a fire() el comando de inicio y, al cumplirse duracion_minutos, el
+# de fin. La tabla se lee completa solo al arrancar: después cada alta o baja
+# llama a reload(id_programacion), que relee esa fila por clave primaria.
+# Las entradas de una programación modificada o borrada no se sacan del heap:
+# quedan con una generación vieja y se descartan al llegar a la cima.
+# Cada disparo registra su retraso respecto a la hora programada.
+# El inicio deja la bomba encendida sin duración: si una programación se borra,
+# se edita o pierde su pecera dentro de su ventana, el fin se envía en el acto.
+
+log = get_logger('schedules')
+
+ACCION_INICIO = 'inicio'
+ACCION_FIN = 'fin'
+
+# Tope de espera del hilo: también corrige cambios en el reloj del sistema
+MAX_SLEEP = 60.0
+
+# El JOIN descarta programaciones de peceras que ya no existen (filas huérfanas)
+_PROGRAMACION_SQL = """
+    SELECT p.id_programacion, p.id_aspersor, p.hora_inicio, p.duracion_minutos
+    FROM programaciones_riego p
+    JOIN aspersores a ON a.id_aspersor = p.id_aspersor
+"""
+
+
+def parse_hora_inicio(value):
+    """Epoch de hora_inicio (sin zona = hora local del servidor, como la guarda el calendario)."""
+    if isinstance(value, datetime):
+        moment = value
+    else:
+        moment = datetime.fromisoformat(str(value).strip().replace('Z', '+00:00'))
+    return moment.timestamp()
+
+
+class ScheduleExecutor:
+    """Dispara el inicio y el fin de cada programación desde un heap en memoria."""
+
+    def __init__(self, connection_factory, fire, misfire_grace=300.0, history=100):
+        self._connection_factory = connection_factory
+        self._fire = fire                      # fire(accion, programacion) -> dict con id/estado del comando
+        self.misfire_grace = misfire_grace      # segundos de retraso tolerados antes de omitir un disparo
+        self._heap = []
+        self._generations = {}                 # id_programacion -> generación vigente
+        self._programaciones = {}              # id_programacion -> fila vigente
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lag = LatencyHistogram(buckets=(10, 50, 100, 250, 500, 1000, 5000, 30000, 60000, 300000))
+        self._recent = deque(maxlen=history)
+        self._stats = {
+            'loaded': 0,
+            'reloads': 0,
+            'fired': 0,
+            'missed': 0,
+            'cancelled': 0,
+            'errors': 0,
+        }
+
+    def start(self):
+        """Carga las programaciones pendientes y arranca el hilo (idempotente)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+        self.load_all()
+        with self._lock:
+            self._thread = threading.Thread(target=self._run, name='schedule-executor', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop_event.set()
+        with self._wake:
+            self._wake.notify()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def load_all(self):
+        """Reemplaza el heap con todas las programaciones que aún no terminaron."""
+        rows = self._query(_PROGRAMACION_SQL)
+        if rows is None:
+            return
+        with self._wake:
+            self._heap = []
+            self._generations = {}
+            self._programaciones = {}
+            for row in rows:
+                self._schedule(row)
+            self._stats['loaded'] = len(self._programaciones)
+            self._wake.notify()
+        log.info("Programaciones pendientes cargadas", extra={'pending': len(self._programaciones)})
+
+    def reload(self, id_programacion):
+        """Relee una programación tras crearla, editarla o borrarla."""
+        rows = self._query(_PROGRAMACION_SQL + " WHERE p.id_programacion = ?", (id_programacion,))
+        if rows is None:
+            return
+        now = time.time()
+        with self._wake:
+            self._stats['reloads'] += 1
+            active = self._active(id_programacion, now)
+            self._discard(id_programacion)
+            if rows:
+                self._schedule(rows[0])
+            if self._active(id_programacion, now):
+                # La versión editada sigue en curso: su propio fin apagará la bomba
+                active = None
+            self._wake.notify()
+        if active is not None:
+            self._dispatch(ACCION_FIN, active, now)
+
+    def forget_aspersor(self, id_aspersor):
+        """Descarta las programaciones de una pecera eliminada."""
+        now = time.time()
+        active = []
+        with self._wake:
+            for id_programacion, programacion in list(self._programaciones.items()):
+                if programacion['id_aspersor'] == id_aspersor:
+                    if self._active(id_programacion, now):
+                        active.append(programacion)
+                    self._discard(id_programacion)
+        for programacion in active:
+            self._dispatch(ACCION_FIN, programacion, now)
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data['pending'] = len(self._programaciones)
+            data['lag'] = self._lag.snapshot()
+            data['recent'] = list(self._recent)
+            upcoming = self._next_entry()
+        data.update({
+            'running': self.running,
+            'misfire_grace': self.misfire_grace,
+            'next': {
+                'id_programacion': upcoming[3],
+                'accion': upcoming[2],
+                'programada': datetime.fromtimestamp(upcoming[0]).isoformat(timespec='seconds'),
+            } if upcoming else None,
+        })
+        return data
+
+    # --- Heap (con el lock tomado) ---
+
+    def _schedule(self, row):
+        try:
+            start = parse_hora_inicio(row['hora_inicio'])
+            duration = float(row['duracion_minutos']) * 60
+        except (TypeError, ValueError) as e:
+            log.warning("Programación inválida", extra={'id_programacion': row['id_programacion'], 'error': str(e)})
+            return
+        end = start + duration
+        if end + self.misfire_grace < time.time():
+            return
+        id_programacion = row['id_programacion']
+        generation = self._generations.get(id_programacion, 0) + 1
+        self._generations[id_programacion] = generation
+        self._programaciones[id_programacion] = {
+            'id_programacion': id_programacion,
+            'id_aspersor': row['id_aspersor'],
+            'hora_inicio': str(row['hora_inicio']),
+            'duracion_minutos': row['duracion_minutos'],
+            'inicio': start,
+            'fin': end,
+        }
+        heapq.heappush(self._heap, (start, next(self._counter), ACCION_INICIO, id_programacion, generation))
+        heapq.heappush(self._heap, (end, next(self._counter), ACCION_FIN, id_programacion, generation))
+
+    def _active(self, id_programacion, now):
+        """La programación si está dentro de su ventana (inicio <= now < fin), si no None."""
+        programacion = self._programaciones.get(id_programacion)
+        if programacion is not None and programacion['inicio'] <= now < programacion['fin']:
+            return programacion
+        return None
+
+    def _discard(self, id_programacion):
+        if self._programaciones.pop(id_programacion, None) is not None:
+            self._generations[id_programacion] += 1
+
+    def _valid(self, entry):
+        return self._generations.get(entry[3]) == entry[4] and entry[3] in self._programaciones
+
+    def _next_entry(self):
+        while self._heap and not self._valid(self._heap[0]):
+            heapq.heappop(self._heap)
+        return self._heap[0] if self._heap else None
+
+    # --- Hilo ---
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            with self._wake:
+                entry = self._next_entry()
+                now = time.time()
+                if entry is None or entry[0] > now:
+                    timeout = MAX_SLEEP if entry is None else min(entry[0] - now, MAX_SLEEP)
+                    self._wake.wait(timeout)
+                    continue
+                heapq.heappop(self._heap)
+                programacion = self._programaciones[entry[3]]
+                if entry[2] == ACCION_FIN:
+                    self._discard(entry[3])
+            self._dispatch(entry[2], programacion, entry[0])
+
+    def _dispatch(self, accion, programacion, due):
+        lag = time.time() - due
+        record = {
+            'id_programacion': programacion['id_programacion'],
+            'id_aspersor': programacion['id_aspersor'],
+            'accion': accion,
+            'programada': datetime.fromtimestamp(due).isoformat(timespec='seconds'),
+            'lag_ms': round(lag * 1000, 1),
+            'comando': None,
+            'resultado': None,
+        }
+        if lag > self.misfire_grace:
+            # Servidor detenido durante la hora programada: no arrancar bombas tarde
+            record['resultado'] = 'omitido'
+            self._finish(record, 'missed')
+            return
+        if accion == ACCION_INICIO and not self._exists(programacion['id_programacion']):
+            # Borrada sin pasar por reload, o su pecera ya no existe
+            with self._wake:
+                self._discard(programacion['id_programacion'])
+            record['resultado'] = 'cancelado'
+            self._finish(record, 'cancelled')
+            return
+        try:
+            command = self._fire(accion, programacion) or {}
+        except Exception as e:
+            log.error("Error ejecutando programación", extra={
+                'id_programacion': programacion['id_programacion'], 'accion': accion, 'error': str(e)
+            })
+            record['resultado'] = 'error'
+            self._finish(record, 'errors')
+            return
+        record['comando'] = command.get('id')
+        record['resultado'] = command.get('estado')
+        with self._lock:
+            self._lag.observe(max(lag, 0) * 1000)
+        self._finish(record, 'fired')
+        log.info("Programación ejecutada", extra={
+            'id_programacion': programacion['id_programacion'], 'accion': accion, 'lag_ms': record['lag_ms']
+        })
+
+    def _finish(self, record, counter):
+        with self._lock:
+            self._stats[counter] += 1
+            self._recent.append(record)
+
+    def _exists(self, id_programacion):
+        rows = self._query(_PROGRAMACION_SQL + " WHERE p.id_programacion = ?", (id_programacion,))
+        return rows is None or bool(rows)
+
+    def _query(self, sql, params=()):
+        connection = self._connection_factory()
+        if not connection:
+            log.error("Programaciones: sin conexión a BD")
+            return None
+        try:
+            cursor = connection.cursor()
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+        except Exception as e:
+            log.error("Error leyendo programaciones", extra={'error': str(e)})
+            return None
+        finally:
+            connection.close()
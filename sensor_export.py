@@ -0,0 +1,151 @@
+import base64
+import csv
+import io
+import json
+
+from db import timed_query
+
+# Lecturas de todas las tablas unificadas (tipo_sensor, id_aspersor, valor, fecha_hora)
+# para /get_sensor_data y su exportación.
+# El orden es (fecha_hora, id_lectura, tipo_sensor) descendente; el cursor es la
+# última fila entregada, así cada página continúa con un rango por índice en vez
+# de un OFFSET que relee todas las filas anteriores. tipo_sensor desempata las
+# filas de tablas distintas con la misma fecha e id.
+# La exportación recorre el cursor de SQLite por bloques: la memoria no depende
+# de cuántas filas se devuelvan.
+
+# tipo_sensor -> (tabla, columna); 'raw' sale de la misma tabla que 'humedad'
+SENSOR_SOURCES = {
+    'humedad': ('lecturas_humedad', 'humedad'),
+    'raw': ('lecturas_humedad', 'raw'),
+    'nivel': ('lecturas_ultrasonico', 'nivel'),
+    'calidad': ('lecturas_calidad', 'calidad'),
+}
+
+EXPORT_FIELDS = ('id_lectura', 'tipo_sensor', 'id_aspersor', 'valor', 'fecha_hora')
+
+# Filas por página si el cliente no pide otra cosa, y máximo permitido
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+# Filas leídas de SQLite por bloque al exportar
+EXPORT_CHUNK_ROWS = 1000
+
+
+def encode_cursor(row):
+    """Cursor opaco a partir de la última fila de una página."""
+    raw = json.dumps([row['fecha_hora'], row['id_lectura'], row['tipo_sensor']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(value):
+    """(fecha_hora, id_lectura, tipo_sensor) del cursor. ValueError si no es válido."""
+    try:
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+        fecha_hora, id_lectura, tipo_sensor = json.loads(raw)
+    except Exception:
+        raise ValueError("Cursor inválido")
+    if not isinstance(fecha_hora, str) or not isinstance(id_lectura, int) or tipo_sensor not in SENSOR_SOURCES:
+        raise ValueError("Cursor inválido")
+    return fecha_hora, id_lectura, tipo_sensor
+
+
+def _branch(tipo, cursor_key, id_aspersor, limit):
+    table, column = SENSOR_SOURCES[tipo]
+    where = [f"{column} IS NOT NULL"]
+    params = []
+    if id_aspersor is not None:
+        where.append("id_aspersor = ?")
+        params.append(id_aspersor)
+    if cursor_key is not None:
+        fecha_hora, id_lectura, last_tipo = cursor_key
+        # Dentro de una rama tipo_sensor es constante: el desempate se resuelve aquí
+        op = '<=' if tipo < last_tipo else '<'
+        where.append(f"(fecha_hora, id_lectura) {op} (?, ?)")
+        params.extend((fecha_hora, id_lectura))
+    sql = (
+        f"SELECT id_lectura, '{tipo}' AS tipo_sensor, id_aspersor, {column} AS valor, fecha_hora "
+        f"FROM {table} WHERE {' AND '.join(where)}"
+    )
+    if limit is not None:
+        # Cada rama aporta a lo sumo limit filas a la página
+        sql = f"SELECT * FROM ({sql} ORDER BY fecha_hora DESC, id_lectura DESC LIMIT ?)"
+        params.append(limit)
+    return sql, params
+
+
+def build_query(cursor_key=None, id_aspersor=None, tipos=None, limit=None):
+    """SQL y parámetros de las lecturas posteriores a cursor_key en orden descendente."""
+    parts, params = [], []
+    for tipo in tipos or SENSOR_SOURCES:
+        sql, branch_params = _branch(tipo, cursor_key, id_aspersor, limit)
+        parts.append(sql)
+        params.extend(branch_params)
+    sql = "\nUNION ALL\n".join(parts) + "\nORDER BY fecha_hora DESC, id_lectura DESC, tipo_sensor DESC"
+    if limit is not None:
+        sql += "\nLIMIT ?"
+        params.append(limit)
+    return sql, params
+
+
+def parse_tipos(value):
+    """Lista de tipo_sensor separados por coma (None = todos). ValueError si alguno no existe."""
+    if not value:
+        return None
+    tipos = [tipo.strip() for tipo in value.split(',') if tipo.strip()]
+    unknown = [tipo for tipo in tipos if tipo not in SENSOR_SOURCES]
+    if unknown:
+        raise ValueError(f"Tipo de sensor desconocido: {', '.join(unknown)}")
+    return tipos
+
+
+def fetch_page(connection, limit=DEFAULT_PAGE_SIZE, cursor_key=None, id_aspersor=None, tipos=None):
+    """Una página de lecturas y el cursor de la siguiente (None si no hay más)."""
+    # Se pide una fila extra para saber si existe una página siguiente
+    sql, params = build_query(cursor_key, id_aspersor, tipos, limit + 1)
+    cursor = connection.cursor()
+    with timed_query('sensor_page'):
+        cursor.execute(sql, params)
+        rows = [dict(row) for row in cursor.fetchall()]
+    cursor.close()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1])
+    return rows, next_cursor
+
+
+def iter_rows(connection, cursor_key=None, id_aspersor=None, tipos=None, limit=None):
+    """Genera las filas directamente desde el cursor de SQLite, un bloque a la vez."""
+    sql, params = build_query(cursor_key, id_aspersor, tipos, limit)
+    cursor = connection.cursor()
+    try:
+        with timed_query('sensor_export'):
+            cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def ndjson_chunks(blocks):
+    """Una línea JSON por lectura; un bloque de texto por bloque de filas."""
+    for rows in blocks:
+        yield ''.join(json.dumps(dict(row), separators=(',', ':')) + '\n' for row in rows)
+
+
+def csv_chunks(blocks):
+    """CSV con encabezado; un bloque de texto por bloque de filas."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for rows in blocks:
+        writer.writerows(tuple(row[field] for field in EXPORT_FIELDS) for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
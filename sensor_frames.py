@@ -0,0 +1,124 @@
+import struct
+
+# Formato binario compacto para las lecturas del tópico sender.
+# Un nodo que publica en <tópico sender>/bin (AquaZen/sender/bin o
+# AquaZen/<dispositivo>/sender/bin) envía tramas binarias en vez de JSON; el
+# sufijo del tópico es la negociación, así que JSON y binario conviven.
+#
+# Trama (little-endian):
+#     cabecera  <BB   versión (1), cantidad de lecturas
+#     lectura   <BH   tipo de sensor, antigüedad en segundos respecto al envío
+#               + cuerpo de ancho fijo según el tipo (tabla SENSOR_BODIES)
+#
+# Una lectura ocupa 5-9 bytes frente a ~60-150 del JSON equivalente, y varias
+# lecturas viajan en una sola trama (lotes de nodos que estuvieron sin red).
+
+FRAME_VERSION = 1
+BINARY_SUFFIX = 'bin'
+
+HEADER = struct.Struct('<BB')
+MAX_READINGS = 255
+
+# Estados de la máquina del Arduino Mega (obtenerNombreEstado), por índice
+ESTADOS = ('MENU', 'AUTO', 'VACIAR', 'LLENAR', 'RENOV', 'DESC')
+CALIDADES = ('BUENA', 'MALA')
+
+# tipo -> (sensor, formato del cuerpo, campos); los campos siguen SENSOR_FIELDS de latest_store
+SENSOR_BODIES = {
+    1: ('ultrasonico', 'h', ('distancia_cm',)),
+    2: ('liquido', 'fH', ('nivel_pct', 'raw')),
+    3: ('tds', 'fHB', ('ppm', 'raw', 'calidad')),
+    4: ('sistema', 'BBBBB', ('estado', 'bomba6', 'bomba7', 'servo_pos', 'eventos_activos')),
+}
+
+# Campos guardados como índice en la trama (fuera de rango = None)
+_ENUMS = {
+    ('sistema', 'estado'): ESTADOS,
+    ('tds', 'calidad'): CALIDADES,
+}
+
+# Campos float32: se redondean para no exponer el ruido de precisión simple
+_FLOATS = {('liquido', 'nivel_pct'), ('tds', 'ppm')}
+
+
+def _enum_decoder(names):
+    return lambda index: names[index] if index < len(names) else None
+
+
+def _converters(sensor, fields):
+    converters = []
+    for position, field in enumerate(fields):
+        if (sensor, field) in _ENUMS:
+            converters.append((position, _enum_decoder(_ENUMS[sensor, field])))
+        elif (sensor, field) in _FLOATS:
+            converters.append((position, lambda value: round(value, 2)))
+    return tuple(converters)
+
+
+# Structs precompilados (cabecera de lectura + cuerpo en una sola llamada a
+# unpack_from) y conversiones por campo, indexados por el byte de tipo
+_READING_STRUCTS = {
+    code: (sensor, struct.Struct('<BH' + body), fields, _converters(sensor, fields))
+    for code, (sensor, body, fields) in SENSOR_BODIES.items()
+}
+_SENSOR_CODES = {sensor: code for code, (sensor, _, _) in SENSOR_BODIES.items()}
+
+
+class FrameError(ValueError):
+    """Trama binaria mal formada o de una versión no soportada."""
+
+
+def split_binary_topic(topic):
+    """(tópico sin sufijo, True) si el tópico termina en /bin; (topic, False) si no."""
+    prefix, _, leaf = topic.rpartition('/')
+    if prefix and leaf == BINARY_SUFFIX:
+        return prefix, True
+    return topic, False
+
+
+def decode_frame(payload):
+    """Lista de (sensor, valores, antigüedad_s) de una trama. FrameError si es inválida."""
+    if len(payload) < HEADER.size:
+        raise FrameError("Trama demasiado corta")
+    version, count = HEADER.unpack_from(payload, 0)
+    if version != FRAME_VERSION:
+        raise FrameError(f"Versión de trama no soportada: {version}")
+
+    readings = []
+    offset = HEADER.size
+    for _ in range(count):
+        if offset >= len(payload):
+            raise FrameError("Trama truncada")
+        entry = _READING_STRUCTS.get(payload[offset])
+        if entry is None:
+            raise FrameError(f"Tipo de sensor desconocido: {payload[offset]}")
+        sensor, reading_struct, fields, converters = entry
+        if offset + reading_struct.size > len(payload):
+            raise FrameError("Trama truncada")
+        _, age, *raw = reading_struct.unpack_from(payload, offset)
+        offset += reading_struct.size
+        for position, convert in converters:
+            raw[position] = convert(raw[position])
+        readings.append((sensor, dict(zip(fields, raw)), age))
+    if offset != len(payload):
+        raise FrameError("Bytes sobrantes al final de la trama")
+    return readings
+
+
+def encode_frame(readings):
+    """Trama binaria a partir de (sensor, valores, antigüedad_s). Referencia del firmware y pruebas de carga."""
+    if len(readings) > MAX_READINGS:
+        raise FrameError(f"Máximo {MAX_READINGS} lecturas por trama")
+    parts = [HEADER.pack(FRAME_VERSION, len(readings))]
+    for sensor, values, age in readings:
+        code = _SENSOR_CODES[sensor]
+        _, reading_struct, fields, _ = _READING_STRUCTS[code]
+        raw = []
+        for field in fields:
+            value = values[field]
+            names = _ENUMS.get((sensor, field))
+            if names is not None:
+                value = names.index(value) if value in names else 0xFF
+            raw.append(value)
+        parts.append(reading_struct.pack(code, min(int(age), 0xFFFF), *raw))
+    return b''.join(parts)
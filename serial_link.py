@@ -0,0 +1,408 @@
+import json
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+
+from command_dispatcher import (
+    ESTADO_CONFIRMADO,
+    ESTADO_ERROR,
+    ESTADO_EXPIRADO,
+    ESTADO_PENDIENTE,
+    LatencyHistogram,
+)
+from logs import get_logger
+
+# Enlace Serial con el Arduino (control de motores sin MQTT).
+# Un solo hilo de E/S es dueño del puerto: abre y reabre con backoff, escribe los
+# comandos de una cola y lee las respuestas. Las peticiones HTTP solo encolan y,
+# como mucho, esperan unos milisegundos la confirmación; nunca abren el puerto ni
+# duermen esperando el reinicio del Arduino.
+# El Arduino responde una línea por comando ("Modo: MANUAL", "Bomba 1: ENCENDIDA",
+# "Comando ignorado: ...") en el mismo orden en que los recibe, así que cada
+# respuesta confirma al comando más antiguo en vuelo que la espera. Esas líneas,
+# y las líneas JSON con el formato del tópico sender, se publican como lecturas.
+# pyserial se importa en el primer uso: la mayoría de los arranques nunca abren
+# el puerto y así no pagan la importación.
+
+log = get_logger('serial')
+
+ESTADO_RECHAZADO = 'rechazado'
+
+# Estados del enlace
+ENLACE_DETENIDO = 'detenido'
+ENLACE_CONECTANDO = 'conectando'    # puerto abierto esperando el reinicio del Arduino
+ENLACE_LISTO = 'listo'
+ENLACE_DESCONECTADO = 'desconectado'  # esperando el siguiente reintento
+
+# Línea que imprime el Arduino al terminar setup()
+READY_BANNER = 'Sistema Iniciado'
+
+# Comando -> prefijo de la línea con que responde el Arduino (arduino_code.ino)
+_COMMAND_REPLIES = {
+    'MANUAL': 'Modo',
+    'AUTO': 'Modo',
+    'M1': 'Servo',
+    'M2': 'Bomba 1',
+    'M3': 'Bomba 2',
+}
+
+# Respuestas de texto -> campos del sensor 'sistema' (Bomba 1 está en el pin 7, Bomba 2 en el 6)
+_REPLY_VALUES = {
+    'Modo': ('estado', {'MANUAL': 'MANUAL', 'AUTOMATICO': 'AUTO'}),
+    'Servo': ('servo_pos', {'ABIERTO': 90, 'CERRADO': 0}),
+    'Bomba 1': ('bomba7', {'ENCENDIDA': 1, 'APAGADA': 0}),
+    'Bomba 2': ('bomba6', {'ENCENDIDA': 1, 'APAGADA': 0}),
+}
+_REJECTED_PREFIX = 'Comando ignorado'
+
+
+def _serial_module():
+    import serial
+    return serial
+
+
+def reply_key(command):
+    """Prefijo de la respuesta que confirma el comando (None si el firmware no responde)."""
+    return _COMMAND_REPLIES.get(command.split(':', 1)[0].strip().upper())
+
+
+def parse_reply(line):
+    """Interpreta una línea del Arduino.
+
+    Devuelve (tipo, clave, sensor, valores): tipo es 'ack' (respuesta a un
+    comando, clave = su prefijo), 'rechazo' o 'lectura' (JSON con campo sensor);
+    None si la línea no es ninguna.
+    """
+    if line.startswith('{'):
+        try:
+            data = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(data, dict) or not data.get('sensor'):
+            return None
+        sensor = str(data.pop('sensor')).lower()
+        return 'lectura', None, sensor, data
+    if line.startswith(_REJECTED_PREFIX):
+        return 'rechazo', None, None, None
+    key, sep, value = line.partition(':')
+    if not sep or key not in _REPLY_VALUES:
+        return None
+    field, values = _REPLY_VALUES[key]
+    value = value.strip()
+    if value not in values:
+        return None
+    return 'ack', key, 'sistema', {field: values[value]}
+
+
+class SerialTransport:
+    """Cola de comandos hacia el Arduino con un hilo de E/S y reconexión con backoff."""
+
+    def __init__(self, port, baud_rate, on_reading=None, ack_timeout=2.0, ready_timeout=2.5,
+                 max_delay=30.0, max_queue=50, max_commands=200):
+        self.port = port
+        self.baud_rate = baud_rate
+        self.on_reading = on_reading      # on_reading(sensor, valores) desde el hilo de E/S
+        self.ack_timeout = ack_timeout
+        self.ready_timeout = ready_timeout
+        self.max_delay = max_delay
+        self.max_commands = max_commands
+        self._outbox = queue.Queue(maxsize=max_queue)
+        self._in_flight = deque()
+        self._commands = OrderedDict()
+        self._events = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._serial = None
+        self.state = ENLACE_DETENIDO
+        self.last_error = None
+        self._histogram = LatencyHistogram()
+        self._stats = {
+            'submitted': 0,
+            'written': 0,
+            'confirmed': 0,
+            'rejected': 0,
+            'expired': 0,
+            'failed': 0,
+            'readings': 0,
+            'unparsed_lines': 0,
+            'connects': 0,
+            'connect_failures': 0,
+        }
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self.state = ENLACE_CONECTANDO
+        self._thread = threading.Thread(target=self._run, name='serial-io', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        self.state = ENLACE_DETENIDO
+
+    def submit(self, command, wait=0.0):
+        """Encola el comando y espera hasta wait segundos su respuesta. Devuelve su estado.
+
+        Con el enlace caído (entre reintentos) falla al instante en vez de dejar
+        el comando esperando a que vuelva el puerto.
+        """
+        self.start()
+        now = time.monotonic()
+        record = {
+            'id': uuid.uuid4().hex,
+            'comando': command,
+            'estado': ESTADO_PENDIENTE,
+            'creado': datetime.now(timezone.utc).isoformat(),
+            'respuesta': None,
+            'latencia_ms': None,
+            'error': None,
+            '_sent': None,
+            '_reply': reply_key(command),
+            '_deadline': now + self.ack_timeout + self.ready_timeout,
+        }
+        event = threading.Event()
+        with self._lock:
+            self._stats['submitted'] += 1
+            self._remember(record, event)
+
+        if self.state == ENLACE_DESCONECTADO:
+            self._finish(record, ESTADO_ERROR, error=f"Puerto Serial {self.port} no disponible: {self.last_error}")
+        else:
+            try:
+                self._outbox.put_nowait(record)
+            except queue.Full:
+                self._finish(record, ESTADO_ERROR, error="Cola de comandos Serial llena")
+
+        if wait > 0:
+            event.wait(wait)
+        return self.get(record['id'])
+
+    def get(self, command_id):
+        with self._lock:
+            self._sweep()
+            record = self._commands.get(command_id)
+            return self._public(record) if record else None
+
+    def stats(self):
+        with self._lock:
+            self._sweep()
+            data = dict(self._stats)
+            data['pending'] = sum(1 for r in self._commands.values() if r['estado'] == ESTADO_PENDIENTE)
+            data['latency'] = self._histogram.snapshot()
+        data.update({
+            'port': self.port,
+            'baud_rate': self.baud_rate,
+            'state': self.state,
+            'queued': self._outbox.qsize(),
+            'in_flight': len(self._in_flight),
+            'last_error': self.last_error,
+        })
+        return data
+
+    # --- Hilo de E/S ---
+
+    def _run(self):
+        delay = 0.5
+        while not self._stop_event.is_set():
+            try:
+                serial = _serial_module()
+                port = serial.Serial(self.port, self.baud_rate, timeout=0.05, write_timeout=1)
+            except Exception as e:
+                self.last_error = str(e)
+                self.state = ENLACE_DESCONECTADO
+                with self._lock:
+                    self._stats['connect_failures'] += 1
+                    first_failure = self._stats['connect_failures'] == 1
+                if first_failure:
+                    print(f"No se pudo conectar al puerto Serial {self.port}: {e} (reintentando)")
+                self._fail_queued(f"Puerto Serial {self.port} no disponible: {e}")
+                self._stop_event.wait(delay)
+                delay = min(delay * 2, self.max_delay)
+                continue
+
+            delay = 0.5
+            self._serial = port
+            self.state = ENLACE_CONECTANDO
+            self.last_error = None
+            with self._lock:
+                self._stats['connects'] += 1
+            print(f"Conexión Serial establecida en {self.port}")
+            try:
+                self._serve(port)
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Error Serial: {e}")
+            finally:
+                self._serial = None
+                try:
+                    port.close()
+                except Exception:
+                    pass
+            if not self._stop_event.is_set():
+                self.state = ENLACE_DESCONECTADO
+                self._fail_in_flight("Conexión Serial perdida")
+
+    def _serve(self, port):
+        # Abrir el puerto reinicia el Arduino: los comandos esperan en la cola
+        # hasta el mensaje de inicio (o ready_timeout si el firmware no lo imprime)
+        ready_at = time.monotonic() + self.ready_timeout
+        buffer = b''
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            if self.state == ENLACE_CONECTANDO and now >= ready_at:
+                self.state = ENLACE_LISTO
+            if self.state == ENLACE_LISTO:
+                self._write_pending(port)
+            self._expire_in_flight(now)
+
+            chunk = port.read(port.in_waiting or 1)
+            if not chunk:
+                continue
+            buffer += chunk
+            *lines, buffer = buffer.split(b'\n')
+            for raw in lines:
+                line = raw.decode('utf-8', errors='replace').strip()
+                if not line:
+                    continue
+                if line.startswith(READY_BANNER):
+                    self.state = ENLACE_LISTO
+                    continue
+                self._handle_line(line)
+
+    def _write_pending(self, port):
+        while True:
+            try:
+                record = self._outbox.get_nowait()
+            except queue.Empty:
+                return
+            with self._lock:
+                if record['estado'] != ESTADO_PENDIENTE:
+                    continue
+                if time.monotonic() > record['_deadline']:
+                    self._expire(record, "Comando Serial no enviado a tiempo")
+                    continue
+            try:
+                port.write(f"{record['comando']}\n".encode())
+            except Exception as e:
+                self._finish(record, ESTADO_ERROR, error=str(e))
+                raise
+            with self._lock:
+                record['_sent'] = time.monotonic()
+                record['_deadline'] = record['_sent'] + self.ack_timeout
+                self._stats['written'] += 1
+                self._in_flight.append(record)
+            log.debug("Comando Serial enviado: %s", record['comando'])
+
+    def _handle_line(self, line):
+        parsed = parse_reply(line)
+        if parsed is None:
+            with self._lock:
+                self._stats['unparsed_lines'] += 1
+            log.debug("Serial: %s", line)
+            return
+        kind, key, sensor, values = parsed
+        if kind in ('ack', 'rechazo'):
+            record = self._take_in_flight(key)
+            if record is not None:
+                if kind == 'ack':
+                    self._finish(record, ESTADO_CONFIRMADO, respuesta=line)
+                else:
+                    self._finish(record, ESTADO_RECHAZADO, respuesta=line, error=line)
+        if sensor is not None and self.on_reading is not None:
+            with self._lock:
+                self._stats['readings'] += 1
+            try:
+                self.on_reading(sensor, values)
+            except Exception as e:
+                print(f"Serial: error procesando lectura {line}: {e}")
+
+    def _take_in_flight(self, key):
+        """Saca el comando más antiguo en vuelo que responde con esa clave.
+
+        Los rechazos no dicen a qué comando responden: solo se rechazan los de
+        motores (el cambio de modo siempre se acepta).
+        """
+        for record in self._in_flight:
+            if (record['_reply'] == key) if key is not None else (record['_reply'] not in (None, 'Modo')):
+                self._in_flight.remove(record)
+                return record
+        return None
+
+    def _expire_in_flight(self, now):
+        # Los comandos sin respuesta (desconocidos para el firmware) salen al vencer su plazo
+        while self._in_flight and now > self._in_flight[0]['_deadline']:
+            record = self._in_flight.popleft()
+            with self._lock:
+                self._expire(record, f"Sin respuesta del Arduino en {self.ack_timeout:g} s")
+
+    def _fail_queued(self, error):
+        while True:
+            try:
+                record = self._outbox.get_nowait()
+            except queue.Empty:
+                return
+            self._finish(record, ESTADO_ERROR, error=error)
+
+    def _fail_in_flight(self, error):
+        while self._in_flight:
+            self._finish(self._in_flight.popleft(), ESTADO_ERROR, error=error)
+
+    # --- Registro de comandos ---
+
+    def _finish(self, record, estado, respuesta=None, error=None):
+        with self._lock:
+            if record['estado'] != ESTADO_PENDIENTE:
+                return
+            record['estado'] = estado
+            record['respuesta'] = respuesta
+            record['error'] = error
+            if record['_sent'] is not None:
+                record['latencia_ms'] = round((time.monotonic() - record['_sent']) * 1000, 3)
+            if estado == ESTADO_CONFIRMADO:
+                self._stats['confirmed'] += 1
+                self._histogram.observe(record['latencia_ms'])
+            elif estado == ESTADO_RECHAZADO:
+                self._stats['rejected'] += 1
+            else:
+                self._stats['failed'] += 1
+            event = self._events.pop(record['id'], None)
+        if estado == ESTADO_ERROR:
+            print(f"Error Serial ({record['comando']}): {error}")
+        if event is not None:
+            event.set()
+
+    def _expire(self, record, error):
+        """Marca el comando como expirado (con el lock tomado)."""
+        if record['estado'] != ESTADO_PENDIENTE:
+            return
+        record['estado'] = ESTADO_EXPIRADO
+        record['error'] = error
+        self._stats['expired'] += 1
+        event = self._events.pop(record['id'], None)
+        if event is not None:
+            event.set()
+
+    def _remember(self, record, event):
+        self._commands[record['id']] = record
+        self._events[record['id']] = event
+        while len(self._commands) > self.max_commands:
+            _, old = self._commands.popitem(last=False)
+            self._events.pop(old['id'], None)
+
+    def _sweep(self, now=None):
+        """Expira los pendientes cuyo plazo ya pasó aunque el hilo de E/S esté bloqueado (con el lock tomado)."""
+        now = now or time.monotonic()
+        for record in self._commands.values():
+            if record['estado'] == ESTADO_PENDIENTE and now > record['_deadline']:
+                self._expire(record, "Sin respuesta del Arduino a tiempo")
+
+    @staticmethod
+    def _public(record):
+        return {k: v for k, v in record.items() if not k.startswith('_')}
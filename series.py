@@ -0,0 +1,126 @@
+from datetime import datetime, timezone
+
+import numpy as np
+
+from db import timed_query
+from downsample import lttb
+from ingest_queue import db_timestamp
+from rollups import SENSOR_METRICS, choose_resolution
+
+# Series históricas de sensores con tamaño acotado para /api/v2/series/<sensor>.
+# Si el rango tiene pocas lecturas crudas se usan tal cual; si no, se parte de
+# los rollups. En ambos casos LTTB reduce el resultado a max_points.
+
+# Nombre público del sensor (igual que /sensor_data/<sensor>) -> métrica de rollup
+SERIES_SENSORS = {
+    'humedad': 'humedad',
+    'temperatura': 'temperatura',
+    'ultrasonico': 'nivel',
+    'calidad': 'calidad',
+}
+
+# Lecturas crudas por punto pedido a partir de las cuales se usan rollups
+RAW_POINTS_FACTOR = 20
+RAW_POINTS_CAP = 50000
+
+
+def _tank_sql(id_aspersor):
+    if id_aspersor is None:
+        return '', ()
+    return ' AND id_aspersor = ?', (id_aspersor,)
+
+
+def _db_time(ts):
+    return db_timestamp(datetime.fromtimestamp(ts, timezone.utc))
+
+
+def _raw_series(connection, table, column, start_ts, end_ts, id_aspersor, limit):
+    """Lecturas crudas del rango, o None si la retención ya borró el inicio o superan limit."""
+    tank_sql, tank_params = _tank_sql(id_aspersor)
+    params = (_db_time(start_ts), _db_time(end_ts), *tank_params)
+    cursor = connection.cursor()
+    try:
+        # MIN(fecha_hora) se resuelve con el índice idx_<tabla>_fecha
+        cursor.execute(f"SELECT MIN(fecha_hora) FROM {table}")
+        oldest = cursor.fetchone()[0]
+        if oldest is None or oldest > params[0]:
+            return None
+        with timed_query('series_raw'):
+            cursor.execute(f"""
+                SELECT CAST(strftime('%s', fecha_hora) AS INTEGER), {column}
+                FROM {table}
+                WHERE fecha_hora >= ? AND fecha_hora <= ? AND {column} IS NOT NULL{tank_sql}
+                ORDER BY fecha_hora ASC, id_lectura ASC
+                LIMIT ?
+            """, (*params, limit + 1))
+            rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    if len(rows) > limit:
+        return None
+    t = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    v = np.fromiter((r[1] for r in rows), dtype=np.float64, count=len(rows))
+    return t, v
+
+
+def _rollup_series(connection, metrica, start_ts, end_ts, id_aspersor, max_points):
+    # Resolución más fina que la pedida para que LTTB tenga de dónde elegir
+    resolucion = choose_resolution(start_ts, end_ts, max_points * 4)
+    tank_sql, tank_params = _tank_sql(id_aspersor)
+    cursor = connection.cursor()
+    try:
+        with timed_query('series_rollup'):
+            cursor.execute(f"""
+                SELECT bucket, SUM(suma) / SUM(n), MIN(minimo), MAX(maximo)
+                FROM lecturas_rollup
+                WHERE metrica = ? AND resolucion = ? AND bucket >= ? AND bucket <= ?{tank_sql}
+                GROUP BY bucket
+                ORDER BY bucket ASC
+            """, (metrica, resolucion, start_ts - start_ts % resolucion, end_ts, *tank_params))
+            rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    data = np.array(rows, dtype=np.float64).reshape(-1, 4)
+    return resolucion, data[:, 0].astype(np.int64), data[:, 1], data[:, 2], data[:, 3]
+
+
+def load_series(connection, sensor, start_ts, end_ts, id_aspersor=None, max_points=500):
+    """Serie reducida a max_points que conserva los picos. Devuelve un dict serializable."""
+    metrica = SERIES_SENSORS[sensor]
+    table, column = SENSOR_METRICS[metrica]
+    raw_limit = min(max_points * RAW_POINTS_FACTOR, RAW_POINTS_CAP)
+
+    result = {
+        'sensor': sensor,
+        'from': int(start_ts),
+        'to': int(end_ts),
+        'id_aspersor': id_aspersor,
+        'max_points': max_points,
+    }
+
+    raw = _raw_series(connection, table, column, start_ts, end_ts, id_aspersor, raw_limit)
+    if raw is not None:
+        t, v = raw
+        keep = lttb(t, v, max_points)
+        result.update({
+            'source': 'raw',
+            'resolution': None,
+            'count': int(len(t)),
+            'points': [[int(ts), float(val)] for ts, val in zip(t[keep], v[keep])],
+        })
+        return result
+
+    resolucion, t, avg, minimo, maximo = _rollup_series(
+        connection, metrica, start_ts, end_ts, id_aspersor, max_points
+    )
+    keep = lttb(t, avg, max_points)
+    result.update({
+        'source': 'rollup',
+        'resolution': resolucion,
+        'count': int(len(t)),
+        'points': [[int(ts), float(val)] for ts, val in zip(t[keep], avg[keep])],
+        # Envolvente de cada bucket elegido: los extremos no se pierden al promediar
+        'min': [float(val) for val in minimo[keep]],
+        'max': [float(val) for val in maximo[keep]],
+    })
+    return result
@@ -0,0 +1,59 @@
+// Suscripción a /stream/sensors (Server-Sent Events).
+// Mantiene una copia local del último estado con la misma forma que
+// /get_latest_sensor_data y llama a onState en cada actualización.
+// Si el navegador no soporta EventSource vuelve al polling clásico.
+// Con options.idAspersor solo se reciben las lecturas de esa pecera.
+(function (window) {
+    'use strict';
+
+    const SENSORS = ['ultrasonico', 'liquido', 'tds', 'sistema'];
+
+    function subscribe(onState, options) {
+        const opts = Object.assign({ fallbackMs: 5000, onEvent: null, idAspersor: null }, options || {});
+        const query = opts.idAspersor ? `?id_aspersor=${encodeURIComponent(opts.idAspersor)}` : '';
+        let state = null;
+
+        function poll() {
+            fetch(`/get_latest_sensor_data${query}`)
+                .then((res) => res.json())
+                .then((data) => {
+                    state = data;
+                    onState(state);
+                })
+                .catch((err) => console.error('Error leyendo sensores:', err));
+        }
+
+        if (!window.EventSource) {
+            poll();
+            const timer = setInterval(poll, opts.fallbackMs);
+            return { close: () => clearInterval(timer) };
+        }
+
+        const source = new EventSource(`/stream/sensors${query}`);
+        source.addEventListener('snapshot', (event) => {
+            state = JSON.parse(event.data);
+            onState(state);
+        });
+        SENSORS.forEach((sensor) => {
+            source.addEventListener(sensor, (event) => {
+                const update = JSON.parse(event.data);
+                state = state || {};
+                state[sensor] = update.data;
+                state.timestamp = update.timestamp;
+                state.id_aspersor = update.id_aspersor;
+                state.version = update.version;
+                if (sensor !== 'sistema') {
+                    state.has_data = true;
+                }
+                onState(state, sensor);
+                if (opts.onEvent) {
+                    opts.onEvent(sensor, update);
+                }
+            });
+        });
+        // 'dropped' = el servidor nos desconectó por lentos; EventSource reconecta solo
+        return source;
+    }
+
+    window.AquaZenSensorStream = { subscribe };
+})(window);
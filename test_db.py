@@ -1,62 +1,34 @@
-import sqlite3
-from datetime import datetime, timedelta
-import random
+from db import open_connection
+from config import DATABASE
 
-# Conectar a la base de datos
-conn = sqlite3.connect('database.db')
+# Revisión rápida de la base: tablas, columnas de lecturas y volumen de datos.
+# Para generar datos de prueba usar populate_db.py.
+
+conn = open_connection(DATABASE, row_factory=None)
 cursor = conn.cursor()
 
 # Ver las tablas existentes
-cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-tablas = cursor.fetchall()
+cursor.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")
+tablas = [fila[0] for fila in cursor.fetchall()]
 print('Tablas existentes:')
 for tabla in tablas:
-    print(f'- {tabla[0]}')
-
-# Ver estructura de una tabla
-print('\nEstructura de lecturas_humedad:')
-try:
-    cursor.execute('PRAGMA table_info(lecturas_humedad)')
-    columnas = cursor.fetchall()
-    for col in columnas:
+    print(f'- {tabla}')
+
+for tabla in ('lecturas_humedad', 'lecturas_ultrasonico', 'lecturas_calidad'):
+    if tabla not in tablas:
+        print(f'\n{tabla}: no existe')
+        continue
+    print(f'\nEstructura de {tabla}:')
+    cursor.execute(f'PRAGMA table_info({tabla})')
+    for col in cursor.fetchall():
         print(f'- {col[1]} ({col[2]})')
-except:
-    print('Tabla no existe')
-
-# Generar datos de ejemplo para las últimas 2 semanas
-end_date = datetime.now()
-start_date = end_date - timedelta(days=14)
-current = start_date
-
-print('\nGenerando datos de ejemplo...')
-
-try:
-    while current <= end_date:
-        # Datos de humedad (40-70%)
-        humedad = round(random.uniform(45, 65), 1)
-        cursor.execute('INSERT INTO lecturas_humedad (valor, timestamp) VALUES (?, ?)', 
-                       (humedad, current.isoformat()))
-        
-        # Datos de temperatura (22-28°C)
-        temperatura = round(random.uniform(23, 27), 1)
-        cursor.execute('INSERT INTO lecturas_temperatura (valor, timestamp) VALUES (?, ?)', 
-                       (temperatura, current.isoformat()))
-        
-        # Datos del ultrasónico (15-25cm)
-        distancia = round(random.uniform(16, 24), 1)
-        cursor.execute('INSERT INTO lecturas_ultrasonico (distance_cm, timestamp) VALUES (?, ?)', 
-                       (distancia, current.isoformat()))
-        
-        # Datos de calidad (6.5-8.0 pH)
-        ph = round(random.uniform(6.8, 7.8), 1)
-        cursor.execute('INSERT INTO lecturas_calidad (valor, timestamp) VALUES (?, ?)', 
-                       (ph, current.isoformat()))
-        
-        current += timedelta(hours=2)
+    cursor.execute(f'SELECT COUNT(*), MIN(fecha_hora), MAX(fecha_hora) FROM {tabla}')
+    total, desde, hasta = cursor.fetchone()
+    print(f'  {total} lecturas ({desde} -> {hasta})')
 
-    conn.commit()
-    print('Datos de ejemplo generados exitosamente!')
-except Exception as e:
-    print(f'Error: {e}')
+for tabla in ('usuarios', 'aspersores', 'programaciones_riego'):
+    if tabla in tablas:
+        cursor.execute(f'SELECT COUNT(*) FROM {tabla}')
+        print(f'\n{tabla}: {cursor.fetchone()[0]} filas')
 
-conn.close()
\ No newline at end of file
+conn.close()
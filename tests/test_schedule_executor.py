@@ -0,0 +1,83 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schedule_executor import ACCION_FIN, ACCION_INICIO, ScheduleExecutor
+
+
+class ScheduleExecutorActiveWindowTest(unittest.TestCase):
+    """Borrar una programación o su pecera con la bomba encendida envía el fin."""
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        connection = self._connect()
+        connection.executescript("""
+            CREATE TABLE aspersores (id_aspersor INTEGER PRIMARY KEY);
+            CREATE TABLE programaciones_riego (
+                id_programacion INTEGER PRIMARY KEY,
+                id_aspersor INTEGER,
+                hora_inicio TEXT,
+                duracion_minutos INTEGER
+            );
+            INSERT INTO aspersores (id_aspersor) VALUES (1);
+        """)
+        # Empezó hace un minuto y dura diez: está en curso
+        inicio = datetime.fromtimestamp(time.time() - 60).isoformat(timespec='seconds')
+        connection.execute(
+            "INSERT INTO programaciones_riego VALUES (1, 1, ?, 10)", (inicio,)
+        )
+        connection.commit()
+        connection.close()
+        self.fired = []
+        self.executor = ScheduleExecutor(self._connect, self._fire, misfire_grace=300.0)
+        self.executor.load_all()
+        # Simula el inicio ya disparado por el hilo
+        with self.executor._wake:
+            entry = self.executor._next_entry()
+        self.assertEqual(entry[2], ACCION_INICIO)
+        self.executor._dispatch(ACCION_INICIO, self.executor._programaciones[1], entry[0])
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def _fire(self, accion, programacion):
+        self.fired.append((accion, programacion['id_programacion']))
+        return {'id': str(len(self.fired)), 'estado': 'pendiente'}
+
+    def _delete_row(self):
+        connection = self._connect()
+        connection.execute("DELETE FROM programaciones_riego WHERE id_programacion = 1")
+        connection.commit()
+        connection.close()
+
+    def test_reload_after_delete_sends_fin(self):
+        self._delete_row()
+        self.executor.reload(1)
+        self.assertEqual(self.fired, [(ACCION_INICIO, 1), (ACCION_FIN, 1)])
+        self.assertEqual(self.executor.stats()['pending'], 0)
+
+    def test_forget_aspersor_sends_fin(self):
+        self.executor.forget_aspersor(1)
+        self.assertEqual(self.fired, [(ACCION_INICIO, 1), (ACCION_FIN, 1)])
+        self.assertIsNone(self.executor.stats()['next'])
+
+    def test_reload_unchanged_keeps_pending_fin(self):
+        self.executor.reload(1)
+        self.assertEqual(self.fired, [(ACCION_INICIO, 1)])
+        self.assertEqual(self.executor.stats()['pending'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()